@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+import anyio
+
+from app.metrics import Histogram, agent_latency, register, timed
+
+AGENT_APP_NAME = "f1-ergast-agent"
+AGENT_MAX_SESSIONS = int(os.getenv("AGENT_MAX_SESSIONS", "1000"))
+AGENT_SESSION_TTL = float(os.getenv("AGENT_SESSION_TTL", "1800"))
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "8"))
+AGENT_QUEUE_TIMEOUT = float(os.getenv("AGENT_QUEUE_TIMEOUT", "10"))
+AGENT_WARMUP = os.getenv("AGENT_WARMUP", "1") != "0"  #0 = build the runner on the first /ask_agent call
+
+
+agent_queue_wait = register(Histogram("agent_queue_wait_seconds", "Wait for a free agent slot", ("outcome",)))
+
+
+class AgentBusy(Exception):
+    """no agent slot freed up within AGENT_QUEUE_TIMEOUT"""
+
+
+class AgentPool:
+    """
+    One long-lived ADK Runner with a bounded, TTL-evicted set of conversation sessions
+    keyed by the client's session id, and a cap on in-flight agent calls.
+    """
+
+    def __init__(self, agent_factory: Callable[[], Any]):
+        self.agent_factory = agent_factory
+        self._runner = None
+        self._sessions: "OrderedDict[str, float]" = OrderedDict()  #client session id -> expiry
+        self._lock = asyncio.Lock()
+        self._slots = asyncio.Semaphore(AGENT_MAX_CONCURRENCY)
+        self._build_lock = threading.Lock()
+
+    def runner(self):
+        if self._runner is None:
+            with self._build_lock:  #warm-up thread and a first request may race here
+                if self._runner is None:
+                    from google.adk.runners import Runner
+                    from google.adk.sessions import InMemorySessionService
+                    self._runner = Runner(agent=self.agent_factory(), app_name=AGENT_APP_NAME,
+                                          session_service=InMemorySessionService())
+        return self._runner
+
+    async def warm_up(self) -> None:
+        """builds the runner (and imports the agent stack) in a thread so the event loop keeps serving"""
+        try:
+            await anyio.to_thread.run_sync(self.runner)
+        except Exception:  #the first /ask_agent call retries and surfaces the error
+            logging.getLogger(__name__).exception("agent warm-up failed")
+
+    async def _session(self, session_id: str) -> None:
+        service = self.runner().session_service
+        async with self._lock:
+            now = time.monotonic()
+            expired = [sid for sid, expires in self._sessions.items() if expires < now]
+            while len(self._sessions) - len(expired) >= AGENT_MAX_SESSIONS and session_id not in self._sessions:
+                oldest = next(sid for sid in self._sessions if sid not in expired)
+                expired.append(oldest)
+            for sid in expired:
+                del self._sessions[sid]
+                await service.delete_session(app_name=AGENT_APP_NAME, user_id=sid, session_id=sid)
+            if session_id not in self._sessions:
+                await service.create_session(app_name=AGENT_APP_NAME, user_id=session_id, session_id=session_id)
+            self._sessions[session_id] = now + AGENT_SESSION_TTL
+            self._sessions.move_to_end(session_id)
+
+    async def ask(self, session_id: str, text: str) -> str:
+        from google.genai import types
+
+        try:
+            with timed(agent_queue_wait, "ok"):
+                await asyncio.wait_for(self._slots.acquire(), AGENT_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise AgentBusy()
+        try:
+            await self._session(session_id)
+            message = types.Content(role="user", parts=[types.Part(text=text)])
+            answer: Optional[str] = None
+            with timed(agent_latency, "adk_runner", "ok"):
+                async for event in self.runner().run_async(user_id=session_id, session_id=session_id,
+                                                           new_message=message):
+                    if event.is_final_response() and event.content and event.content.parts:
+                        answer = "".join(part.text or "" for part in event.content.parts)
+            return answer or ""
+        finally:
+            self._slots.release()
@@ -0,0 +1,260 @@
+"""
+Cross-season analytics over the columnar store (app/columnar.py). Every aggregate is computed
+with sorts, bincounts and reduceat over the concatenated season arrays, no per-row Python.
+"""
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Query
+
+from app.columnar import SCHEMA, TABLES, constructor_codes, driver_codes, ingest, load_table, np, stored
+
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+CODES = {"driver": driver_codes, "constructor": constructor_codes}
+
+
+def _concat(table: str, seasons) -> Tuple[Dict[str, "np.ndarray"], List[int]]:
+    """one table over several seasons plus a season column, and the seasons that were stored"""
+    parts, used = [], []
+    for season in seasons:
+        arrays = load_table(season, table)
+        if arrays is not None and len(arrays["round"]):
+            parts.append(arrays)
+            used.append(season)
+    columns = {name: np.concatenate([p[name] for p in parts]) if parts else np.empty(0, dtype)
+               for name, dtype in SCHEMA[table].items()}
+    columns["season"] = np.repeat(np.asarray(used, dtype=np.int16), [len(p["round"]) for p in parts])
+    return columns, used
+
+
+def _key(season, round_, driver, lap=0) -> "np.ndarray":
+    """one int64 per (season, round, driver, lap), for joins and membership tests"""
+    return ((season.astype(np.int64) * 100 + round_) << 32) | (driver.astype(np.int64) << 12) | lap
+
+
+def _groups(keys: "np.ndarray", values: Optional["np.ndarray"] = None):
+    """order sorting by key (then value), the distinct keys, their start offsets and sizes"""
+    order = np.lexsort((values, keys)) if values is not None else np.argsort(keys, kind="stable")
+    unique, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+    return order, unique, starts, counts
+
+
+def _median(sorted_values: "np.ndarray", starts: "np.ndarray", counts: "np.ndarray") -> "np.ndarray":
+    return (sorted_values[starts + (counts - 1) // 2] + sorted_values[starts + counts // 2]) / 2
+
+
+def lap_pace(seasons, drivers: Optional[List[str]] = None, per_season: bool = False, clean: bool = True,
+             top: int = 20) -> Dict:
+    """
+    Lap time statistics per driver. pace_pct compares every lap with the median lap of its race,
+    so averages over different circuits and seasons stay comparable. clean drops lap 1 and the
+    in and out laps of pit stops.
+    """
+    laps, used = _concat("laps", seasons)
+    keep = laps["millis"] > 0
+    if clean:
+        pits, _ = _concat("pitstops", seasons)
+        stops = _key(pits["season"], pits["round"], pits["driver"], pits["lap"])
+        keep &= (laps["lap"] > 1) \
+            & ~np.isin(_key(laps["season"], laps["round"], laps["driver"], laps["lap"]), stops) \
+            & ~np.isin(_key(laps["season"], laps["round"], laps["driver"], laps["lap"] - 1), stops)
+    laps = {name: values[keep] for name, values in laps.items()}
+    millis = laps["millis"].astype(np.float64)
+
+    race = laps["season"].astype(np.int32) * 100 + laps["round"]
+    order, _, starts, counts = _groups(race, millis)
+    race_median = np.empty_like(millis)
+    race_median[order] = np.repeat(_median(millis[order], starts, counts), counts)
+    ratio = millis / race_median
+
+    selected = np.ones(len(millis), dtype=bool)
+    if drivers:
+        selected = np.isin(laps["driver"], driver_codes.lookup(drivers))
+    group = laps["driver"].astype(np.int64)
+    if per_season:
+        group = (laps["season"].astype(np.int64) << 32) | group
+    order, keys, starts, counts = _groups(group[selected], millis[selected])
+    by_time = millis[selected][order]
+    pace = (np.add.reduceat(ratio[selected][order], starts) / counts - 1) * 100 if len(keys) else np.empty(0)
+    mean = np.add.reduceat(by_time, starts) / counts if len(keys) else np.empty(0)
+    median = _median(by_time, starts, counts)
+    best = by_time[starts]
+
+    rank = np.argsort(pace, kind="stable")[:top]
+    names = driver_codes.decode((keys[rank] & 0xFFFFFFFF).tolist())
+    rows = []
+    for i, name in zip(rank.tolist(), names):
+        row = {"driverId": name, "laps": int(counts[i]), "mean_ms": round(float(mean[i]), 1),
+               "median_ms": round(float(median[i]), 1), "best_ms": int(best[i]), "pace_pct": round(float(pace[i]), 3)}
+        if per_season:
+            row = {"season": int(keys[i] >> 32), **row}
+        rows.append(row)
+    return {"seasons": used, "laps": int(len(millis)), "drivers": rows}
+
+
+def pitstop_distribution(seasons, group_by: str = "season", bins: int = 20, max_ms: int = 60000) -> Dict:
+    """
+    Pit stop duration percentiles and a histogram per season, constructor, driver or overall.
+    Stops longer than max_ms (red flag stoppages) are left out.
+    """
+    pits, used = _concat("pitstops", seasons)
+    duration = pits["duration_ms"]
+    keep = (duration > 0) & (duration <= max_ms)
+    if group_by == "constructor":
+        #constructor of each stop from the race result of the same (season, round, driver)
+        results, _ = _concat("results", seasons)
+        race = results["sprint"] == 0
+        result_keys = _key(results["season"][race], results["round"][race], results["driver"][race])
+        order = np.argsort(result_keys)
+        result_keys = result_keys[order]
+        stop_keys = _key(pits["season"], pits["round"], pits["driver"])
+        at = np.minimum(np.searchsorted(result_keys, stop_keys), max(len(result_keys) - 1, 0))
+        found = result_keys[at] == stop_keys if len(result_keys) else np.zeros(len(stop_keys), dtype=bool)
+        keep &= found
+        group = results["constructor"][race][order][at] if len(result_keys) else np.zeros(len(stop_keys), dtype=np.int32)
+    elif group_by == "all":
+        group = np.zeros(len(duration), dtype=np.int32)
+    else:
+        group = pits[group_by]
+    duration, group = duration[keep].astype(np.float64), group[keep]
+    if not len(duration):
+        return {"seasons": used, "group_by": group_by, "edges_ms": [], "groups": []}
+
+    edges = np.linspace(duration.min(), duration.max(), bins + 1)
+    bin_of = np.clip(np.searchsorted(edges, duration, side="right") - 1, 0, bins - 1)
+    order, keys, starts, counts = _groups(group, duration)
+    sorted_duration = duration[order]
+    histogram = np.bincount(np.repeat(np.arange(len(keys)), counts) * bins + bin_of[order],
+                            minlength=len(keys) * bins).reshape(len(keys), bins)
+    quantiles = {q: sorted_duration[starts + np.floor(q * (counts - 1)).astype(np.int64)] for q in QUANTILES}
+    mean = np.add.reduceat(sorted_duration, starts) / counts
+
+    labels = keys.tolist() if group_by in ("season", "all") else CODES[group_by].decode(keys.tolist())
+    label_key = {"season": "season", "driver": "driverId", "constructor": "constructorId"}.get(group_by)
+    groups = []
+    for i, label in enumerate(labels):
+        row = {} if group_by == "all" else {label_key: label}
+        row.update({"stops": int(counts[i]), "mean_ms": round(float(mean[i]), 1), "min_ms": int(sorted_duration[starts[i]])})
+        row.update({f"p{int(q * 100)}_ms": int(values[i]) for q, values in quantiles.items()})
+        row["histogram"] = histogram[i].tolist()
+        groups.append(row)
+    return {"seasons": used, "group_by": group_by, "edges_ms": [round(float(e), 1) for e in edges], "groups": groups}
+
+
+def points_progression(seasons, by: str = "driver", ids: Optional[List[str]] = None, top: int = 10) -> Dict:
+    """
+    Points per round (race plus sprint) with the running total within the season and over the
+    whole range, for the given drivers / constructors or the top scorers of the range.
+    """
+    results, used = _concat("results", seasons)
+    entity = results[by]
+    if ids:
+        chosen = np.asarray(CODES[by].lookup(ids), dtype=np.int64)
+    else:
+        codes, inverse = np.unique(entity, return_inverse=True)
+        totals = np.bincount(inverse, weights=results["points"], minlength=len(codes))
+        chosen = codes[np.argsort(-totals, kind="stable")[:top]].astype(np.int64)
+    keep = np.isin(entity, chosen)
+
+    race = results["season"][keep].astype(np.int64) * 100 + results["round"][keep]
+    keys, inverse = np.unique((entity[keep].astype(np.int64) << 32) | race, return_inverse=True)
+    points = np.bincount(inverse, weights=results["points"][keep], minlength=len(keys))
+    owner, race = keys >> 32, keys & 0xFFFFFFFF
+    season = race // 100
+    running = np.cumsum(points)
+
+    def cumulative(group):
+        #running total restarted at the first row of every group, keys are sorted by group
+        _, first = np.unique(group, return_index=True)
+        offset = np.repeat(running[first] - points[first], np.diff(np.append(first, len(group))))
+        return running - offset
+
+    career = cumulative(owner)
+    in_season = cumulative((owner << 16) | season)
+
+    series = []
+    names = dict(zip(chosen.tolist(), CODES[by].decode(chosen.tolist())))
+    for code in chosen.tolist():
+        rows = np.flatnonzero(owner == code)
+        if not len(rows):
+            continue
+        per_season = {}
+        for s, p in zip(season[rows].tolist(), points[rows].tolist()):
+            per_season[s] = per_season.get(s, 0.0) + p
+        series.append({
+            f"{by}Id": names[code],
+            "total": round(float(career[rows[-1]]), 2),
+            "seasons": [{"season": s, "points": round(p, 2)} for s, p in per_season.items()],
+            "rounds": [{"season": s, "round": r % 100, "points": round(p, 2), "season_total": round(st, 2),
+                        "career_total": round(ct, 2)}
+                       for s, r, p, st, ct in zip(season[rows].tolist(), race[rows].tolist(), points[rows].tolist(),
+                                                  in_season[rows].tolist(), career[rows].tolist())],
+        })
+    return {"seasons": used, "by": by, "series": series}
+
+
+router = APIRouter()
+
+_ingest_tasks = set()  #keeps running ingestions referenced until they finish
+
+
+def _need_numpy() -> None:
+    if np is None:
+        raise HTTPException(status_code=503, detail="Analytics need numpy, pip install numpy")
+
+
+def _seasons(from_year: int, to_year: Optional[int]) -> range:
+    _need_numpy()
+    to_year = from_year if to_year is None else to_year
+    if to_year < from_year:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+    return range(from_year, to_year + 1)
+
+
+def _ids(value: Optional[str]) -> Optional[List[str]]:
+    return [v.strip() for v in value.split(",") if v.strip()] if value else None
+
+
+@router.post("/analytics/ingest")
+async def analytics_ingest(from_year: int = Query(..., alias="from"), to_year: Optional[int] = Query(None, alias="to"),
+                           tables: str = Query(",".join(TABLES), description="Comma separated: results,laps,pitstops"),
+                           force: bool = Query(False, description="Refetch seasons already stored")):
+    seasons = _seasons(from_year, to_year)
+    selected = _ids(tables) or []
+    unknown = [t for t in selected if t not in TABLES]
+    if unknown or not selected:
+        raise HTTPException(status_code=400, detail=f"Unknown tables: {unknown}")
+    task = asyncio.create_task(ingest(seasons.start, seasons.stop - 1, selected, force))
+    _ingest_tasks.add(task)
+    task.add_done_callback(_ingest_tasks.discard)
+    return {"status": "started", "seasons": len(seasons), "tables": selected}
+
+
+@router.get("/analytics/seasons")
+def analytics_seasons():
+    _need_numpy()
+    return {"running": len(_ingest_tasks), "seasons": stored()}
+
+
+#plain def routes, the array work runs in the threadpool instead of on the event loop
+@router.get("/analytics/lap-pace")
+def analytics_lap_pace(from_year: int = Query(..., alias="from"), to_year: Optional[int] = Query(None, alias="to"),
+                       drivers: Optional[str] = Query(None, description="Comma separated driverIds"),
+                       per_season: bool = False, clean: bool = Query(True, description="Drop lap 1, in and out laps"),
+                       top: int = Query(20, ge=1, le=1000)):
+    return lap_pace(_seasons(from_year, to_year), _ids(drivers), per_season, clean, top)
+
+
+@router.get("/analytics/pitstops")
+def analytics_pitstops(from_year: int = Query(..., alias="from"), to_year: Optional[int] = Query(None, alias="to"),
+                       group_by: str = Query("season", pattern="^(season|constructor|driver|all)$"),
+                       bins: int = Query(20, ge=1, le=200), max_ms: int = Query(60000, ge=1)):
+    return pitstop_distribution(_seasons(from_year, to_year), group_by, bins, max_ms)
+
+
+@router.get("/analytics/points")
+def analytics_points(from_year: int = Query(..., alias="from"), to_year: Optional[int] = Query(None, alias="to"),
+                     by: str = Query("driver", pattern="^(driver|constructor)$"),
+                     ids: Optional[str] = Query(None, description="Comma separated driverIds / constructorIds"),
+                     top: int = Query(10, ge=1, le=100)):
+    return points_progression(_seasons(from_year, to_year), by, _ids(ids), top)
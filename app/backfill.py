@@ -0,0 +1,138 @@
+"""
+Multi-season backfill of races, drivers and constructors.
+
+Every season/resource pair walks the upstream limit/offset pages and upserts each page as it
+arrives, then records the next offset in import_progress. Upserts make a re-written page a
+no-op, so an interrupted run resumes from the last recorded page.
+
+    python -m app.backfill --from 1950 --to 2025 [--resources races,drivers] [--force]
+"""
+import argparse
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+import anyio
+
+from app.cache import driver_query_cache
+from app.database import SessionLocal
+from app.database_pg_import import ImportPGSessionLocal
+from app.db_models_link_pg import ImportProgress
+from app.importer import upsert_constructors, upsert_drivers, upsert_races
+from app.upstream import BASE_URL, fetch_page
+
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "4"))
+
+#resource -> (path, table, list key) in the Ergast response
+RESOURCES = {
+    "races": ("races.json", "RaceTable", "Races"),
+    "drivers": ("drivers.json", "DriverTable", "Drivers"),
+    "constructors": ("constructors.json", "ConstructorTable", "Constructors"),
+}
+
+
+def utcnow() -> datetime:
+    """import_progress timestamps are naive UTC, the DateTime columns carry no zone"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def progress_row(import_db, resource: str, season: str) -> ImportProgress:
+    """the import_progress row of (resource, season), added to the session when missing"""
+    progress = import_db.query(ImportProgress).filter(ImportProgress.resource == resource,
+                                                      ImportProgress.season == season).first()
+    if progress is None:
+        progress = ImportProgress(resource=resource, season=season, next_offset=0, complete=False)
+        import_db.add(progress)
+    return progress
+
+
+def _start_offset(resource: str, season: str, force: bool) -> Optional[int]:
+    """offset to resume from, None when the season is already complete"""
+    with ImportPGSessionLocal() as import_db:
+        progress = progress_row(import_db, resource, season)
+        if force:
+            progress.next_offset, progress.complete = 0, False
+        import_db.commit()
+        return None if progress.complete else progress.next_offset
+
+
+def _write_page(resource: str, season: str, rows, next_offset: int, total: int) -> None:
+    if resource == "races" and rows:
+        with SessionLocal() as db:
+            upsert_races(db, rows)
+            db.commit()
+    with ImportPGSessionLocal() as import_db:
+        if resource == "drivers" and rows:
+            upsert_drivers(import_db, season, rows)
+            driver_query_cache.invalidate(season)
+        elif resource == "constructors" and rows:
+            upsert_constructors(import_db, season, rows)
+        progress = progress_row(import_db, resource, season)
+        progress.next_offset = next_offset
+        progress.total = total
+        progress.complete = not rows or next_offset >= total
+        progress.updated_at = utcnow()
+        import_db.commit()
+
+
+async def backfill_season(resource: str, season: int, force: bool = False) -> int:
+    """Loads one resource for one season page by page, returns the number of rows written."""
+    path, table, list_key = RESOURCES[resource]
+    offset = await anyio.to_thread.run_sync(_start_offset, resource, str(season), force)
+    if offset is None:
+        return 0
+    written = 0
+    while True:
+        data = await fetch_page(f"{BASE_URL}/{season}/{path}", offset, season, use_cache=False)
+        rows = data["MRData"][table][list_key]
+        total = int(data["MRData"].get("total", 0))
+        offset += len(rows)
+        await anyio.to_thread.run_sync(_write_page, resource, str(season), rows, offset, total)
+        written += len(rows)
+        if not rows or offset >= total:
+            return written
+
+
+async def backfill(from_year: int, to_year: int, resources: Iterable[str] = RESOURCES,
+                   force: bool = False) -> Dict:
+    """Runs every (resource, season) with at most BACKFILL_CONCURRENCY in flight."""
+    semaphore = asyncio.Semaphore(BACKFILL_CONCURRENCY)
+
+    async def run(resource: str, season: int):
+        async with semaphore:
+            return resource, await backfill_season(resource, season, force)
+
+    jobs = [(r, s) for s in range(from_year, to_year + 1) for r in resources]
+    #a failed season must not stop the others, it is retried from its checkpoint next run
+    results = await asyncio.gather(*(run(r, s) for r, s in jobs), return_exceptions=True)
+    summary = {r: 0 for r in resources}
+    failed = []
+    for (resource, season), result in zip(jobs, results):
+        if isinstance(result, BaseException):
+            failed.append({"resource": resource, "season": season, "error": str(result)})
+        else:
+            summary[resource] += result[1]
+    return {"rows": summary, "failed": failed}
+
+
+async def _main(args) -> Dict:
+    from app.upstream import close_client
+    try:
+        return await backfill(args.from_year, args.to_year, args.resources.split(","), args.force)
+    finally:
+        await close_client()
+
+
+if __name__ == "__main__":
+    from app.migrations import init_databases
+
+    parser = argparse.ArgumentParser(description="Backfill F1 seasons into the local databases")
+    parser.add_argument("--from", dest="from_year", type=int, required=True)
+    parser.add_argument("--to", dest="to_year", type=int, required=True)
+    parser.add_argument("--resources", default=",".join(RESOURCES))
+    parser.add_argument("--force", action="store_true", help="reload seasons already marked complete")
+    args = parser.parse_args()
+
+    init_databases()
+    print(asyncio.run(_main(args)))
@@ -0,0 +1,129 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, select, tuple_, update
+from sqlalchemy.orm import Session
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+
+
+def _result(index: int, item, status: str, id: Optional[int] = None, detail: Optional[str] = None) -> Dict:
+    return {"index": index, "op": item.op, "status": status, "id": id if id is not None else item.id, "detail": detail}
+
+
+def _vacating_first(updates: list, current: Dict[int, Optional[tuple]], key_of) -> list:
+    """
+    Orders updates so a row moves off a unique key before another row takes it over,
+    the unique index is checked per row. Swaps cannot be ordered and stay last.
+    """
+    holders = {current[item.id]: item.id for _, item in updates if current[item.id]}
+    ordered, remaining = [], list(updates)
+    while remaining:
+        ready = [(i, item) for i, item in remaining
+                 if holders.get(key_of(item.data.model_dump())) in (None, item.id)]
+        if not ready:
+            return ordered + remaining
+        for _, item in ready:
+            if holders.get(current[item.id]) == item.id:
+                del holders[current[item.id]]
+        ordered += ready
+        remaining = [entry for entry in remaining if entry not in ready]
+    return ordered
+
+
+def _key_in(key_cols: list, keys) -> object:
+    keys = list(keys)
+    return key_cols[0].in_([k[0] for k in keys]) if len(key_cols) == 1 else tuple_(*key_cols).in_(keys)
+
+
+def apply_batch(session: Session, model, items: list, key: Tuple[str, ...], atomic: bool = False) -> Tuple[List[Dict], bool]:
+    """
+    Applies create/update/delete items to `model` with one bulk statement per operation, the ids
+    of created rows are read back by their unique `key` with one SELECT (rows with a NULL key part
+    cannot be found that way and are inserted one by one with RETURNING).
+    Ids and unique `key` values are checked up front with two SELECTs, items that would fail
+    are reported per item instead of aborting the others. With atomic=True nothing is written
+    when any item fails. Returns (per item results in input order, whether anything was written).
+    The caller commits.
+    """
+    results: List[Optional[Dict]] = [None] * len(items)
+    seen_ids = set()
+    for i, item in enumerate(items):
+        if item.op != "create" and item.id is None:
+            results[i] = _result(i, item, "invalid", detail="id is required for update and delete")
+        elif item.op != "delete" and item.data is None:
+            results[i] = _result(i, item, "invalid", detail="data is required for create and update")
+        elif item.op != "create" and item.id in seen_ids:
+            results[i] = _result(i, item, "invalid", detail="id appears more than once in the batch")
+        elif item.op != "create":
+            seen_ids.add(item.id)
+    pending = [(i, item) for i, item in enumerate(items) if results[i] is None]
+
+    key_cols = [getattr(model, k) for k in key]
+    def key_of(data: Dict) -> Optional[tuple]:
+        value = tuple(data.get(k) for k in key)
+        return None if None in value else value  #NULLs never collide in a unique index
+
+    #rows addressed by id
+    ids = {item.id for _, item in pending if item.op != "create"}
+    current = {row[0]: key_of(dict(zip(key, row[1:])))
+               for row in session.execute(select(model.id, *key_cols).where(model.id.in_(ids)))} if ids else {}
+    for i, item in pending:
+        if item.op != "create" and item.id not in current:
+            results[i] = _result(i, item, "not_found", detail=f"{model.__name__} {item.id} not found")
+    pending = [(i, item) for i, item in pending if results[i] is None]
+
+    #owners of every unique key the batch writes, rows leaving a key (delete / re-key) free it first
+    wanted = {k for _, item in pending if item.op != "delete" for k in [key_of(item.data.model_dump())] if k}
+    owners: Dict[tuple, object] = {}
+    if wanted:
+        owners = {key_of(dict(zip(key, row[1:]))): row[0]
+                  for row in session.execute(select(model.id, *key_cols).where(_key_in(key_cols, wanted)))}
+    for _, item in pending:
+        if item.op != "create" and owners.get(current[item.id]) == item.id:
+            del owners[current[item.id]]
+    for i, item in pending:
+        if item.op == "delete":
+            continue
+        k = key_of(item.data.model_dump())
+        if k is None:
+            continue
+        owner = owners.get(k)
+        if owner is not None and owner != (item.id if item.op == "update" else None):
+            results[i] = _result(i, item, "conflict", detail=f"{dict(zip(key, k))} already exists")
+        else:
+            owners[k] = item.id if item.op == "update" else ("new", i)
+    pending = [(i, item) for i, item in pending if results[i] is None]
+
+    if atomic and len(pending) < len(items):
+        for i, item in pending:
+            results[i] = _result(i, item, "skipped", detail="batch not applied, another item failed")
+        return results, False
+
+    deletes = [(i, item) for i, item in pending if item.op == "delete"]
+    updates = [(i, item) for i, item in pending if item.op == "update"]
+    creates = [(i, item) for i, item in pending if item.op == "create"]
+    if deletes:
+        session.execute(delete(model).where(model.id.in_([item.id for _, item in deletes])))
+    if updates:
+        session.execute(update(model), [{"id": item.id, **item.data.model_dump()}
+                                        for _, item in _vacating_first(updates, current, key_of)])
+    new_ids = {}
+    create_rows = {i: item.data.model_dump() for i, item in creates}
+    keyed = {i: data for i, data in create_rows.items() if key_of(data)}
+    if keyed:
+        #plain executemany, INSERT ... RETURNING of many rows is one statement per row on SQLite
+        session.execute(insert(model), list(keyed.values()))
+        created = {key_of(dict(zip(key, row[1:]))): row[0] for row in session.execute(
+            select(model.id, *key_cols).where(_key_in(key_cols, {key_of(data) for data in keyed.values()})))}
+        new_ids = {i: created[key_of(data)] for i, data in keyed.items()}
+    for i, data in create_rows.items():
+        if i not in keyed:
+            new_ids[i] = session.scalar(insert(model).returning(model.id), data)
+    for i, item in deletes:
+        results[i] = _result(i, item, "deleted")
+    for i, item in updates:
+        results[i] = _result(i, item, "updated")
+    for i, item in creates:
+        results[i] = _result(i, item, "created", id=new_ids[i])
+    return results, bool(pending)
@@ -0,0 +1,174 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, Optional
+
+#cache settings (seconds), past seasons never change so they can live much longer
+CACHE_MAXSIZE = int(os.getenv("UPSTREAM_CACHE_MAXSIZE", "512"))
+CACHE_TTL_PAST = int(os.getenv("UPSTREAM_CACHE_TTL_PAST", str(30 * 24 * 3600)))
+CACHE_TTL_CURRENT = int(os.getenv("UPSTREAM_CACHE_TTL_CURRENT", "300"))
+DRIVER_QUERY_TTL = int(os.getenv("DRIVER_QUERY_CACHE_TTL", "600"))
+CACHE_DISK_PATH = os.getenv("UPSTREAM_CACHE_DISK_PATH")  #eg ./upstream_cache.db, disabled when unset
+
+
+def season_ttl(season: Optional[Any]) -> int:
+    """TTL for a response belonging to `season` (None = not season specific)."""
+    try:
+        year = int(season)
+    except (TypeError, ValueError):
+        return CACHE_TTL_CURRENT
+    return CACHE_TTL_PAST if year < date.today().year else CACHE_TTL_CURRENT
+
+
+class LRUCache:
+    """In-process LRU with a per-entry expiry time."""
+
+    def __init__(self, maxsize: int = CACHE_MAXSIZE):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float, expires: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (expires if expires is not None else time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class DiskCache:
+    """Optional on-disk tier (single sqlite file) so cached seasons survive restarts."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS upstream_cache "
+            "(key TEXT PRIMARY KEY, expires REAL NOT NULL, body TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires, body FROM upstream_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[0] < time.time():
+            return None
+        return row[0], json.loads(row[1])
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO upstream_cache (key, expires, body) VALUES (?, ?, ?)",
+                (key, time.time() + ttl, json.dumps(value)),
+            )
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM upstream_cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM upstream_cache")
+            self._conn.commit()
+
+
+class TieredCache:
+    """Read-through memory -> disk lookup for upstream JSON responses keyed by URL."""
+
+    def __init__(self, memory: LRUCache, disk: Optional[DiskCache] = None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is not None or self.disk is None:
+            return value
+        hit = self.disk.get(key)
+        if hit is None:
+            return None
+        expires, value = hit
+        self.memory.set(key, value, 0, expires=expires)  #promote, keep the disk expiry
+        return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self.memory.set(key, value, ttl)
+        if self.disk is not None:
+            self.disk.set(key, value, ttl)
+
+    def delete(self, key: str) -> None:
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+class SeasonCache:
+    """
+    LRU of derived results grouped by season. invalidate(season) bumps that season's version,
+    which makes its old entries unreachable (they age out of the LRU) without scanning keys.
+    Versions live in this process only: with several workers the others keep serving their
+    entries until `ttl` runs out, so the ttl is the staleness bound after a write.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = CACHE_MAXSIZE):
+        self.ttl = ttl
+        self._lru = LRUCache(maxsize)
+        self._versions: Dict[str, int] = {}
+
+    def version(self, season: Any) -> int:
+        return self._versions.get(str(season), 0)
+
+    def get(self, season: Any, key: str) -> Optional[Any]:
+        return self._lru.get(f"{season}:{self.version(season)}:{key}")
+
+    def set(self, season: Any, key: str, value: Any, version: Optional[int] = None) -> None:
+        """pass the version read before computing value, so a result that raced an invalidate is never served"""
+        version = self.version(season) if version is None else version
+        self._lru.set(f"{season}:{version}:{key}", value, self.ttl)
+
+    def invalidate(self, season: Any) -> None:
+        season = str(season)
+        self._versions[season] = self._versions.get(season, 0) + 1
+
+
+upstream_cache = TieredCache(LRUCache(), DiskCache(CACHE_DISK_PATH) if CACHE_DISK_PATH else None)
+
+#/agent-db results keyed by mode and normalized name, invalidated when a season's drivers are
+#written. Other workers only see the write after DRIVER_QUERY_CACHE_TTL, lower it when that matters
+driver_query_cache = SeasonCache(DRIVER_QUERY_TTL)
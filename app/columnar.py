@@ -0,0 +1,326 @@
+"""
+Columnar store of race results, lap times and pit stops for the analytics routes (app/analytics.py).
+
+Every season is a directory of NumPy arrays, one .npy file per column, memory-mapped on read:
+
+    {COLUMNAR_DIR}/{season}/{table}/{column}.npy
+    {COLUMNAR_DIR}/ids/drivers.json, constructors.json    integer code -> Ergast id, shared by all seasons
+
+Times are integer milliseconds and drivers / constructors integer codes, so aggregates over many
+seasons are plain array operations instead of walks over JSON. Past seasons are stored once, the
+current season only fetches laps and pit stops of rounds it does not have yet. numpy is optional,
+without it nothing here can be used and the analytics routes answer 503.
+
+    python -m app.columnar --from 2011 --to 2024 [--tables results,laps,pitstops] [--force]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+import anyio
+
+from app.upstream import BASE_URL, PAGE_LIMIT, fetch_page
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import fcntl
+except ImportError:  #not on Windows, codes are then only safe within one process
+    fcntl = None
+
+COLUMNAR_DIR = os.getenv("COLUMNAR_DIR", "./columnar")
+COLUMNAR_CONCURRENCY = int(os.getenv("COLUMNAR_CONCURRENCY", "4"))  #rounds fetched at once
+
+MISSING = -1  #time or position Ergast did not send
+
+#table -> column -> dtype
+SCHEMA = {
+    "results": {"round": "int16", "sprint": "int8", "driver": "int32", "constructor": "int32", "grid": "int16",
+                "position": "int16", "classified": "int8", "points": "float32", "laps": "int16",
+                "millis": "int32", "fastest_lap_ms": "int32"},
+    "laps": {"round": "int16", "lap": "int16", "driver": "int32", "position": "int16", "millis": "int32"},
+    "pitstops": {"round": "int16", "driver": "int32", "lap": "int16", "stop": "int16", "duration_ms": "int32"},
+}
+TABLES = list(SCHEMA)
+ROUND_PATHS = {"laps": "laps.json", "pitstops": "pitstops.json"}  #per round endpoints
+FIRST_SPRINT_SEASON = 2021
+
+
+def parse_ms(value: Optional[str]) -> int:
+    """'1:32.123', '22.123' or '1:02:03.456' -> milliseconds"""
+    if not value:
+        return MISSING
+    try:
+        seconds = 0.0
+        for part in value.split(":"):
+            seconds = seconds * 60 + float(part)
+    except ValueError:
+        return MISSING
+    return int(round(seconds * 1000))
+
+
+@contextmanager
+def _codes_lock():
+    """
+    Exclusive lock across processes (eg the CLI next to the app's background ingest), held while
+    codes are reloaded, appended and written, so one code is never given to two ids.
+    """
+    os.makedirs(COLUMNAR_DIR, exist_ok=True)
+    with open(os.path.join(COLUMNAR_DIR, "codes.lock"), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class Codes:
+    """
+    Append-only Ergast id <-> integer code table. Codes never change once given out, so arrays of
+    different seasons can be concatenated as they are.
+    """
+
+    def __init__(self, name: str):
+        self.path = os.path.join(COLUMNAR_DIR, "ids", f"{name}.json")
+        self.names: List[str] = []
+        self.codes: Dict[str, int] = {}
+        self._mtime: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _reload(self, force: bool = False) -> None:
+        """picks up codes written by another process, eg the CLI"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if force or mtime != self._mtime:
+            with open(self.path) as f:
+                self.names = json.load(f)
+            self.codes = {n: i for i, n in enumerate(self.names)}
+            self._mtime = mtime
+
+    def encode(self, values: List[str]) -> List[int]:
+        with self._lock, _codes_lock():
+            self._reload(force=True)  #mtimes can be too coarse to see another writer's change
+            added = False
+            for value in values:
+                if value not in self.codes:
+                    self.codes[value] = len(self.names)
+                    self.names.append(value)
+                    added = True
+            if added:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp = f"{self.path}.tmp-{os.getpid()}"
+                with open(tmp, "w") as f:
+                    json.dump(self.names, f)
+                os.replace(tmp, self.path)
+                self._mtime = os.stat(self.path).st_mtime_ns
+            return [self.codes[v] for v in values]
+
+    def lookup(self, values: Iterable[str]) -> List[int]:
+        """codes of the ids that were ever stored, unknown ids are left out"""
+        with self._lock:
+            self._reload()
+            return [self.codes[v] for v in values if v in self.codes]
+
+    def decode(self, codes) -> List[str]:
+        with self._lock:
+            self._reload()
+            return [self.names[c] for c in codes]
+
+
+driver_codes = Codes("drivers")
+constructor_codes = Codes("constructors")
+
+_loaded: Dict[tuple, tuple] = {}  #(season, table) -> (directory mtime, arrays)
+
+
+def _table_dir(season: int, table: str) -> str:
+    return os.path.join(COLUMNAR_DIR, str(season), table)
+
+
+def load_table(season: int, table: str) -> Optional[Dict[str, "np.ndarray"]]:
+    """read-only memory-mapped columns of one stored table, None when it was never stored"""
+    path = _table_dir(season, table)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _loaded.get((season, table))
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in SCHEMA[table]}
+    _loaded[(season, table)] = (mtime, arrays)
+    return arrays
+
+
+def write_table(season: int, table: str, rows: List[Dict], existing: Optional[Dict] = None) -> int:
+    """
+    Stores rows (dicts keyed by column, Ergast ids for driver / constructor) after the `existing`
+    columns. The table directory is swapped in whole, open memory maps keep the old files.
+    """
+    columns = {}
+    for name, dtype in SCHEMA[table].items():
+        values = [row[name] for row in rows]
+        if name == "driver":
+            values = driver_codes.encode(values)
+        elif name == "constructor":
+            values = constructor_codes.encode(values)
+        columns[name] = np.asarray(values, dtype=dtype)
+        if existing is not None:
+            columns[name] = np.concatenate([existing[name], columns[name]])
+    final = _table_dir(season, table)
+    tmp, old = f"{final}.tmp-{os.getpid()}", f"{final}.old-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, values in columns.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), values)
+    if os.path.exists(final):
+        os.replace(final, old)
+    os.replace(tmp, final)
+    shutil.rmtree(old, ignore_errors=True)
+    return len(rows)
+
+
+def stored() -> Dict[int, Dict[str, int]]:
+    """rows per table of every stored season"""
+    seasons = {}
+    if not os.path.isdir(COLUMNAR_DIR):
+        return seasons
+    for name in sorted(os.listdir(COLUMNAR_DIR)):
+        if name.isdigit():
+            tables = {t: len(arrays["round"]) for t in TABLES for arrays in [load_table(int(name), t)] if arrays is not None}
+            if tables:
+                seasons[int(name)] = tables
+    return seasons
+
+
+async def _races(url: str, season: int) -> List[Dict]:
+    """
+    Races entries of every page of a list that pages over nested rows (results, timings, stops),
+    a race split over two pages shows up once per page with its part of the rows.
+    """
+    races, offset = [], 0
+    while True:
+        data = await fetch_page(url, offset, season, use_cache=False)  #bulk load, keep the cache for reads
+        races.extend(data["MRData"]["RaceTable"]["Races"])
+        offset += PAGE_LIMIT
+        if offset >= int(data["MRData"].get("total", 0)):
+            return races
+
+
+def result_rows(races: List[Dict], sprint: bool = False) -> List[Dict]:
+    rows = []
+    for race in races:
+        for r in race.get("SprintResults" if sprint else "Results", []):
+            rows.append({
+                "round": int(race["round"]), "sprint": int(sprint), "driver": r["Driver"]["driverId"],
+                "constructor": r["Constructor"]["constructorId"], "grid": int(r.get("grid") or 0),
+                "position": int(r.get("position") or MISSING), "classified": int(r.get("positionText", "").isdigit()),
+                "points": float(r.get("points") or 0), "laps": int(r.get("laps") or 0),
+                "millis": int(r.get("Time", {}).get("millis") or MISSING),
+                "fastest_lap_ms": parse_ms(r.get("FastestLap", {}).get("Time", {}).get("time")),
+            })
+    return rows
+
+
+def lap_rows(races: List[Dict]) -> List[Dict]:
+    return [{"round": int(race["round"]), "lap": int(lap["number"]), "driver": t["driverId"],
+             "position": int(t.get("position") or MISSING), "millis": parse_ms(t.get("time"))}
+            for race in races for lap in race.get("Laps", []) for t in lap["Timings"]]
+
+
+def pitstop_rows(races: List[Dict]) -> List[Dict]:
+    return [{"round": int(race["round"]), "driver": p["driverId"], "lap": int(p["lap"]), "stop": int(p["stop"]),
+             "duration_ms": parse_ms(p.get("duration"))}
+            for race in races for p in race.get("PitStops", [])]
+
+
+async def _ingest_results(season: int) -> int:
+    races = await _races(f"{BASE_URL}/{season}/results.json", season)
+    rows = result_rows(races)
+    if season >= FIRST_SPRINT_SEASON:
+        rows += result_rows(await _races(f"{BASE_URL}/{season}/sprint.json", season), sprint=True)
+    return await anyio.to_thread.run_sync(write_table, season, "results", rows)
+
+
+async def _ingest_rounds(season: int, table: str, rounds: List[int], existing: Optional[Dict],
+                         semaphore: asyncio.Semaphore) -> int:
+    async def fetch(round_: int):
+        async with semaphore:
+            return await _races(f"{BASE_URL}/{season}/{round_}/{ROUND_PATHS[table]}", season)
+
+    races = [race for page in await asyncio.gather(*(fetch(r) for r in rounds)) for race in page]
+    rows = lap_rows(races) if table == "laps" else pitstop_rows(races)
+    return await anyio.to_thread.run_sync(write_table, season, table, rows, existing)
+
+
+async def ingest_season(season: int, tables: Iterable[str] = TABLES, force: bool = False,
+                        semaphore: Optional[asyncio.Semaphore] = None) -> Dict[str, int]:
+    """
+    Stores the requested tables of one season, returns the rows written per table. Stored past
+    seasons are skipped unless force, laps and pit stops are fetched per round that has results.
+    """
+    semaphore = semaphore or asyncio.Semaphore(COLUMNAR_CONCURRENCY)
+    past = season < date.today().year
+    written = {}
+    results = load_table(season, "results")
+    if force or results is None or ("results" in tables and not past):
+        written["results"] = await _ingest_results(season)
+        results = load_table(season, "results")
+    rounds = sorted(set(results["round"].tolist()))
+    for table in ROUND_PATHS:
+        if table not in tables:
+            continue
+        existing = None if force else load_table(season, table)
+        if existing is not None and past:
+            written[table] = 0
+            continue
+        have = set(existing["round"].tolist()) if existing is not None else set()
+        written[table] = await _ingest_rounds(season, table, [r for r in rounds if r not in have], existing, semaphore)
+    return written
+
+
+async def ingest(from_year: int, to_year: int, tables: Iterable[str] = TABLES, force: bool = False) -> Dict:
+    """ingest_season for every season of the range, a failed season does not stop the others"""
+    if np is None:
+        raise RuntimeError("numpy is not installed")
+    semaphore = asyncio.Semaphore(COLUMNAR_CONCURRENCY)
+    summary = {t: 0 for t in TABLES}
+    failed = []
+    for season in range(from_year, to_year + 1):
+        try:
+            for table, rows in (await ingest_season(season, tables, force, semaphore)).items():
+                summary[table] += rows
+        except Exception as e:
+            failed.append({"season": season, "error": str(e)})
+    return {"rows": summary, "failed": failed}
+
+
+async def _main(args) -> Dict:
+    from app.upstream import close_client
+    try:
+        return await ingest(args.from_year, args.to_year, args.tables.split(","), args.force)
+    finally:
+        await close_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store results, laps and pit stops as columnar arrays")
+    parser.add_argument("--from", dest="from_year", type=int, required=True)
+    parser.add_argument("--to", dest="to_year", type=int, required=True)
+    parser.add_argument("--tables", default=",".join(TABLES))
+    parser.add_argument("--force", action="store_true", help="refetch seasons already stored")
+    args = parser.parse_args()
+    print(asyncio.run(_main(args)))
@@ -0,0 +1,130 @@
+"""
+Conditional GET for the season read routes: a route marks its response cacheable with
+cache_headers(), ConditionalMiddleware then adds an ETag (hash of the body) and a
+Last-Modified, and answers If-None-Match / If-Modified-Since with an empty 304.
+
+Last-Modified is the stored time a route passes in (import_progress.updated_at, see
+local_source.stored_at), or the first time this process served the body when there is none.
+"""
+import hashlib
+import os
+import time
+from datetime import date
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Response
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.cache import CACHE_TTL_PAST, LRUCache
+
+#Cache-Control max-age (seconds) sent to clients, past seasons are immutable
+HTTP_MAX_AGE_PAST = int(os.getenv("HTTP_MAX_AGE_PAST", str(CACHE_TTL_PAST)))
+HTTP_MAX_AGE_CURRENT = int(os.getenv("HTTP_MAX_AGE_CURRENT", "60"))
+#bodies from this size on are gzip/brotli encoded by the middleware in app/main.py
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1000"))
+COMPRESSED_ENCODINGS = ("gzip", "br")
+
+#ETag -> first time this process served it, the Last-Modified of responses without a version stamp
+_first_seen = LRUCache(4096)
+
+
+def cache_control(season: int, mutable: bool = False) -> str:
+    if mutable:
+        return "no-cache"  #editable through the API, clients revalidate every time (a cheap 304)
+    if season < date.today().year:
+        return f"public, max-age={HTTP_MAX_AGE_PAST}, immutable"
+    return f"public, max-age={HTTP_MAX_AGE_CURRENT}, stale-while-revalidate={HTTP_MAX_AGE_CURRENT}"
+
+
+def cache_headers(response: Response, season: int, mutable: bool = False,
+                  last_modified: Optional[float] = None) -> None:
+    """marks a season response cacheable, ConditionalMiddleware adds the validators"""
+    response.headers["Cache-Control"] = cache_control(season, mutable)
+    if last_modified is not None:  #epoch seconds the data was stored
+        response.headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+
+
+def etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _compressed(request: Headers, body: bytes) -> bool:
+    """whether the compression middleware will encode this body for this request"""
+    accept = request.get("accept-encoding", "")
+    return len(body) >= COMPRESS_MIN_SIZE and any(e in accept for e in COMPRESSED_ENCODINGS)
+
+
+def _last_modified(tag: str) -> str:
+    seen = _first_seen.get(tag)
+    if seen is None:
+        seen = int(time.time())
+        _first_seen.set(tag, seen, CACHE_TTL_PAST)
+    return formatdate(seen, usegmt=True)
+
+
+def not_modified(request: Headers, tag: str, last_modified: str) -> bool:
+    """RFC 9110 evaluation, If-Modified-Since only counts when there is no If-None-Match"""
+    if_none_match = request.get("if-none-match")
+    if if_none_match is not None:
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}  #weak comparison
+        return "*" in tags or tag.removeprefix("W/") in tags
+    since = request.get("if-modified-since")
+    if since is None:
+        return False
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(since)
+    except (TypeError, ValueError):
+        return False  #unparseable dates are ignored
+
+
+class ConditionalMiddleware:
+    """
+    ASGI middleware for GET responses a route gave a Cache-Control header (see cache_headers).
+    Those bodies are buffered and hashed, everything else streams through untouched. Added
+    before compression so the ETag is computed on the uncompressed body, it is sent weak
+    whenever the body gets encoded since the bytes on the wire differ from the hashed ones.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            return await self.app(scope, receive, send)
+        start: Optional[dict] = None
+        chunks = []
+
+        async def send_wrapper(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if message["status"] == 200 and "cache-control" in headers and "etag" not in headers:
+                    start = message
+                    return
+            elif message["type"] == "http.response.body" and start is not None:
+                chunks.append(message.get("body", b""))
+                if message.get("more_body"):
+                    return
+                await self._respond(scope, send, start, b"".join(chunks))
+                return
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    async def _respond(scope, send, start: dict, body: bytes) -> None:
+        headers = MutableHeaders(raw=list(start["headers"]))
+        request = Headers(scope=scope)
+        tag = etag(body)
+        last_modified = headers.get("last-modified") or _last_modified(tag)
+        headers["ETag"] = "W/" + tag if _compressed(request, body) else tag
+        headers["Last-Modified"] = last_modified
+        if not_modified(request, tag, last_modified):
+            del headers["content-length"]
+            del headers["content-type"]
+            await send({"type": "http.response.start", "status": 304, "headers": headers.raw})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send({**start, "headers": headers.raw})
+        await send({"type": "http.response.body", "body": body})
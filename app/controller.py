@@ -1,13 +1,16 @@
 from fastapi import APIRouter
 from app.pydantic_models import DriverQuery, DriverResult, APIQuery, APIResult
-from app.service import query_driver_data, query_api_data
 
 router = APIRouter()
 
+#app.service (and pydantic_ai with it) is imported on first use or by the warm-up, not with app.main
+
 @router.post("/agent-db", response_model=DriverResult)
 async def db_agent(query: DriverQuery):
+    from app.service import query_driver_data
     return await query_driver_data(query)
 
 @router.post("/agent-api", response_model=APIResult)
 async def api_agent(query: APIQuery):
-    return await query_api_data(query.query)
+    from app.service import query_api_data
+    return await query_api_data(query.query, fields=query.fields, driver=query.driver, top=query.top)
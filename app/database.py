@@ -1,12 +1,15 @@
-from sqlalchemy import create_engine #connection to db
 from sqlalchemy.orm import sessionmaker #creates session for interacting
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
+from app.engines import make_engines
+
 Base = declarative_base() #creates base class for models
 
+#LOCAL_DB_URL and LOCAL_DB_POOL_* override these, see app/engines.py
 DATABASE_URL = "sqlite:///./races.db"
 
-engine = create_engine(DATABASE_URL, connect_args = {"check_same_thread":False}) #use connections across multiple threads
+#sync engine for migrations, backfill and exports, async one over the same file for the request handlers
+engine, async_engine = make_engines("local", "LOCAL_DB", DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False,bind=engine) #not auto committed/pushed
-
-
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Date
+from sqlalchemy import Column, String, Integer, Date, Index
 from app.database import Base
 from app.database_pg import PgBase
 
@@ -13,6 +13,15 @@ class RaceDB(Base):
     time = Column(String)
     circuit_name = Column(String)
     country = Column(String)
+    #kept so a stored season can be served back in the Ergast shape, see app/local_source.py
+    circuit_id = Column(String, nullable=True)
+    locality = Column(String, nullable=True)
+    lat = Column(String, nullable=True)
+    long = Column(String, nullable=True)
+    url = Column(String, nullable=True)
+    source = Column(String, nullable=True)  #"ergast" when stored from upstream, NULL for manual races
+
+    __table_args__ = (Index("uq_races_season_round", "season", "round", unique=True),)
 
 class DriverDB(PgBase):
     __tablename__ = "drivers"
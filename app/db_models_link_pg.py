@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Date, Integer, ForeignKey
+from sqlalchemy import Column, String, Date, DateTime, Integer, Float, Boolean, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.database_pg_import import ImportBase
 
@@ -9,6 +9,9 @@ class Constructors_All(ImportBase):
     constructorId = Column(String, index=True)
     name = Column(String)
     nationality = Column(String)
+    url = Column(String, nullable=True)
+
+    __table_args__ = (Index("uq_constructors_season_constructor", "season", "constructorId", unique=True),)
 
     #drivers = relationship("Drivers_All",back_populates="constructors_rel")
 
@@ -16,9 +19,96 @@ class Drivers_All(ImportBase):
     __tablename__ = "drivers"
     id = Column(Integer, primary_key=True, index=True)
     season = Column(String, index=True)
+    driverId = Column(String, nullable=True, index=True)
     permanentNumber = Column(String, index=True)
     givenName = Column(String)
     familyName = Column(String)
     code = Column(String, nullable=True)
     nationality = Column(String)
     constructorId = Column(String, nullable=True)
+    searchName = Column(String, nullable=True) #normalized "given family", see app/name_search.py
+    url = Column(String, nullable=True)
+    dateOfBirth = Column(String, nullable=True)
+
+    __table_args__ = (Index("uq_drivers_season_number", "season", "permanentNumber", unique=True),
+                      Index("uq_drivers_season_driver", "season", "driverId", unique=True))
+
+#backfill checkpoints and sync state, one row per (resource, season)
+class ImportProgress(ImportBase):
+    __tablename__ = "import_progress"
+    id = Column(Integer, primary_key=True, index=True)
+    resource = Column(String)
+    season = Column(String)
+    next_offset = Column(Integer, default=0)
+    total = Column(Integer, nullable=True)
+    complete = Column(Boolean, default=False)
+    updated_at = Column(DateTime, nullable=True)
+    #written by the background sync, see app/sync.py
+    last_round = Column(Integer, nullable=True)
+    fetched_at = Column(DateTime, nullable=True)
+    content_hash = Column(String, nullable=True)
+
+    __table_args__ = (Index("uq_import_progress_resource_season", "resource", "season", unique=True),)
+
+#materialized from the Ergast standings, kept current by app/standings.py
+class DriverStanding(ImportBase):
+    __tablename__ = "driver_standings"
+    id = Column(Integer, primary_key=True, index=True)
+    season = Column(String)
+    round = Column(Integer)  #standings after this round
+    driverId = Column(String)
+    constructorId = Column(String, nullable=True)  #team at the latest round
+    position = Column(Integer, nullable=True)
+    positionText = Column(String, nullable=True)
+    points = Column(Float)
+    wins = Column(Integer)
+
+    __table_args__ = (Index("uq_driver_standings_season_driver", "season", "driverId", unique=True),
+                      Index("ix_driver_standings_season_position", "season", "position"),
+                      Index("ix_driver_standings_driver", "driverId"))
+
+class ConstructorStanding(ImportBase):
+    __tablename__ = "constructor_standings"
+    id = Column(Integer, primary_key=True, index=True)
+    season = Column(String)
+    round = Column(Integer)
+    constructorId = Column(String)
+    position = Column(Integer, nullable=True)
+    positionText = Column(String, nullable=True)
+    points = Column(Float)
+    wins = Column(Integer)
+
+    __table_args__ = (Index("uq_constructor_standings_season_constructor", "season", "constructorId", unique=True),
+                      Index("ix_constructor_standings_season_position", "season", "position"),
+                      Index("ix_constructor_standings_constructor", "constructorId"))
+
+#career totals over every stored season, one row per driver / constructor
+class DriverCareer(ImportBase):
+    __tablename__ = "driver_careers"
+    id = Column(Integer, primary_key=True, index=True)
+    driverId = Column(String)
+    seasons = Column(Integer)
+    points = Column(Float, index=True)
+    wins = Column(Integer, index=True)
+    championships = Column(Integer, index=True)  #finished first in a completed season
+    best_position = Column(Integer, nullable=True)
+    first_season = Column(String)
+    last_season = Column(String)
+    updated_at = Column(DateTime)
+
+    __table_args__ = (Index("uq_driver_careers_driver", "driverId", unique=True),)
+
+class ConstructorCareer(ImportBase):
+    __tablename__ = "constructor_careers"
+    id = Column(Integer, primary_key=True, index=True)
+    constructorId = Column(String)
+    seasons = Column(Integer)
+    points = Column(Float, index=True)
+    wins = Column(Integer, index=True)
+    championships = Column(Integer, index=True)
+    best_position = Column(Integer, nullable=True)
+    first_season = Column(String)
+    last_season = Column(String)
+    updated_at = Column(DateTime)
+
+    __table_args__ = (Index("uq_constructor_careers_constructor", "constructorId", unique=True),)
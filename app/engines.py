@@ -0,0 +1,100 @@
+import os
+import time
+from typing import Dict, Tuple
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.metrics import Gauge, count_statement, db_pool_wait, register
+
+#SQLite pragmas applied to every new connection, WAL lets readers run alongside the single writer
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  #safe with WAL, only the last commits can be lost on power loss
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+_engines: Dict[str, Engine] = {}  #name -> sync engine (async ones via .sync_engine), for pool gauges
+
+
+def _env(prefix: str, key: str, default: str) -> str:
+    return os.getenv(f"{prefix}_{key}", default)
+
+
+def pool_options(prefix: str) -> dict:
+    """
+    Pool settings from the environment, eg IMPORT_DB_POOL_SIZE=10 IMPORT_DB_MAX_OVERFLOW=20.
+    pool_size + max_overflow per engine per worker has to stay under the server's max_connections.
+    """
+    return {
+        "pool_size": int(_env(prefix, "POOL_SIZE", "5")),
+        "max_overflow": int(_env(prefix, "MAX_OVERFLOW", "10")),
+        "pool_timeout": float(_env(prefix, "POOL_TIMEOUT", "30")),
+        "pool_recycle": int(_env(prefix, "POOL_RECYCLE", "1800")),  #seconds, below server/proxy idle timeouts
+        "pool_pre_ping": _env(prefix, "POOL_PRE_PING", "1") != "0",
+    }
+
+
+def async_url(url: str) -> str:
+    """same database through the async driver, eg postgresql+psycopg2:// -> postgresql+asyncpg://"""
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme.split('+')[0], scheme)}://{rest}"
+
+
+def _timed_pool(base, name: str):
+    """pool class that records how long each checkout waited for a free connection"""
+    class TimedPool(base):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                db_pool_wait.observe(time.perf_counter() - start, name)
+    TimedPool.__name__ = TimedPool.__qualname__ = f"Timed{base.__name__}"
+    return TimedPool
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+def make_engines(name: str, prefix: str, default_url: str) -> Tuple[Engine, AsyncEngine]:
+    """
+    (sync, async) engines for one database. The URL comes from {prefix}_URL (async driver
+    from {prefix}_ASYNC_URL or derived from it), pool settings from pool_options(prefix).
+    """
+    url = _env(prefix, "URL", default_url)
+    options = pool_options(prefix)
+    connect_args = {}
+    if url.startswith("sqlite"):
+        connect_args = {"check_same_thread": False}  #use connections across multiple threads
+    sync_engine = create_engine(url, connect_args=connect_args, poolclass=_timed_pool(QueuePool, name), **options)
+    async_engine = create_async_engine(_env(prefix, "ASYNC_URL", async_url(url)),
+                                       poolclass=_timed_pool(AsyncAdaptedQueuePool, f"{name}_async"), **options)
+    if url.startswith("sqlite"):
+        event.listen(sync_engine, "connect", _sqlite_pragmas)
+        event.listen(async_engine.sync_engine, "connect", _sqlite_pragmas)
+    for engine in (sync_engine, async_engine.sync_engine):
+        event.listen(engine, "before_cursor_execute", count_statement)  #per request totals, see MetricsMiddleware
+    _engines[name] = sync_engine
+    _engines[f"{name}_async"] = async_engine.sync_engine
+    return sync_engine, async_engine
+
+
+def pool_stats() -> Dict[str, dict]:
+    return {name: {"size": e.pool.size(), "checked_out": e.pool.checkedout(), "overflow": max(0, e.pool.overflow()),
+                   "idle": e.pool.checkedin()}
+            for name, e in _engines.items()}
+
+
+register(Gauge("db_pool_connections", "Connections per SQLAlchemy pool by state", ("db", "state"),
+               lambda: {(name, state): value for name, stats in pool_stats().items()
+                        for state, value in stats.items()}))
@@ -0,0 +1,164 @@
+from typing import Dict, List, Tuple
+
+from sqlalchemy import String, and_, bindparam, column, func, or_, select, update, values
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.db_models import RaceDB
+from app.db_models_link_pg import Constructors_All, Drivers_All, ImportProgress
+from app.name_search import search_name
+
+
+def _insert(session: Session, model):
+    """dialect specific INSERT so ON CONFLICT is available on Postgres and SQLite"""
+    dialect = session.get_bind().dialect.name
+    return (sqlite.insert if dialect == "sqlite" else postgresql.insert)(model)
+
+
+def _upsert(session: Session, model, key: Tuple[str, str], rows: List[Dict]) -> Tuple[int, int]:
+    """
+    One INSERT ... ON CONFLICT (key) DO UPDATE executed for all rows of a season.
+    Existing keys are read with a single query first so the caller can report inserted vs updated.
+    """
+    rows = list({(r[key[0]], r[key[1]]): r for r in rows}.values())  #a key may only appear once per statement
+    if not rows:
+        return 0, 0
+    season_col, id_col = getattr(model, key[0]), getattr(model, key[1])
+    seasons = {r[key[0]] for r in rows}
+    existing = set(session.execute(
+        select(season_col, id_col).where(season_col.in_(seasons), id_col.in_({r[key[1]] for r in rows}))
+    ).all())
+    stmt = _insert(session, model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(key),
+        set_={c: stmt.excluded[c] for c in rows[0] if c not in key},
+    )
+    session.execute(stmt, rows)  #executemany, compiled once instead of one VALUES clause per row
+    updated = sum(1 for r in rows if (r[key[0]], r[key[1]]) in existing)
+    return len(rows) - updated, updated
+
+
+def upsert_constructors(session: Session, season: str, constructors: List[Dict]) -> Tuple[int, int]:
+    rows = [dict(season=season, constructorId=c["constructorId"], name=c["name"], nationality=c["nationality"],
+                 url=c.get("url"))
+            for c in constructors]
+    return _upsert(session, Constructors_All, ("season", "constructorId"), rows)
+
+
+def _adopt_legacy_drivers(session: Session, season: str, rows: List[Dict]) -> None:
+    """
+    Rows stored before driverId existed have it NULL. Each takes the driverId of the imported
+    driver with the same permanentNumber (else code, else name), so the upsert updates it instead
+    of inserting a second row. One executemany, only when the season has such rows.
+    """
+    table = Drivers_All.__table__
+    if session.scalar(select(func.count()).where(table.c.season == season, table.c.driverId.is_(None))) == 0:
+        return
+    legacy, existing = table.alias("legacy"), table.alias("existing")
+    first_match = select(func.min(legacy.c.id)).where(
+        legacy.c.season == bindparam("b_season"), legacy.c.driverId.is_(None),
+        or_(legacy.c.permanentNumber == bindparam("b_number"), legacy.c.code == bindparam("b_code"),
+            and_(legacy.c.givenName == bindparam("b_given"), legacy.c.familyName == bindparam("b_family"))),
+    ).scalar_subquery()
+    taken = select(existing.c.id).where(existing.c.season == bindparam("b_season"),
+                                        existing.c.driverId == bindparam("b_driverId")).exists()
+    session.execute(update(table).where(table.c.id == first_match, ~taken).values(driverId=bindparam("b_driverId")), [
+        {"b_season": season, "b_driverId": r["driverId"], "b_number": r["permanentNumber"], "b_code": r["code"],
+         "b_given": r["givenName"], "b_family": r["familyName"]} for r in rows])
+
+
+def upsert_drivers(session: Session, season: str, drivers: List[Dict]) -> Tuple[int, int]:
+    """
+    Keyed on (season, driverId), permanentNumber is an ordinary column that may appear, change or
+    be missing. Rows from before driverId was stored are adopted first (_adopt_legacy_drivers) and
+    numbers still held by another row of the season are released, so the unique
+    (season, permanentNumber) index cannot fail the upsert.
+    """
+    rows = [dict(season=season, driverId=d["driverId"], permanentNumber=d.get("permanentNumber") or None,
+                 givenName=d["givenName"], familyName=d["familyName"], code=d.get("code"),
+                 nationality=d["nationality"], searchName=search_name(d["givenName"], d["familyName"]),
+                 url=d.get("url"), dateOfBirth=d.get("dateOfBirth"))
+            for d in drivers]
+    numbers = set()
+    for r in rows:  #a number given twice in one list only stays on the first driver
+        if r["permanentNumber"] in numbers:
+            r["permanentNumber"] = None
+        elif r["permanentNumber"]:
+            numbers.add(r["permanentNumber"])
+    _adopt_legacy_drivers(session, season, rows)
+    if numbers:
+        session.execute(update(Drivers_All).where(
+            Drivers_All.season == season, Drivers_All.permanentNumber.in_(numbers),
+            or_(Drivers_All.driverId.is_(None), Drivers_All.driverId.not_in({r["driverId"] for r in rows})),
+        ).values(permanentNumber=None))
+    return _upsert(session, Drivers_All, ("season", "driverId"), rows)
+
+
+def upsert_races(session: Session, races: List[Dict]) -> Tuple[int, int]:
+    """Ergast race dicts keyed on (season, round), one statement per season so repeats are no-ops"""
+    rows = [dict(season=r["season"], round=r["round"], raceName=r["raceName"], date=r["date"],
+                 time=r.get("time"), circuit_name=r["Circuit"]["circuitName"],
+                 country=r["Circuit"]["Location"]["country"], circuit_id=r["Circuit"].get("circuitId"),
+                 locality=r["Circuit"]["Location"].get("locality"), lat=r["Circuit"]["Location"].get("lat"),
+                 long=r["Circuit"]["Location"].get("long"), url=r.get("url"), source="ergast")
+            for r in races]
+    inserted = updated = 0
+    for season in sorted({r["season"] for r in rows}):
+        i, u = _upsert(session, RaceDB, ("season", "round"), [r for r in rows if r["season"] == season])
+        inserted += i
+        updated += u
+    return inserted, updated
+
+
+def upsert_progress(session: Session, rows: List[Dict]) -> Tuple[int, int]:
+    """import_progress rows keyed on (resource, season), safe when two workers record the same pair at once"""
+    return _upsert(session, ImportProgress, ("resource", "season"), rows)
+
+
+LINK_BATCH = 1000
+
+
+def standings_links(data: Dict) -> List[Dict]:
+    """{season, driverId, permanentNumber, constructorId} per driver in a driverStandings response"""
+    links = []
+    for standings in data.get("MRData", {}).get("StandingsTable", {}).get("StandingsLists", []):
+        for s in standings.get("DriverStandings", []):
+            driver_info = s.get("Driver", {})
+            constructor_info = s.get("Constructors", [])
+            if not driver_info or not constructor_info or not constructor_info[0].get("constructorId"):
+                continue
+            links.append({"season": standings["season"], "driverId": driver_info.get("driverId"),
+                          "permanentNumber": driver_info.get("permanentNumber"),
+                          "constructorId": constructor_info[0]["constructorId"]})
+    return links
+
+
+def link_driver_constructors(session: Session, links: List[Dict]) -> int:
+    """
+    Sets Drivers_All.constructorId for every {season, permanentNumber, driverId, constructorId} link,
+    matching on permanentNumber or driverId (older seasons have no permanent numbers).
+    Postgres gets one UPDATE ... FROM (VALUES ...) per batch, other backends one executemany.
+    """
+    linked = 0
+    for start in range(0, len(links), LINK_BATCH):
+        batch = links[start:start + LINK_BATCH]
+        if session.get_bind().dialect.name == "postgresql":
+            v = values(column("season", String), column("permanentNumber", String),
+                       column("driverId", String), column("constructorId", String), name="links").data(
+                [(l["season"], l.get("permanentNumber"), l["driverId"], l["constructorId"]) for l in batch])
+            stmt = update(Drivers_All).where(
+                Drivers_All.season == v.c.season,
+                or_(Drivers_All.driverId == v.c.driverId, Drivers_All.permanentNumber == v.c.permanentNumber),
+            ).values(constructorId=v.c.constructorId)
+            linked += session.execute(stmt).rowcount
+        else:
+            stmt = update(Drivers_All.__table__).where(
+                Drivers_All.season == bindparam("b_season"),
+                or_(Drivers_All.driverId == bindparam("b_driverId"),
+                    Drivers_All.permanentNumber == bindparam("b_permanentNumber")),
+            ).values(constructorId=bindparam("b_constructorId"))
+            linked += session.execute(stmt, [
+                {"b_season": l["season"], "b_driverId": l["driverId"],
+                 "b_permanentNumber": l.get("permanentNumber"), "b_constructorId": l["constructorId"]}
+                for l in batch]).rowcount
+    return linked
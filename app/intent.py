@@ -0,0 +1,150 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+from app.pydantic_models import APIIntent
+from app.search import find_driver_id
+
+#most specific first: when a question mentions several endpoints the earliest one here wins
+ENDPOINT_PATTERNS = [
+    ("constructorstanding", r"constructors?'?\s*(?:standings?|championship|titles?|champions?)|teams?'?\s*(?:standings?|titles?)"),
+    ("driverstanding", r"drivers?'?\s*standings?|drivers?'?\s*championship|championship|standings?|points\s+table"
+                       r"|(?:world\s+)?champions?|titles?"),
+    ("pitstop", r"pit\s*-?\s*stops?|pits?"),
+    ("lap", r"lap\s*times?|laps?"),
+    ("qualifying", r"qualifying|quali|pole(?:\s*position)?|grid"),
+    ("sprint", r"sprints?"),
+    ("result", r"results?|winners?|won|win|podiums?|finish(?:ed|ing)?"),
+    ("status", r"status(?:es)?|dnfs?|retire(?:d|ments?)?"),
+    ("circuit", r"circuits?|tracks?|venues?"),
+    ("race", r"races?|grands?\s*prix|gp|schedule|calendar"),
+    ("constructor", r"constructors?|teams?"),
+    ("driver", r"drivers?"),
+    ("season", r"seasons?"),
+]
+PRIORITY = {endpoint: i for i, (endpoint, _) in enumerate(ENDPOINT_PATTERNS)}
+
+#one compiled alternation with a named group per endpoint, matched on word boundaries
+ENDPOINT_RE = re.compile(
+    "|".join(rf"(?P<{endpoint}>\b(?:{pattern})\b)" for endpoint, pattern in ENDPOINT_PATTERNS),
+    re.IGNORECASE,
+)
+SEASON_RE = re.compile(r"\b(19[5-9]\d|20\d\d)\b")
+CURRENT_SEASON_RE = re.compile(r"\b(?:this|current)\s+(?:season|year)\b", re.IGNORECASE)
+#"round 5", "rd 5", "race 5" or "5th race" / "5th round"
+ROUND_RE = re.compile(r"\b(?:round|rd\.?|r|race)\s*#?(\d{1,2})\b"
+                      r"|\b(\d{1,2})(?:st|nd|rd|th)\s+(?:race|round|grand\s+prix|gp)\b", re.IGNORECASE)
+LAST_ROUND_RE = re.compile(r"\b(?:last|latest|most\s+recent)\s+(?:race|round|grand\s+prix|gp)\b", re.IGNORECASE)
+#"Monaco GP", "the british grand prix": up to two words before it, see gp_round
+GP_NAME_RE = re.compile(r"\b([a-z]+(?:\s+[a-z]+)?)\s+(?:grand\s+prix|gp)\b", re.IGNORECASE)
+GP_STOPWORDS = {"the", "a", "this", "that", "last", "latest", "next", "recent", "most", "which", "what", "each",
+                "every", "first", "final", "won", "win", "in", "at", "of"}
+EXPLICIT_ID_RE = re.compile(r"\b(driver|constructor)(?:\s*id)?\s*[:=]\s*([a-z_]+)\b", re.IGNORECASE)
+
+#common names -> Ergast constructorId
+CONSTRUCTOR_ALIASES = {
+    "red bull": "red_bull", "redbull": "red_bull", "ferrari": "ferrari", "mercedes": "mercedes",
+    "mclaren": "mclaren", "williams": "williams", "aston martin": "aston_martin", "alpine": "alpine",
+    "haas": "haas", "sauber": "sauber", "alfa romeo": "alfa", "alphatauri": "alphatauri",
+    "toro rosso": "toro_rosso", "racing point": "racing_point", "renault": "renault", "lotus": "lotus_f1",
+    "force india": "force_india", "brawn": "brawn", "benetton": "benetton", "jordan": "jordan",
+    "tyrrell": "tyrrell", "brabham": "brabham", "toyota": "toyota", "honda": "honda", "bmw sauber": "bmw_sauber",
+}
+CONSTRUCTOR_RE = re.compile(
+    r"\b(" + "|".join(sorted((re.escape(a) for a in CONSTRUCTOR_ALIASES), key=len, reverse=True)) + r")\b",
+    re.IGNORECASE,
+)
+
+#Ergast path segment per endpoint
+ENDPOINT_PATHS = {
+    "season": "seasons", "circuit": "circuits", "race": "races", "constructor": "constructors",
+    "driver": "drivers", "result": "results", "sprint": "sprint", "qualifying": "qualifying",
+    "pitstop": "pitstops", "lap": "laps", "driverstanding": "driverstandings",
+    "constructorstanding": "constructorstandings", "status": "status",
+}
+SEASONLESS = {"season", "circuit", "status"}  #only scoped to a season when the question names one
+NEEDS_ROUND = {"pitstop", "lap"}
+
+
+def named_ids(query: str, season: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    """driverId and constructorId named in `query`, explicit driver=... / constructor=... first"""
+    ids = {kind.lower(): value.lower() for kind, value in EXPLICIT_ID_RE.findall(query)}
+    driver_id = ids.get("driver") or find_driver_id(query, season)
+    constructor_id = ids.get("constructor")
+    if not constructor_id:
+        m = CONSTRUCTOR_RE.search(query)
+        constructor_id = CONSTRUCTOR_ALIASES[m.group(1).lower()] if m else None
+    return driver_id, constructor_id
+
+
+def gp_name(query: str) -> Optional[str]:
+    """'monaco' for "who won the Monaco GP 2019", None when no Grand Prix is named"""
+    for m in GP_NAME_RE.finditer(query):
+        words = [w for w in m.group(1).lower().split() if w not in GP_STOPWORDS]
+        if words:
+            return " ".join(words)
+    return None
+
+
+def gp_round(races: List[Dict], name: str) -> Optional[str]:
+    """round of the one race whose name (else circuit, locality or country) contains `name`"""
+    def unique(rounds: set) -> Optional[str]:
+        return rounds.pop() if len(rounds) == 1 else None
+
+    by_name = {r["round"] for r in races if name in r.get("raceName", "").lower()}
+    if by_name:
+        return unique(by_name)
+    places = {r["round"] for r in races for c in [r.get("Circuit", {})]
+              if name in " ".join([c.get("circuitId", "").replace("_", " "), c.get("circuitName", ""),
+                                   c.get("Location", {}).get("locality", ""),
+                                   c.get("Location", {}).get("country", "")]).lower()}
+    return unique(places)
+
+
+def query_season(query: str) -> Optional[str]:
+    m = SEASON_RE.search(query)
+    return m.group(1) if m else None
+
+
+def route_query(query: str, base_url: str, races: Optional[List[Dict]] = None) -> Optional[APIIntent]:
+    """
+    Picks the most specific endpoint mentioned in `query` and extracts season, round,
+    driverId and constructorId into a parameterized Ergast URL. A named Grand Prix is turned into
+    its round through `races` (the season's race list). None when nothing matched, or when a
+    Grand Prix is named that `races` cannot resolve, the agent answers those.
+    """
+    endpoints = {m.lastgroup for m in ENDPOINT_RE.finditer(query)}
+    if not endpoints:
+        return None
+    endpoint = min(endpoints, key=PRIORITY.__getitem__)
+
+    season = query_season(query)
+    if not season and (CURRENT_SEASON_RE.search(query) or endpoint not in SEASONLESS):
+        season = "current"
+
+    round_ = None
+    m = ROUND_RE.search(query)
+    name = gp_name(query)
+    if m:
+        round_ = m.group(1) or m.group(2)
+    elif name:
+        round_ = gp_round(races or [], name)
+        if round_ is None:
+            return None
+    elif LAST_ROUND_RE.search(query) or endpoint in NEEDS_ROUND:
+        round_ = "last"
+    if round_ and not season:
+        season = "current"
+
+    driver_id, constructor_id = named_ids(query, season)
+
+    parts = [p for p in (season, round_) if p]
+    if driver_id:
+        parts += ["drivers", driver_id]
+    if constructor_id:
+        parts += ["constructors", constructor_id]
+    #/drivers/{id} and /constructors/{id} already are the resource
+    if not (endpoint == "driver" and driver_id) and not (endpoint == "constructor" and constructor_id):
+        parts.append(ENDPOINT_PATHS[endpoint])
+    url = f"{base_url}/" + "/".join(parts) + "/"
+    return APIIntent(endpoint=endpoint, season=season, round=round_, driverId=driver_id,
+                     constructorId=constructor_id, url=url)
@@ -0,0 +1,167 @@
+"""
+Read-through data source for season lists: upstream cache -> local databases -> Ergast API.
+
+A (resource, season) pair is served locally once import_progress marks it complete, ie the whole
+season was stored by the backfill, an import route or an earlier read-through. The current season
+is only trusted for LOCAL_CURRENT_MAX_AGE seconds after it was last stored. Anything else is
+fetched upstream and written back in the background.
+"""
+import asyncio
+import logging
+import os
+from datetime import date, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import Integer, cast, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.backfill import RESOURCES, utcnow
+from app.cache import CACHE_TTL_CURRENT, CACHE_TTL_PAST, LRUCache, driver_query_cache, season_ttl, upstream_cache
+from app.database import AsyncSessionLocal
+from app.database_pg_import import AsyncImportPGSessionLocal
+from app.db_models import RaceDB
+from app.db_models_link_pg import Constructors_All, Drivers_All, ImportProgress
+from app.importer import upsert_constructors, upsert_drivers, upsert_progress, upsert_races
+from app.upstream import BASE_URL, fetch_all
+
+LOCAL_READS = os.getenv("LOCAL_READS", "1") != "0"  #0 = always go upstream, as before
+LOCAL_CURRENT_MAX_AGE = int(os.getenv("LOCAL_CURRENT_MAX_AGE", str(CACHE_TTL_CURRENT)))
+
+_write_backs = set()  #keeps pending write-back tasks referenced until they finish
+_stamps = LRUCache(1024)  #"resource:season" -> stored_at() of a past season, final once written
+
+DRIVER_FIELDS = ["driverId", "permanentNumber", "code", "url", "givenName", "familyName", "dateOfBirth", "nationality"]
+CONSTRUCTOR_FIELDS = ["constructorId", "url", "name", "nationality"]
+
+
+def _compact(row: Dict) -> Dict:
+    """Ergast leaves out missing fields rather than sending null"""
+    return {k: v for k, v in row.items() if v is not None}
+
+
+def _race(r: RaceDB) -> Dict:
+    race = {"season": r.season, "round": r.round, "url": r.url, "raceName": r.raceName, "date": r.date, "time": r.time}
+    if r.circuit_id:
+        race["Circuit"] = {"circuitId": r.circuit_id, "circuitName": r.circuit_name,
+                           "Location": _compact({"lat": r.lat, "long": r.long, "locality": r.locality,
+                                                 "country": r.country})}
+    return _compact(race)
+
+
+def _fresh(progress: Optional[ImportProgress], season: int) -> bool:
+    if progress is None or not progress.complete:
+        return False
+    if season < date.today().year:
+        return True
+    return progress.updated_at is not None and \
+        utcnow() - progress.updated_at < timedelta(seconds=LOCAL_CURRENT_MAX_AGE)
+
+
+async def read_local(resource: str, season: int) -> Optional[List[Dict]]:
+    """the stored season in Ergast shape, None when it is not (or no longer) complete locally"""
+    async with AsyncImportPGSessionLocal() as import_db:
+        progress = await import_db.scalar(select(ImportProgress).where(
+            ImportProgress.resource == resource, ImportProgress.season == str(season)))
+        if not _fresh(progress, season):
+            return None
+        if resource == "drivers":
+            rows = await import_db.scalars(select(Drivers_All).where(Drivers_All.season == str(season))
+                                           .order_by(Drivers_All.id))
+            return [_compact({f: getattr(d, f) for f in DRIVER_FIELDS}) for d in rows]
+        if resource == "constructors":
+            rows = await import_db.scalars(select(Constructors_All).where(Constructors_All.season == str(season))
+                                           .order_by(Constructors_All.id))
+            return [_compact({f: getattr(c, f) for f in CONSTRUCTOR_FIELDS}) for c in rows]
+    async with AsyncSessionLocal() as db:
+        #manual races share the table but are not part of the upstream view
+        rows = await db.scalars(select(RaceDB).where(RaceDB.season == str(season), RaceDB.source == "ergast")
+                                .order_by(cast(RaceDB.round, Integer), RaceDB.id))
+        return [_race(r) for r in rows]
+
+
+async def stored_at(resource: str, season: int) -> Optional[float]:
+    """
+    when (resource, season) was last written, as epoch seconds for Last-Modified. None when it
+    never was or the database is unreachable. Only past seasons are cached, the current one
+    changes under other workers.
+    """
+    key = f"{resource}:{season}"
+    stamp = _stamps.get(key)
+    if stamp is not None:
+        return stamp
+    try:
+        async with AsyncImportPGSessionLocal() as import_db:
+            updated_at = await import_db.scalar(select(ImportProgress.updated_at).where(
+                ImportProgress.resource == resource, ImportProgress.season == str(season)))
+    except (SQLAlchemyError, OSError):
+        return None
+    if updated_at is None:
+        return None
+    stamp = updated_at.replace(tzinfo=timezone.utc).timestamp()
+    if season < date.today().year:
+        _stamps.set(key, stamp, CACHE_TTL_PAST)
+    return stamp
+
+
+async def record_loaded(resource: str, season: int, total: int) -> None:
+    """
+    marks (resource, season) as fully stored, called after a whole season was written.
+    Only bookkeeping: when it fails the season is simply read upstream again.
+    """
+    row = dict(resource=resource, season=str(season), next_offset=total, total=total, complete=True,
+               updated_at=utcnow())
+    try:
+        async with AsyncImportPGSessionLocal() as import_db:
+            await import_db.run_sync(upsert_progress, [row])
+            await import_db.commit()
+    except (SQLAlchemyError, OSError):
+        logging.getLogger(__name__).warning("could not record %s %s as stored", resource, season, exc_info=True)
+
+
+async def write_back(resource: str, season: int, rows: List[Dict]) -> None:
+    """stores a season fetched upstream so the next read is local"""
+    if resource == "races":
+        async with AsyncSessionLocal() as db:
+            await db.run_sync(upsert_races, rows)
+            await db.commit()
+    else:
+        async with AsyncImportPGSessionLocal() as import_db:
+            upsert = upsert_drivers if resource == "drivers" else upsert_constructors
+            await import_db.run_sync(upsert, str(season), rows)
+            await import_db.commit()
+        if resource == "drivers":
+            driver_query_cache.invalidate(season)
+    await record_loaded(resource, season, len(rows))
+
+
+async def _write_back_logged(resource: str, season: int, rows: List[Dict]) -> None:
+    try:
+        await write_back(resource, season, rows)
+    except Exception:
+        logging.getLogger(__name__).exception("write-back of %s %s failed", resource, season)
+
+
+async def load_season(resource: str, season: int) -> List[Dict]:
+    """
+    Full season list for "races", "drivers" or "constructors". The list is cached under the same
+    key fetch_all uses, so callers keying indexes on list identity (app/search.py) keep working.
+    """
+    path, table, list_key = RESOURCES[resource]
+    url = f"{BASE_URL}/{season}/{path}"
+    rows = upstream_cache.get(f"{url}#all")
+    if rows is not None:
+        return rows
+    if LOCAL_READS:
+        try:
+            rows = await read_local(resource, season)
+        except (SQLAlchemyError, OSError):  #a database that is down must not take reads with it
+            logging.getLogger(__name__).warning("local read of %s %s failed, using upstream", resource, season)
+        if rows is not None:
+            upstream_cache.set(f"{url}#all", rows, season_ttl(season))
+            return rows
+    rows = await fetch_all(url, table, list_key, season)
+    if LOCAL_READS and rows:
+        task = asyncio.create_task(_write_back_logged(resource, season, rows))
+        _write_backs.add(task)
+        task.add_done_callback(_write_backs.discard)
+    return rows
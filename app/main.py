@@ -1,40 +1,100 @@
-from fastapi import FastAPI, Request,Query, HTTPException, Depends
-import requests
-from typing import List, Dict
-from difflib import SequenceMatcher
-from app.models import Driver, Race, Constructor, RaceCreate, DriverCreate, AgentQuery
-
-from sqlalchemy.orm import Session
-from app.database import SessionLocal, Base, engine
+import asyncio
+import importlib
+import uuid
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request,Query, HTTPException, Depends, Body, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.middleware.gzip import GZipMiddleware
+import anyio
+import httpx
+from typing import List, Dict, Optional
+from app.models import Driver, DriverMatch, Race, Constructor, RaceCreate, DriverCreate, AgentQuery, \
+    RacePage, RaceRow, DriverPage, RaceBatchItem, DriverBatchItem, BatchResult
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import SessionLocal, AsyncSessionLocal, async_engine
 from app.db_models import RaceDB
 
-from app.database_pg import pg_engine, PGSessionLocal, PgBase
+from app.database_pg import AsyncPGSessionLocal, pg_async_engine
 from app.db_models import DriverDB
 
-from app.database_pg_import import import_engine, ImportPGSessionLocal, ImportBase
-from app.db_models_link_pg import Constructors_All, Drivers_All
-
-from google.adk.agents import Agent
-from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
-from google.adk.events import Event
-
-from app.agents.sub_agents.api_agent.agent import api_agent
-
-
-
-from app.agents.sub_agents.db_agent.agent import db_agent
-
-
-Base.metadata.create_all(bind=engine) #creates table if not already present
-PgBase.metadata.create_all(bind=pg_engine)
-ImportBase.metadata.create_all(bind=import_engine)
-
-app = FastAPI()
-
-BASE_URL = "https://api.jolpi.ca/ergast/f1"
-
-
+from app.database_pg_import import ImportPGSessionLocal, AsyncImportPGSessionLocal, import_async_engine
+from app.db_models_link_pg import Constructors_All, Drivers_All, ImportProgress
+from app.backfill import backfill, RESOURCES
+from app.batch import apply_batch, BATCH_MAX_ITEMS
+from app.importer import upsert_constructors, upsert_drivers, upsert_races, link_driver_constructors, \
+    standings_links
+from app.migrations import init_databases, database_names, DB_INIT_ON_STARTUP
+from app.upstream import BASE_URL, fetch_all, fetch_seasons, close_client
+from app.search import get_index
+from app.local_source import load_season, record_loaded, stored_at
+from app.cache import driver_query_cache
+from app.pagination import keyset_page, stream_rows, EXPORT_MEDIA_TYPES
+from app.mirror import router as mirror_router
+from app.sync import SYNC_ENABLED, router as sync_router, run_scheduler as run_sync_scheduler
+from app.analytics import router as analytics_router
+from app.controller import router as controller_router
+from app.standings import fetch_standings, standing_rows, store_standings, router as standings_router
+from app.agent_pool import AgentPool, AgentBusy, AGENT_WARMUP
+from app.metrics import MetricsMiddleware, render as render_metrics
+from app.conditional import COMPRESS_MIN_SIZE, ConditionalMiddleware, cache_headers
+
+
+
+def _load_api_agent():
+    """ADK and the sub-agents are imported on first use (or by the warm-up), not with this module"""
+    from app.agents.sub_agents.api_agent.agent import api_agent
+    return api_agent
+
+agent_pool = AgentPool(_load_api_agent)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    #SQLite schemas are set up before the first request is accepted. Database servers and the agent
+    #warm-up run in the background so a slow one does not hold up the worker, a database that is
+    #down is only logged
+    startup = []
+    if DB_INIT_ON_STARTUP:
+        await anyio.to_thread.run_sync(init_databases, False, database_names(sqlite=True))
+        remote = database_names(sqlite=False)
+        if remote:
+            startup.append(asyncio.create_task(anyio.to_thread.run_sync(init_databases, False, remote)))
+    if AGENT_WARMUP:
+        startup.append(asyncio.create_task(agent_pool.warm_up()))
+        #pydantic_ai agents behind /agent-api and /agent-db, see app/controller.py
+        startup.append(asyncio.create_task(anyio.to_thread.run_sync(importlib.import_module, "app.service")))
+    if SYNC_ENABLED:
+        startup.append(asyncio.create_task(run_sync_scheduler())) #keeps the current season fresh, see app/sync.py
+    yield
+    for task in startup:
+        task.cancel()
+    await close_client() #pooled upstream client lives for the whole app
+    for async_db in (async_engine, pg_async_engine, import_async_engine):
+        await async_db.dispose()
+
+app = FastAPI(lifespan=lifespan)
+app.include_router(mirror_router)
+app.include_router(sync_router)
+app.include_router(analytics_router)
+app.include_router(standings_router)
+app.include_router(controller_router)
+
+app.add_middleware(ConditionalMiddleware) #innermost, ETags are hashed before compression
+
+#brotli when brotli-asgi is installed (it falls back to gzip for clients without br), plain gzip otherwise
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESS_MIN_SIZE)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_SIZE)
+app.add_middleware(MetricsMiddleware) #outermost, so latency includes compression
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus scrape endpoint, PROFILE_REQUESTS=1 additionally enables ?profile=1 dumps (see app/metrics.py)"""
+    return render_metrics()
 
 @app.get("/")
 def root():
@@ -43,20 +103,13 @@ def root():
 #fetch from API
 
 @app.get("/drivers/{year}",response_model = List[Driver])
-def get_drivers(year: int):
-    url = f"{BASE_URL}/{year}/drivers.json"
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()
-    drivers = data["MRData"]["DriverTable"]["Drivers"]
+async def get_drivers(year: int, response: Response):
+    drivers = await load_season("drivers", year) #local copy when the season is stored, see app/local_source.py
+    cache_headers(response, year, last_modified=await stored_at("drivers", year)) #ETag / 304, see app/conditional.py
     return drivers
 
-def fuzzy_match(a:str,b:str, threshold:float=0.7) -> bool:
-    ratio = SequenceMatcher(None, a.lower(),b.lower()).ratio()
-    return ratio>=threshold
-
 @app.get("/drivers/{year}/filter",response_model = List[Driver])
-def filter_drivers(year:int, request: Request,search: str = Query("",description="Search Term"), 
+async def filter_drivers(year:int, request: Request,search: str = Query("",description="Search Term"), 
                 threshold:float=Query(0.7, ge=0.0, le=1.0),
                 limit:int=Query(20,ge=1), offset: int=Query(0,ge=0),sort_by:str = 
                 Query("familyName"),sort_order: str = Query("asc")) -> List[Dict]:
@@ -68,268 +121,300 @@ def filter_drivers(year:int, request: Request,search: str = Query("",description
         if k not in ["search", "threshold", "limit", "offset", "sort_by", "sort_order"]}
         #because drivers dict dont have values so when used in link it breaks
 
-    url = f"{BASE_URL}/{year}/drivers.json"
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()
-    drivers = data["MRData"]["DriverTable"]["Drivers"]
-
-    for field, value in filters.items():
-        drivers = [d for d in drivers if field in d and fuzzy_match(str(d[field]),value,threshold)]
-
-    if search:
-        search_fields = ["givenName","familyName","code"]
-        drivers = [d for d in drivers if any(fuzzy_match(str(d.get(f,"")),search,threshold) for f in search_fields)]
-    
+    drivers = await load_season("drivers", year)
+    index = get_index(str(year), drivers) #prebuilt per season, see app/search.py
+    drivers = index.filter(filters, search, threshold)
+
     drivers.sort(key = lambda x: x.get(sort_by,""),reverse = (sort_order.lower()=="desc"))
     drivers = drivers[offset:offset+limit]
     return drivers
 
+@app.get("/search/drivers",response_model = List[DriverMatch])
+async def search_drivers(q: str = Query(..., min_length=1, description="Search Term"),
+                season: Optional[int] = Query(None, description="Leave empty to search every season"),
+                top: int = Query(10, ge=1, le=100), threshold: float = Query(0.5, ge=0.0, le=1.0)):
+    if season is None:
+        key = "all"
+        drivers = await fetch_all(f"{BASE_URL}/drivers.json", "DriverTable", "Drivers")
+    else:
+        key = str(season)
+        drivers = await load_season("drivers", season)
+    index = get_index(key, drivers)
+    return [{"score": score, "driver": d} for score, d in index.search(q, top, threshold)]
+
 @app.get("/races/{year}", response_model=List[Race])
-def get_races(year: int):
-    url = f"{BASE_URL}/{year}/races.json"
+async def get_races(year: int, response: Response):
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-    except requests.RequestException as e:
+        races = await load_season("races", year)
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=503, detail = f"Failed to fetch races: {e}")
-    data = response.json()
-    races = data.get("MRData",{}).get("RaceTable",{}).get("Races",[])
+    cache_headers(response, year, last_modified=await stored_at("races", year))
     return races
 
 @app.get("/constructors/{year}",response_model=List[Constructor])
-def get_constructors(year: int):
-    url = f"{BASE_URL}/{year}/constructors.json"
+async def get_constructors(year: int, response: Response):
     try: 
-        response = requests.get(url)
-        response.raise_for_status()
-    except requests.RequestException as e:
+        constructors = await load_season("constructors", year)
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=503,detail=f"Constructor detail not found: {e}")
-    data = response.json()
-    constructors = data["MRData"]["ConstructorTable"]["Constructors"]
+    cache_headers(response, year, last_modified=await stored_at("constructors", year))
     return constructors
 
 #local db
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 #created from API
 @app.post("/races/{year}/store")
-def store_races(year: int, db: Session = Depends(get_db)):
+async def store_races(year: int, db: AsyncSession = Depends(get_db)):
     url = f"{BASE_URL}/{year}/races.json"
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()
-    races = data["MRData"]["RaceTable"]["Races"]
-
-    for r in races:
-        race = RaceDB(
-            season = r["season"],round = r["round"],raceName = r["raceName"],
-            date = r["date"],time = r.get("time"),circuit_name = r["Circuit"]["circuitName"],
-            country = r["Circuit"]["Location"]["country"]
-        )
-        db.add(race)
-    db.commit()
-    return {"status":"success","races_added":len(races)}
+    races = await fetch_all(url, "RaceTable", "Races", year)
+
+    inserted, updated = await db.run_sync(upsert_races, races) #keyed on (season, round), storing twice is a no-op
+    await db.commit()
+    await record_loaded("races", year, len(races))
+    return {"status":"success","races_added":inserted,"races_updated":updated}
+
+@app.post("/races/store")
+async def store_races_range(from_year: int = Query(..., alias="from"), to_year: int = Query(..., alias="to"),
+                db: AsyncSession = Depends(get_db)):
+    if to_year < from_year:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+    seasons = await fetch_seasons("races.json", "RaceTable", "Races", range(from_year, to_year + 1))
+    races = [r for season in seasons for r in season]
+
+    inserted, updated = await db.run_sync(upsert_races, races) #whole range in one transaction
+    await db.commit()
+    for season, season_races in zip(range(from_year, to_year + 1), seasons):
+        await record_loaded("races", season, len(season_races))
+    return {"status":"success","seasons":to_year - from_year + 1,"races_added":inserted,"races_updated":updated}
 
 @app.get("/races/local/{year}",response_model = List[RaceCreate])
-def get_local_races(year: int, db: Session = Depends(get_db)):
-    races = db.query(RaceDB).filter(RaceDB.season == str(year)).all()
+async def get_local_races(year: int, response: Response, db: AsyncSession = Depends(get_db)):
+    races = (await db.scalars(select(RaceDB).where(RaceDB.season == str(year)))).all()
+    cache_headers(response, year, mutable=True) #manual races change it at any time
     return races
 
+@app.get("/races/local/{year}/page",response_model = RacePage)
+async def get_local_races_page(year: int, after: Optional[int] = Query(None, description="next_after from the previous page"),
+                limit: int = Query(100, ge=1, le=1000), db: AsyncSession = Depends(get_db)):
+    races, next_after = await db.run_sync(keyset_page, RaceDB, [RaceDB.season == str(year)], after, limit)
+    return {"items": races, "next_after": next_after}
+
+@app.get("/export/races")
+def export_races(format: str = Query("ndjson", pattern="^(ndjson|csv)$"), season: Optional[int] = None):
+    filters = [RaceDB.season == str(season)] if season is not None else []
+    return StreamingResponse(stream_rows(SessionLocal, RaceDB, filters, format), media_type=EXPORT_MEDIA_TYPES[format])
+
 #manual
-@app.post("/races/manual",response_model = RaceCreate)
-def create_race_manual(race: RaceCreate, db: Session = Depends(get_db)):
+@app.post("/races/manual",response_model = RaceRow)
+async def create_race_manual(race: RaceCreate, db: AsyncSession = Depends(get_db)):
     db_race = RaceDB(**race.model_dump()) #converts pydantic model to dict
     db.add(db_race)
-    db.commit()
-    db.refresh(db_race)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code = 409, detail = "Race already exists for this season and round")
+    await db.refresh(db_race)
     return db_race
 
+@app.post("/races/manual/batch",response_model = BatchResult)
+async def batch_races_manual(items: List[RaceBatchItem] = Body(..., max_length=BATCH_MAX_ITEMS),
+                atomic: bool = Query(False, description="Write nothing when any item fails"),
+                db: AsyncSession = Depends(get_db)):
+    try:
+        results, applied = await db.run_sync(apply_batch, RaceDB, items, ("season", "round"), atomic)
+        await db.commit()
+    except IntegrityError: #eg two rows swapping keys within the batch
+        await db.rollback()
+        raise HTTPException(status_code = 409, detail = "Batch conflicts on season and round, nothing was written")
+    return {"applied": applied, "items": results}
+
 @app.get("/races/manual/{race_id}",response_model = RaceCreate)
-def get_race_manual(race_id: int, db: Session = Depends(get_db)):
-    db_race = db.query(RaceDB).filter(RaceDB.id == race_id).first()
+async def get_race_manual(race_id: int, db: AsyncSession = Depends(get_db)):
+    db_race = await db.get(RaceDB, race_id)
     if not db_race:
         raise HTTPException(status_code = 404, detail = "Race not found")
     return db_race
 
 @app.put("/races/manual/{race_id}",response_model = RaceCreate)
-def update_race_manual(race_id: int, race: RaceCreate, db: Session = Depends(get_db)):
-    db_race = db.query(RaceDB).filter(RaceDB.id == race_id).first()
+async def update_race_manual(race_id: int, race: RaceCreate, db: AsyncSession = Depends(get_db)):
+    db_race = await db.get(RaceDB, race_id)
     if not db_race:
         raise HTTPException(status_code=404, detail = "Race not found")
     for key, value in race.model_dump().items():
         setattr(db_race,key,value)
-    db.commit()
-    db.refresh(db_race)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code = 409, detail = "Race already exists for this season and round")
+    await db.refresh(db_race)
     return db_race
 
 @app.delete("/races/manual/{race_id}")
-def delete_race_manual(race_id: int, db: Session = Depends(get_db)):
-    db_race = db.query(RaceDB).filter(RaceDB.id == race_id).first()
+async def delete_race_manual(race_id: int, db: AsyncSession = Depends(get_db)):
+    db_race = await db.get(RaceDB, race_id)
     if not db_race:
         raise HTTPException(status_code = 404, detail = "Race not found")
-    db.delete(db_race)
-    db.commit()
+    await db.delete(db_race)
+    await db.commit()
     return {"status":"Success","delete_id":race_id}
 
 
 #postgres db
-def get_pg_db():
-    pg_db = PGSessionLocal()
-    try:
+async def get_pg_db():
+    async with AsyncPGSessionLocal() as pg_db:
         yield pg_db
-    finally:
-        pg_db.close()
 
 @app.post("/drivers/manual",response_model = DriverCreate)
-def create_driver(driver: DriverCreate, pg_db: Session = Depends(get_pg_db)):
+async def create_driver(driver: DriverCreate, pg_db: AsyncSession = Depends(get_pg_db)):
     db_driver = DriverDB(**driver.model_dump())
     pg_db.add(db_driver)
-    pg_db.commit()
-    pg_db.refresh(db_driver)
+    await pg_db.commit()
+    await pg_db.refresh(db_driver)
     return db_driver
 
+@app.post("/drivers/manual/batch",response_model = BatchResult)
+async def batch_drivers_manual(items: List[DriverBatchItem] = Body(..., max_length=BATCH_MAX_ITEMS),
+                atomic: bool = Query(False, description="Write nothing when any item fails"),
+                pg_db: AsyncSession = Depends(get_pg_db)):
+    try:
+        results, applied = await pg_db.run_sync(apply_batch, DriverDB, items, ("driverId",), atomic)
+        await pg_db.commit()
+    except IntegrityError:
+        await pg_db.rollback()
+        raise HTTPException(status_code = 409, detail = "Batch conflicts on driverId, nothing was written")
+    return {"applied": applied, "items": results}
+
 @app.get("/drivers/manual/{driver_id}",response_model = DriverCreate)
-def get_driver(driver_id: int, pg_db: Session = Depends(get_pg_db)):
-    db_driver = pg_db.query(DriverDB).filter(DriverDB.id == driver_id).first()
+async def get_driver(driver_id: int, pg_db: AsyncSession = Depends(get_pg_db)):
+    db_driver = await pg_db.get(DriverDB, driver_id)
     if not db_driver:
         raise HTTPException(status_code=404, detail="Driver not found")
     return db_driver
 
 @app.put("/drivers/manual/{driver_id}",response_model = DriverCreate)
-def update_driver(driver_id: int, driver: DriverCreate, pg_db: Session = Depends(get_pg_db)):
-    db_driver = pg_db.query(DriverDB).filter(DriverDB.id == driver_id).first()
+async def update_driver(driver_id: int, driver: DriverCreate, pg_db: AsyncSession = Depends(get_pg_db)):
+    db_driver = await pg_db.get(DriverDB, driver_id)
     if not db_driver:
         raise HTTPException(status_code = 404, detail = "Driver not found")
     for key,value in driver.model_dump().items():
         setattr(db_driver, key, value)
-    pg_db.commit()
-    pg_db.refresh(db_driver)
+    await pg_db.commit()
+    await pg_db.refresh(db_driver)
     return db_driver
 
 @app.delete("/drivers/manual/{driver_id}")
-def delete_driver(driver_id:int, pg_db: Session = Depends(get_pg_db)):
-    db_driver = pg_db.query(DriverDB).filter(DriverDB.id == driver_id).first()
+async def delete_driver(driver_id:int, pg_db: AsyncSession = Depends(get_pg_db)):
+    db_driver = await pg_db.get(DriverDB, driver_id)
     if not db_driver:
         raise HTTPException(status_code = 404, detail = "Driver not found")
-    pg_db.delete(db_driver)
-    pg_db.commit()
+    await pg_db.delete(db_driver)
+    await pg_db.commit()
     return {"status": "Success", "deleted_id": driver_id}
 
 
 #postgres - data stored from api to db
-def get_import_db():
-    import_db = ImportPGSessionLocal()
-    try:
+async def get_import_db():
+    async with AsyncImportPGSessionLocal() as import_db:
         yield import_db
-    finally:
-        import_db.close()
+
+@app.get("/drivers/local/page",response_model = DriverPage)
+async def get_local_drivers_page(season: Optional[int] = None, after: Optional[int] = Query(None, description="next_after from the previous page"),
+                limit: int = Query(100, ge=1, le=1000), import_db: AsyncSession = Depends(get_import_db)):
+    filters = [Drivers_All.season == str(season)] if season is not None else []
+    drivers, next_after = await import_db.run_sync(keyset_page, Drivers_All, filters, after, limit)
+    return {"items": drivers, "next_after": next_after}
+
+@app.get("/export/drivers")
+def export_drivers(format: str = Query("ndjson", pattern="^(ndjson|csv)$"), season: Optional[int] = None):
+    filters = [Drivers_All.season == str(season)] if season is not None else []
+    return StreamingResponse(stream_rows(ImportPGSessionLocal, Drivers_All, filters, format),
+                             media_type=EXPORT_MEDIA_TYPES[format])
 
 @app.post("/constructors/import/{year}")
-def import_constructors(year: int, import_db: Session = Depends(get_import_db)):
+async def import_constructors(year: int, import_db: AsyncSession = Depends(get_import_db)):
     url = f"{BASE_URL}/{year}/constructors.json"
-    response = requests.get(url)
-    response.raise_for_status()
-    constructors = response.json()["MRData"]["ConstructorTable"]["Constructors"]
-    
-    count = 0
-    for c in constructors:
-        existing = import_db.query(Constructors_All).filter(Constructors_All.season == str(year),
-        Constructors_All.constructorId == c["constructorId"]).first()
-        if existing:
-            continue
-
-        db_constructor = Constructors_All(season= str(year), constructorId=c["constructorId"], name = c["name"],
-                                          nationality = c["nationality"])
-        import_db.add(db_constructor)
-        count+=1
-    import_db.commit()
-    return {"status": "success", "constructors_added": count}
+    constructors = await fetch_all(url, "ConstructorTable", "Constructors", year)
+
+    #single INSERT ... ON CONFLICT for the whole season
+    inserted, updated = await import_db.run_sync(upsert_constructors, str(year), constructors)
+    await import_db.commit()
+    await record_loaded("constructors", year, len(constructors))
+    return {"status": "success", "constructors_added": inserted, "constructors_updated": updated}
 
 @app.post("/drivers/import/{year}")
-def import_drivers(year: int, import_db: Session = Depends(get_import_db)):
+async def import_drivers(year: int, import_db: AsyncSession = Depends(get_import_db)):
     url = f"{BASE_URL}/{year}/drivers.json"
-    response = requests.get(url)
-    response.raise_for_status()
-    drivers = response.json()["MRData"]["DriverTable"]["Drivers"]
-
-    count = 0
-    for d in drivers:
-        existing = import_db.query(Drivers_All).filter(Drivers_All.season==str(year),
-        Drivers_All.permanentNumber == d["permanentNumber"]).first()
-        if existing:
-            continue
-        db_driver = Drivers_All(season = str(year), permanentNumber=d["permanentNumber"], givenName = d["givenName"],
-        familyName = d["familyName"], code = d["code"], nationality = d["nationality"])
-        import_db.add(db_driver)
-        count+=1
-    import_db.commit()
-    return {"status": "success", "drivers_added": count}
+    drivers = await fetch_all(url, "DriverTable", "Drivers", year)
+
+    inserted, updated = await import_db.run_sync(upsert_drivers, str(year), drivers)
+    await import_db.commit()
+    await record_loaded("drivers", year, len(drivers))
+    driver_query_cache.invalidate(year)
+    return {"status": "success", "drivers_added": inserted, "drivers_updated": updated}
 
 @app.post("/drivers/link_constructors/{year}")
-def link_constructor(year: int, import_db: Session = Depends(get_import_db)):
-    url = f"{BASE_URL}/{year}/driverStandings.json"
-    response = requests.get(url)
-    response.raise_for_status()
-    data = response.json()
-    standings_lists = data.get("MRData", {}).get("StandingsTable", {}).get("StandingsLists", [])
-    
-    if not standings_lists:
+async def link_constructor(year: int, to_year: Optional[int] = Query(None, alias="to", description="Link every season up to this one"),
+                import_db: AsyncSession = Depends(get_import_db)):
+    if to_year is not None and to_year < year:
+        raise HTTPException(status_code=400, detail="'to' must not be before the year")
+    years = range(year, (to_year or year) + 1)
+    pages = await asyncio.gather(*(fetch_standings(y) for y in years))
+    links = [link for data in pages for link in standings_links(data)]
+
+    if not links:
         return {"status": "failed", "message": "No driver standings found for this year."}
 
-    updated = 0
-    for standings in standings_lists:
-        driver_standings = standings.get("DriverStandings", [])
-        for s in driver_standings:
-            driver_info = s.get("Driver",{})
-            constructor_info = s.get("Constructors",[])
-        
-            if not driver_info or not constructor_info:
-                continue
-        
-            driver_permanent_number = driver_info.get("permanentNumber")
-            constructorId = constructor_info[0].get("constructorId")
-
-            if not driver_permanent_number or not constructorId:
-                continue
-
-            driver = import_db.query(Drivers_All).filter(Drivers_All.season == str(year),
-            Drivers_All.permanentNumber == driver_permanent_number).first()
-
-            if driver:
-                driver.constructorId = constructorId
-                updated+=1
-
-    import_db.commit()
-    return {"status": "success", "drivers_linked": updated}
+    #one bulk UPDATE joined on (season, permanentNumber / driverId) instead of a query per driver
+    updated = await import_db.run_sync(link_driver_constructors, links)
+    for y, data in zip(years, pages): #the standings are at hand, keep the stored ones current as well
+        await import_db.run_sync(store_standings, str(y), standing_rows(data, "driver"))
+    await import_db.commit()
+    for y in years:
+        driver_query_cache.invalidate(y)
+    return {"status": "success", "drivers_linked": updated, "seasons": len(years)}
+
+_backfill_tasks = set() #keeps running backfills referenced until they finish
+
+@app.post("/import/range")
+async def import_range(from_year: int = Query(..., alias="from"), to_year: int = Query(..., alias="to"),
+                resources: str = Query(",".join(RESOURCES), description="Comma separated: races,drivers,constructors"),
+                force: bool = Query(False, description="Reload seasons already marked complete")):
+    selected = [r.strip() for r in resources.split(",") if r.strip()]
+    unknown = [r for r in selected if r not in RESOURCES]
+    if unknown or not selected:
+        raise HTTPException(status_code=400, detail=f"Unknown resources: {unknown}")
+    if to_year < from_year:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+    task = asyncio.create_task(backfill(from_year, to_year, selected, force))
+    _backfill_tasks.add(task)
+    task.add_done_callback(_backfill_tasks.discard)
+    return {"status": "started", "seasons": to_year - from_year + 1, "resources": selected}
+
+@app.get("/import/range")
+async def import_range_status(from_year: int = Query(..., alias="from"), to_year: int = Query(..., alias="to"),
+                import_db: AsyncSession = Depends(get_import_db)):
+    #import_progress also holds the sync lease and standings state, only the backfilled lists count here
+    rows = (await import_db.scalars(select(ImportProgress).where(ImportProgress.resource.in_(list(RESOURCES)),
+        ImportProgress.season >= str(from_year), ImportProgress.season <= str(to_year))
+        .order_by(ImportProgress.season, ImportProgress.resource))).all()
+    return {
+        "running": len(_backfill_tasks),
+        "complete": sum(1 for r in rows if r.complete),
+        "pending": [{"resource": r.resource, "season": r.season, "next_offset": r.next_offset, "total": r.total}
+                    for r in rows if not r.complete],
+    }
 
 @app.post("/ask_agent")
 async def ask_agent(payload: AgentQuery):
-    user_input = payload.query
-    
-    runner = Runner(
-        agent=api_agent,
-        app_name="f1-ergast-agent",
-        session_service=InMemorySessionService()
-    )
-
-    event_data = {
-        "author": "user",
-        "content": {
-            "role": "user",
-            "parts": [
-                {"text": user_input}
-            ]
-        }
-    }
-    event = Event(**event_data)
-
-    response = await runner.run(event)
-    agent_text = response.output_text if hasattr(response, "output_text") else str(response)
-
-    return {"response": agent_text}
+    #reuse the client's conversation when it sends back the session_id from an earlier answer
+    session_id = payload.session_id or uuid.uuid4().hex
+    try:
+        agent_text = await agent_pool.ask(session_id, payload.query)
+    except AgentBusy:
+        raise HTTPException(status_code=503, detail="Agent is busy, retry shortly")
+    return {"response": agent_text, "session_id": session_id}
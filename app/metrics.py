@@ -0,0 +1,210 @@
+import contextvars
+import cProfile
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+#seconds, from a cache hit / free pool slot up to the default 30s pool_timeout
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join('%s="%s"' % (n, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                     for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Histogram:
+    """Prometheus style cumulative histogram with optional labels, no client library needed."""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  #labels -> bucket counts + [sum, count]
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in items:
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-2] + [series[-1]]):
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), labels + (le,))} {count:g}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]:g}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value:g}")
+        return lines
+
+
+class Gauge:
+    """Gauge read at scrape time from a callback returning {label values: value}."""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...], collect: Callable[[], Dict[tuple, float]]):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for labels, value in self.collect().items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value:g}")
+        return lines
+
+
+REGISTRY: list = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def render() -> str:
+    """every registered metric in the Prometheus text exposition format"""
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+@contextmanager
+def timed(histogram: Histogram, *labels: str):
+    """observes the block's duration, the last label is replaced by "error" when it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        histogram.observe(time.perf_counter() - start, *labels[:-1], "error")
+        raise
+    histogram.observe(time.perf_counter() - start, *labels)
+
+
+#filled in by app/engines.py
+db_pool_wait = register(Histogram("db_pool_checkout_wait_seconds",
+                                  "Time spent waiting for a connection from the SQLAlchemy pool", ("db",)))
+
+http_latency = register(Histogram("http_request_duration_seconds", "Request latency by route template",
+                                  ("method", "route", "status")))
+http_sql = register(Histogram("http_request_sql_statements", "SQL statements executed per request",
+                              ("method", "route"), buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)))
+upstream_latency = register(Histogram("upstream_request_duration_seconds",
+                                      "Ergast/jolpica call latency by endpoint and status", ("endpoint", "status")))
+upstream_cache_lookups = register(Counter("upstream_cache_lookups_total", "Upstream cache lookups", ("result",)))
+agent_latency = register(Histogram("agent_call_duration_seconds", "Agent / LLM call latency",
+                                   ("agent", "outcome"), buckets=DEFAULT_BUCKETS + (60.0, 120.0)))
+
+
+#SQL statements of the current request, a one element list so threadpool copies of the context share it
+_sql_count: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("sql_count", default=None)
+
+
+def count_statement(*args) -> None:
+    """before_cursor_execute listener, registered on every engine by app/engines.py"""
+    counter = _sql_count.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+_NUMBERS = re.compile(r"/\d+(?=/|\.json|$)")
+
+
+def endpoint_label(path: str) -> str:
+    """/2024/5/results.json?limit=100 -> /{n}/{n}/results.json, keeps the label set small"""
+    return _NUMBERS.sub("/{n}", path.split("?", 1)[0])
+
+
+#PROFILE_REQUESTS=1 lets a request ask for a cProfile dump with ?profile=1 or an X-Profile: 1 header
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+_profile_lock = threading.Lock()  #only one profiler can be active per process
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and SQL statement count per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = {"code": 500}
+        profile_path = self._profile_path(scope)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if profile_path:
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-profile", profile_path.encode())]
+            await send(message)
+
+        counter = [0]
+        token = _sql_count.set(counter)
+        profiler = cProfile.Profile() if profile_path else None
+        start = time.perf_counter()
+        try:
+            if profiler:
+                profiler.enable()
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(profile_path)
+                _profile_lock.release()
+            elapsed = time.perf_counter() - start
+            _sql_count.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_latency.observe(elapsed, scope["method"], route, str(status["code"]))
+            http_sql.observe(counter[0], scope["method"], route)
+
+    @staticmethod
+    def _profile_path(scope) -> Optional[str]:
+        if not PROFILE_REQUESTS:
+            return None
+        headers = dict(scope.get("headers") or [])
+        if headers.get(b"x-profile") != b"1" and b"profile=1" not in scope.get("query_string", b""):
+            return None
+        if not _profile_lock.acquire(blocking=False):
+            return None  #another request is being profiled
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+        return os.path.join(PROFILE_DIR, f"{int(time.time() * 1000)}_{name}.prof")
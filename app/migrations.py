@@ -0,0 +1,107 @@
+import logging
+import os
+from typing import List, Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from app.name_search import fill_search_names, create_name_index
+
+
+def add_column(table: str, column: str, type_: str):
+    """ADD COLUMN only when missing (SQLite has no ADD COLUMN IF NOT EXISTS)"""
+    def migrate(conn: Connection) -> None:
+        if column not in {c["name"] for c in inspect(conn).get_columns(table)}:
+            conn.execute(text(f'ALTER TABLE {table} ADD COLUMN "{column}" {type_}'))
+    return migrate
+
+
+#idempotent schema changes for tables that create_all won't touch once they exist
+IMPORT_DB_MIGRATIONS = [
+    #drop duplicate rows left by the old per-row imports before adding the unique keys
+    'DELETE FROM constructors WHERE id NOT IN '
+    '(SELECT MIN(id) FROM constructors GROUP BY season, "constructorId")',
+    'DELETE FROM drivers WHERE "permanentNumber" IS NOT NULL AND id NOT IN '
+    '(SELECT MIN(id) FROM drivers WHERE "permanentNumber" IS NOT NULL GROUP BY season, "permanentNumber")',
+    'CREATE UNIQUE INDEX IF NOT EXISTS uq_constructors_season_constructor ON constructors (season, "constructorId")',
+    'CREATE UNIQUE INDEX IF NOT EXISTS uq_drivers_season_number ON drivers (season, "permanentNumber")',
+    add_column("drivers", "driverId", "VARCHAR"),
+    'CREATE INDEX IF NOT EXISTS "ix_drivers_driverId" ON drivers ("driverId")',
+    'CREATE UNIQUE INDEX IF NOT EXISTS uq_drivers_season_driver ON drivers (season, "driverId")',
+    add_column("drivers", "searchName", "VARCHAR"),
+    fill_search_names,
+    create_name_index,
+    add_column("drivers", "url", "VARCHAR"),
+    add_column("drivers", "dateOfBirth", "VARCHAR"),
+    add_column("constructors", "url", "VARCHAR"),
+    add_column("import_progress", "last_round", "INTEGER"),
+    add_column("import_progress", "fetched_at", "TIMESTAMP"),
+    add_column("import_progress", "content_hash", "VARCHAR"),
+]
+
+LOCAL_DB_MIGRATIONS = [
+    #repeated /races/{year}/store calls used to append the same season again
+    'DELETE FROM races WHERE round IS NOT NULL AND id NOT IN '
+    '(SELECT MIN(id) FROM races WHERE round IS NOT NULL GROUP BY season, round)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS uq_races_season_round ON races (season, round)',
+    add_column("races", "circuit_id", "VARCHAR"),
+    add_column("races", "locality", "VARCHAR"),
+    add_column("races", "lat", "VARCHAR"),
+    add_column("races", "long", "VARCHAR"),
+    add_column("races", "url", "VARCHAR"),
+    add_column("races", "source", "VARCHAR"),
+    #rows stored from upstream before the source column, manual races never have a circuit_id
+    "UPDATE races SET source = 'ergast' WHERE source IS NULL AND circuit_id IS NOT NULL",
+]
+
+
+def run_migrations(engine: Engine, statements) -> None:
+    with engine.begin() as conn:
+        for statement in statements:
+            if callable(statement):
+                statement(conn)
+            else:
+                conn.execute(text(statement))
+
+
+def _databases():
+    from app.database import Base, engine
+    from app.database_pg import PgBase, pg_engine
+    from app.database_pg_import import ImportBase, import_engine
+    import app.db_models  #registers RaceDB / DriverDB
+    import app.db_models_link_pg  #registers Constructors_All / Drivers_All / ImportProgress
+
+    return [("local", Base, engine, LOCAL_DB_MIGRATIONS),
+            ("drivers", PgBase, pg_engine, []),
+            ("import", ImportBase, import_engine, IMPORT_DB_MIGRATIONS)]
+
+
+def database_names(sqlite: bool) -> List[str]:
+    """databases that are (or are not) SQLite files, whose schema init is a quick local operation"""
+    return [name for name, _, db_engine, _ in _databases() if (db_engine.dialect.name == "sqlite") == sqlite]
+
+
+def init_databases(raise_errors: bool = True, names: Optional[List[str]] = None) -> None:
+    """
+    create_all + migrations for the local SQLite, drivers and import databases (or only `names`).
+    Runs from the app lifespan (off the event loop) or `python -m app.migrations`, never at import
+    time. With raise_errors=False a database that is down is logged and skipped so the others still init.
+    """
+    for name, base, db_engine, statements in _databases():
+        if names is not None and name not in names:
+            continue
+        try:
+            base.metadata.create_all(bind=db_engine)
+            run_migrations(db_engine, statements)
+        except Exception:
+            if raise_errors:
+                raise
+            logging.getLogger(__name__).exception("schema init failed for the %s database", name)
+
+
+#set DB_INIT_ON_STARTUP=0 when schemas are managed by a deploy step running `python -m app.migrations`
+DB_INIT_ON_STARTUP = os.getenv("DB_INIT_ON_STARTUP", "1") != "0"
+
+
+if __name__ == "__main__":
+    init_databases()
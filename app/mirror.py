@@ -0,0 +1,85 @@
+import json
+import mmap
+import os
+import threading
+import zlib
+from typing import Dict, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Request, Response
+
+#MIRROR_MODE=record stores every upstream response, MIRROR_MODE=replay answers from the store only
+MIRROR_MODE = os.getenv("MIRROR_MODE", "").lower()
+MIRROR_DIR = os.getenv("MIRROR_DIR", "./mirror")
+
+
+class Mirror:
+    """
+    Append-only store of upstream responses: zlib-compressed bodies concatenated in data.bin,
+    and an index.jsonl of {key, offset, length} lines (last line for a key wins).
+    Reads slice a read-only mmap of data.bin.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self.data_path = os.path.join(path, "data.bin")
+        self.index_path = os.path.join(path, "index.jsonl")
+        self.index: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self._mmap: Optional[mmap.mmap] = None
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.index[entry["key"]] = (entry["offset"], entry["length"])
+
+    @staticmethod
+    def key(url: str, base_url: str) -> str:
+        """URLs are stored relative to the upstream base so a recording works behind any BASE_URL"""
+        return url[len(base_url):] if url.startswith(base_url) else url
+
+    def record(self, key: str, body: bytes) -> None:
+        compressed = zlib.compress(body, 6)
+        with self._lock:
+            with open(self.data_path, "ab") as f:
+                offset = f.tell()
+                f.write(compressed)
+            with open(self.index_path, "a") as f:
+                f.write(json.dumps({"key": key, "offset": offset, "length": len(compressed)}) + "\n")
+            self.index[key] = (offset, len(compressed))
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        offset, length = entry
+        with self._lock:
+            if self._mmap is None or len(self._mmap) < offset + length:
+                if self._mmap is not None:
+                    self._mmap.close()
+                with open(self.data_path, "rb") as f:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            compressed = self._mmap[offset:offset + length]
+        return zlib.decompress(compressed)
+
+
+_mirror: Optional[Mirror] = None
+
+
+def get_mirror() -> Optional[Mirror]:
+    global _mirror
+    if _mirror is None and MIRROR_MODE in ("record", "replay"):
+        _mirror = Mirror(MIRROR_DIR)
+    return _mirror
+
+
+router = APIRouter()
+
+#point another instance's ERGAST_BASE_URL at http://<host>/mirror to replay through HTTP
+@router.get("/mirror/{path:path}")
+def serve_mirror(path: str, request: Request):
+    mirror = get_mirror()
+    key = f"/{path}" + (f"?{request.url.query}" if request.url.query else "")
+    body = mirror.get(key) if mirror else None
+    if body is None:
+        raise HTTPException(status_code=404, detail="Not recorded in mirror")
+    return Response(content=body, media_type="application/json")
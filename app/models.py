@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field 
-from typing import Optional
+from typing import List, Literal, Optional
 
 #defines input/output(of how fastapi talks JSON)
 class Driver(BaseModel):
@@ -46,6 +46,10 @@ class Race(BaseModel):
     SprintQualifying: Optional[RaceEvent] = None
     Qualifying: Optional[RaceEvent] = None
 
+class DriverMatch(BaseModel):
+    score: float
+    driver: Driver
+
 class Constructor(BaseModel):
     constructorId: str
     url: str = Field(None)
@@ -61,6 +65,13 @@ class RaceCreate(BaseModel):
     circuit_name: Optional[str] = None
     country: Optional[str] = None
 
+class RaceRow(RaceCreate):
+    id: int
+
+class RacePage(BaseModel):
+    items: List[RaceRow]
+    next_after: Optional[int] = None
+
 class DriverCreate(BaseModel):
     driverId: str
     givenName: str
@@ -69,5 +80,78 @@ class DriverCreate(BaseModel):
     nationality: Optional[str] = None
     dateOfBirth: Optional[str] = None
 
+class DriverRow(BaseModel):
+    id: int
+    season: str
+    driverId: Optional[str] = None
+    permanentNumber: Optional[str] = None
+    givenName: str
+    familyName: str
+    code: Optional[str] = None
+    nationality: Optional[str] = None
+    constructorId: Optional[str] = None
+
+class DriverPage(BaseModel):
+    items: List[DriverRow]
+    next_after: Optional[int] = None
+
+#batch writes, update and delete need the row id, create and update need data
+class RaceBatchItem(BaseModel):
+    op: Literal["create", "update", "delete"] = "create"
+    id: Optional[int] = None
+    data: Optional[RaceCreate] = None
+
+class DriverBatchItem(BaseModel):
+    op: Literal["create", "update", "delete"] = "create"
+    id: Optional[int] = None
+    data: Optional[DriverCreate] = None
+
+class BatchItemResult(BaseModel):
+    index: int
+    op: str
+    status: Literal["created", "updated", "deleted", "invalid", "not_found", "conflict", "skipped"]
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+class BatchResult(BaseModel):
+    applied: bool
+    items: List[BatchItemResult]
+
+#materialized standings and career totals, see app/standings.py
+class DriverStandingRow(BaseModel):
+    season: str
+    round: int
+    driverId: str
+    constructorId: Optional[str] = None
+    position: Optional[int] = None
+    positionText: Optional[str] = None
+    points: float
+    wins: int
+
+class ConstructorStandingRow(BaseModel):
+    season: str
+    round: int
+    constructorId: str
+    position: Optional[int] = None
+    positionText: Optional[str] = None
+    points: float
+    wins: int
+
+class CareerRow(BaseModel):
+    seasons: int
+    points: float
+    wins: int
+    championships: int
+    best_position: Optional[int] = None
+    first_season: str
+    last_season: str
+
+class DriverCareerRow(CareerRow):
+    driverId: str
+
+class ConstructorCareerRow(CareerRow):
+    constructorId: str
+
 class AgentQuery(BaseModel):
     query: str
+    session_id: Optional[str] = None
@@ -0,0 +1,85 @@
+import unicodedata
+from typing import List, Optional
+
+from sqlalchemy import column, func, or_, select, table, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.db_models_link_pg import Drivers_All
+
+drivers_fts = table("drivers_fts", column("rowid")) #SQLite FTS5 shadow of drivers."searchName"
+
+
+def normalize_name(name: str) -> str:
+    """lowercase, accents stripped and whitespace collapsed: "Sergio  Pérez" -> "sergio perez" """
+    decomposed = unicodedata.normalize("NFKD", name or "")
+    return " ".join("".join(c for c in decomposed if not unicodedata.combining(c)).lower().split())
+
+
+def search_name(given_name: Optional[str], family_name: Optional[str]) -> str:
+    return normalize_name(f"{given_name or ''} {family_name or ''}")
+
+
+def search_drivers(session: Session, name: Optional[str] = None, season: Optional[str] = None,
+                   limit: int = 50) -> List[Drivers_All]:
+    """
+    Ranked, accent-insensitive driver lookup on Drivers_All.searchName.
+    Postgres uses the pg_trgm GIN index (substring or word similarity, ranked by word_similarity),
+    SQLite the drivers_fts trigram table (ranked by bm25), anything else a plain substring match.
+    """
+    q = normalize_name(name) if name else ""
+    stmt = select(Drivers_All)
+    if season:
+        stmt = stmt.where(Drivers_All.season == str(season))
+    if not q:
+        return session.scalars(stmt.order_by(Drivers_All.id).limit(limit)).all()
+
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        stmt = stmt.where(or_(Drivers_All.searchName.contains(q, autoescape=True),
+                              text(":q <% drivers.\"searchName\"").bindparams(q=q)))
+        stmt = stmt.order_by(func.word_similarity(q, Drivers_All.searchName).desc(), Drivers_All.id)
+    elif dialect == "sqlite" and len(q) >= 3 and _has_fts(session):
+        phrase = '"' + q.replace('"', '""') + '"'
+        stmt = stmt.join(drivers_fts, drivers_fts.c.rowid == Drivers_All.id).where(
+            text("drivers_fts MATCH :phrase").bindparams(phrase=phrase)).order_by(text("bm25(drivers_fts)"))
+    else:
+        stmt = stmt.where(Drivers_All.searchName.contains(q, autoescape=True)).order_by(Drivers_All.id)
+    return session.scalars(stmt.limit(limit)).all()
+
+
+def _has_fts(session: Session) -> bool:
+    return session.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'drivers_fts'")).first() is not None
+
+
+#migrations, see IMPORT_DB_MIGRATIONS
+def fill_search_names(conn: Connection) -> None:
+    rows = conn.execute(text('SELECT id, "givenName", "familyName" FROM drivers WHERE "searchName" IS NULL')).all()
+    if rows:
+        conn.execute(text('UPDATE drivers SET "searchName" = :name WHERE id = :id'),
+                     [{"id": r[0], "name": search_name(r[1], r[2])} for r in rows])
+
+
+def create_name_index(conn: Connection) -> None:
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_drivers_search_name_trgm '
+                          'ON drivers USING gin ("searchName" gin_trgm_ops)'))
+    elif conn.dialect.name == "sqlite":
+        exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'drivers_fts'")).first()
+        if exists:
+            return
+        #external content FTS5 table with the trigram tokenizer (SQLite 3.34+), kept in sync by triggers
+        conn.execute(text('CREATE VIRTUAL TABLE drivers_fts USING fts5("searchName", content=\'drivers\', '
+                          'content_rowid=\'id\', tokenize=\'trigram\')'))
+        conn.execute(text('CREATE TRIGGER drivers_fts_ai AFTER INSERT ON drivers BEGIN '
+                          'INSERT INTO drivers_fts(rowid, "searchName") VALUES (new.id, new."searchName"); END'))
+        conn.execute(text('CREATE TRIGGER drivers_fts_ad AFTER DELETE ON drivers BEGIN '
+                          'INSERT INTO drivers_fts(drivers_fts, rowid, "searchName") '
+                          'VALUES (\'delete\', old.id, old."searchName"); END'))
+        conn.execute(text('CREATE TRIGGER drivers_fts_au AFTER UPDATE ON drivers BEGIN '
+                          'INSERT INTO drivers_fts(drivers_fts, rowid, "searchName") '
+                          'VALUES (\'delete\', old.id, old."searchName"); '
+                          'INSERT INTO drivers_fts(rowid, "searchName") VALUES (new.id, new."searchName"); END'))
+        conn.execute(text("INSERT INTO drivers_fts(drivers_fts) VALUES ('rebuild')"))
@@ -0,0 +1,51 @@
+import csv
+import io
+import json
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+EXPORT_BATCH = 1000
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def keyset_page(db: Session, model, filters: list, after: Optional[int], limit: int) -> Tuple[List, Optional[int]]:
+    """
+    One page ordered by id, starting after the `after` cursor.
+    Returns (rows, next cursor), the cursor is None on the last page.
+    """
+    query = db.query(model).filter(*filters)
+    if after is not None:
+        query = query.filter(model.id > after)
+    rows = query.order_by(model.id).limit(limit + 1).all()
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1].id
+    return rows, None
+
+
+def stream_rows(session_factory: Callable[[], Session], model, filters: list, fmt: str) -> Iterator[str]:
+    """
+    Yields an NDJSON or CSV export of `model` in id order, EXPORT_BATCH rows per chunk.
+    Rows are read with yield_per and the session lives inside the generator, so memory
+    stays flat whatever the table size.
+    """
+    columns = list(model.__table__.columns)
+    names = [c.name for c in columns]
+    stmt = select(*columns).where(*filters).order_by(model.id).execution_options(yield_per=EXPORT_BATCH)
+    with session_factory() as db:
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        if fmt == "csv":
+            writer.writerow(names)
+        for partition in db.execute(stmt).partitions():
+            for row in partition:
+                if fmt == "csv":
+                    writer.writerow(row)
+                else:
+                    buf.write(json.dumps(dict(zip(names, row))) + "\n")
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        if buf.tell():
+            yield buf.getvalue()
@@ -0,0 +1,80 @@
+from typing import Any, Dict, List, Optional
+
+from app.name_search import normalize_name
+
+#Ergast list keys that hold rows; a row list nested in another (Races -> Results) is trimmed at the innermost level
+ROW_KEYS = {
+    "Seasons", "Circuits", "Races", "Drivers", "Constructors", "Status", "Results", "SprintResults",
+    "QualifyingResults", "Laps", "Timings", "PitStops", "StandingsLists", "DriverStandings", "ConstructorStandings",
+}
+#row lists that can hold other row lists, any other list inside a row (eg the Constructors of a
+#DriverStandings row) is an attribute of that row
+NESTED = {
+    "Races": {"Results", "SprintResults", "QualifyingResults", "Laps", "PitStops"},
+    "StandingsLists": {"DriverStandings", "ConstructorStandings"},
+    "Laps": {"Timings"},
+}
+
+
+def _driver_matches(row: Dict, driver: str) -> bool:
+    d = row.get("Driver", row)
+    return driver in (normalize_name(str(d.get("driverId", ""))), normalize_name(str(d.get("familyName", ""))),
+                      normalize_name(str(d.get("code", ""))))
+
+
+def _has_driver(row: Dict) -> bool:
+    return "driverId" in row or "Driver" in row
+
+
+def _pick(row: Dict, fields: List[str]) -> Dict:
+    """keeps only the dotted paths in `fields`, e.g. ["position", "Driver.familyName"]"""
+    out: Dict[str, Any] = {}
+    for path in fields:
+        src, dst = row, out
+        keys = path.split(".")
+        for key in keys[:-1]:
+            src = src.get(key) if isinstance(src, dict) else None
+            if src is None:
+                break
+            dst = dst.setdefault(key, {})
+        else:
+            if isinstance(src, dict) and keys[-1] in src:
+                dst[keys[-1]] = src[keys[-1]]
+    return out
+
+
+def _is_leaf(key: str, rows: List) -> bool:
+    children = NESTED.get(key)
+    return not children or not any(isinstance(r, dict) and children & r.keys() for r in rows)
+
+
+def _trim(node: Any, fields: Optional[List[str]], driver: Optional[str], top: Optional[int]) -> Any:
+    if isinstance(node, list):
+        return [_trim(item, fields, driver, top) for item in node]
+    if not isinstance(node, dict):
+        return node
+    out = {}
+    for key, value in node.items():
+        if key in ROW_KEYS and isinstance(value, list) and _is_leaf(key, value):
+            rows = value
+            if driver:
+                rows = [r for r in rows if not _has_driver(r) or _driver_matches(r, driver)]
+            if top is not None:
+                rows = rows[:top]
+            if fields:
+                rows = [_pick(r, fields) for r in rows]
+            out[key] = rows
+        else:
+            out[key] = _trim(value, fields, driver, top)
+    return out
+
+
+def project(payload: Dict, fields: Optional[List[str]] = None, driver: Optional[str] = None,
+            top: Optional[int] = None) -> Dict:
+    """
+    Applies a driver filter, a per-list row limit and a field projection to the row lists of an
+    Ergast payload. Returns a new dict, the (cached) input is never modified.
+    """
+    if not fields and not driver and top is None:
+        return payload
+    return _trim(payload, fields, normalize_name(driver) if driver else None, top)
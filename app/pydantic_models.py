@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List,Optional, Dict
+from pydantic import BaseModel, Field
+from typing import List,Optional, Dict, Literal
 
 class DriverDBModel(BaseModel):
     driverId: str
@@ -17,14 +17,29 @@ class DriversInfo(BaseModel):
 class DriverQuery(BaseModel):
     name: str
     season: str
+    #direct: indexed DB lookup only, agent: always ask the LLM, auto: direct first and the agent only if nothing matched
+    mode: Literal["auto", "direct", "agent"] = "auto"
 
 class DriverResult(BaseModel):
     drivers: List[DriverDBModel]
 
 class APIQuery(BaseModel):
     query: str
+    #applied to the upstream payload before it is returned, see app/projection.py
+    fields: Optional[List[str]] = None  #dotted paths kept on each row, eg ["position", "Driver.familyName"]
+    driver: Optional[str] = None  #driverId, family name or code
+    top: Optional[int] = Field(None, ge=1)  #rows kept per list
+
+class APIIntent(BaseModel):
+    endpoint: str
+    season: Optional[str] = None
+    round: Optional[str] = None
+    driverId: Optional[str] = None
+    constructorId: Optional[str] = None
+    url: str
 
 class APIResult(BaseModel):
     endpoint: str
     status: str
-    answer: Dict
\ No newline at end of file
+    answer: Dict
+    url: Optional[str] = None
\ No newline at end of file
@@ -0,0 +1,138 @@
+import re
+from collections import Counter, defaultdict
+from datetime import date
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.cache import LRUCache
+from app.name_search import normalize_name
+
+SEARCH_FIELDS = ["givenName", "familyName", "code"]
+
+
+def trigrams(text: str) -> set:
+    """pg_trgm style trigrams, each word padded with two leading and one trailing space"""
+    grams = set()
+    for word in text.lower().split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def ratio_matches(values: Iterable[Tuple[int, str]], query: str, threshold: float) -> Iterator[Tuple[int, float]]:
+    """
+    Yields (position, ratio) for values whose SequenceMatcher ratio against query is >= threshold.
+    Same result as SequenceMatcher(None, value, query).ratio() per value, but the query side
+    is prepared once and the cheap length / character-count upper bounds reject most values
+    before the full ratio is computed.
+    """
+    sm = SequenceMatcher(None)
+    sm.set_seq2(query)
+    lq = len(query)
+    for pos, value in values:
+        total = len(value) + lq
+        if total and 2.0 * min(len(value), lq) / total < threshold:
+            continue
+        sm.set_seq1(value)
+        if sm.quick_ratio() < threshold:
+            continue
+        ratio = sm.ratio()
+        if ratio >= threshold:
+            yield pos, ratio
+
+
+class DriverIndex:
+    """Prebuilt search structures over one list of Ergast driver dicts."""
+
+    def __init__(self, drivers: List[Dict]):
+        self.drivers = drivers
+        self._columns: Dict[Tuple[str, bool], List[Tuple[int, str]]] = {}
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+        self.names: List[List[str]] = []  #lowercased search values + "given family" per driver
+        for pos, d in enumerate(drivers):
+            values = [str(d.get(f) or "").lower() for f in SEARCH_FIELDS]
+            values.append(f"{values[0]} {values[1]}")
+            self.names.append(values)
+            for gram in trigrams(" ".join(values[:3])):
+                self.postings[gram].append(pos)
+        for f in SEARCH_FIELDS:
+            self.column(f, include_missing=True)
+
+    def column(self, field: str, include_missing: bool = False) -> List[Tuple[int, str]]:
+        """
+        (position, lowercased value) pairs for `field`, built once per field.
+        Drivers without the field are skipped, or scored as "" when include_missing is set.
+        """
+        key = (field, include_missing)
+        col = self._columns.get(key)
+        if col is None:
+            col = [(pos, str(d.get(field, "")).lower()) for pos, d in enumerate(self.drivers)
+                   if include_missing or field in d]
+            self._columns[key] = col
+        return col
+
+    def filter(self, filters: Dict[str, str], search: str, threshold: float) -> List[Dict]:
+        """
+        Drivers matching every field filter and (if given) the search term on any SEARCH_FIELDS,
+        with SequenceMatcher ratio >= threshold, in source order.
+        """
+        keep: Optional[set] = None
+        for field, value in filters.items():
+            matched = {pos for pos, _ in ratio_matches(self.column(field), value.lower(), threshold)}
+            keep = matched if keep is None else keep & matched
+        if search:
+            matched = set()
+            for f in SEARCH_FIELDS:
+                matched.update(pos for pos, _ in ratio_matches(self.column(f, True), search.lower(), threshold))
+            keep = matched if keep is None else keep & matched
+        if keep is None:
+            return list(self.drivers)
+        return [self.drivers[pos] for pos in sorted(keep)]
+
+    def search(self, query: str, top: int = 10, threshold: float = 0.5) -> List[Tuple[float, Dict]]:
+        """top-k ranked matches: trigram overlap picks candidates, SequenceMatcher scores them"""
+        grams = trigrams(query)
+        if not grams:
+            return []
+        overlap = Counter()
+        for gram in grams:
+            overlap.update(self.postings.get(gram, ()))
+        candidates = [pos for pos, _ in overlap.most_common(max(top * 3, 20))]
+        query = query.lower()
+        scores: Dict[int, float] = {}
+        values = ((pos, value) for pos in candidates for value in self.names[pos])
+        for pos, ratio in ratio_matches(values, query, threshold):
+            if ratio > scores.get(pos, 0.0):
+                scores[pos] = ratio
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top]
+        return [(round(score, 4), self.drivers[pos]) for pos, score in ranked]
+
+
+_indexes = LRUCache(maxsize=128)
+
+
+def get_index(key: str, drivers: List[Dict]) -> DriverIndex:
+    """cached index for `key` (season or "all"), rebuilt when the source list changes"""
+    index = _indexes.get(key)
+    if index is None or index.drivers is not drivers:
+        index = DriverIndex(drivers)
+        _indexes.set(key, index, ttl=24 * 3600)
+    return index
+
+
+def find_driver_id(text: str, season=None) -> Optional[str]:
+    """
+    driverId of a driver named in free text (family name or driverId), looked up in an already
+    built index for the season or for all seasons. Never fetches, None when no index is loaded.
+    """
+    words = {w for w in re.findall(r"[a-z_]+", normalize_name(text)) if len(w) > 2}
+    if season == "current":  #indexes are keyed on the year, as built by the season routes
+        season = date.today().year
+    for key in (str(season), "all"):
+        index = _indexes.get(key)
+        if index is None:
+            continue
+        for d in index.drivers:
+            if d.get("driverId") in words or normalize_name(d.get("familyName", "")) in words:
+                return d.get("driverId")
+    return None
@@ -1,45 +1,52 @@
 import json
-from typing import Optional, List
-import httpx
+from datetime import date
+from typing import Optional, List, Dict
 from pydantic_ai import Agent, RunContext
-from sqlalchemy import or_
+import httpx
+from sqlalchemy.exc import SQLAlchemyError
 
 from app.pydantic_models import DriverQuery, DriverResult, DriverDBModel, APIResult
 from app.db_models_link_pg import Drivers_All
-from app.database_pg_import import ImportPGSessionLocal
+from app.database_pg_import import AsyncImportPGSessionLocal
+from app.name_search import search_drivers, normalize_name
+from app.cache import driver_query_cache
+from app.intent import gp_name, query_season, route_query
+from app.local_source import load_season
+from app.metrics import agent_latency, timed
+from app.projection import project
+from app.standings import local_payload
+from app.sync import SYNC_ENABLED, current_season
+from app.upstream import BASE_URL, fetch_json
 
 from dotenv import load_dotenv
 load_dotenv()
 
-driver_agent = Agent(
-    model="gemini-2.5-flash",
-    deps_type=DriverQuery,
-    system_prompt=(
-        "You are a data retrieval agent for Formula 1 driver data.\n"
-        "You have access to a tool called `get_drivers(name, season)`.\n"
-        "You MUST call this tool to fetch data and return it as JSON.\n"
-        "Do not respond in natural language. Only return structured results.\n"
-        "If no drivers match, return an empty list."
-    )
-)
-
-@driver_agent.tool
-async def get_drivers(ctx: RunContext, name: Optional[str] = None, season: Optional[str] = None) -> List[DriverDBModel]:
-    with ImportPGSessionLocal() as session:
-        query = session.query(Drivers_All)
-        filters = []
-        if name:
-            filters.append(
-                or_(
-                    Drivers_All.givenName.ilike(f"%{name}%"),
-                    Drivers_All.familyName.ilike(f"%{name}%")
-                )
+#agents are built on first use so importing this module stays cheap, see get_driver_agent / get_api_agent
+_driver_agent: Optional[Agent] = None
+_api_agent: Optional[Agent] = None
+
+def get_driver_agent() -> Agent:
+    global _driver_agent
+    if _driver_agent is None:
+        _driver_agent = Agent(
+            model="gemini-2.5-flash",
+            deps_type=DriverQuery,
+            tools=[get_drivers],
+            system_prompt=(
+                "You are a data retrieval agent for Formula 1 driver data.\n"
+                "You have access to a tool called `get_drivers(name, season)`.\n"
+                "You MUST call this tool to fetch data and return it as JSON.\n"
+                "Do not respond in natural language. Only return structured results.\n"
+                "If no drivers match, return an empty list."
             )
-        if season:
-            filters.append(Drivers_All.season == str(season))
-        if filters:
-            query = query.filter(*filters)
-        rows = query.all()
+        )
+    return _driver_agent
+
+async def get_drivers(ctx: RunContext, name: Optional[str] = None, season: Optional[str] = None,
+                      limit: int = 50) -> List[DriverDBModel]:
+    async with AsyncImportPGSessionLocal() as session:
+        #indexed, accent-insensitive, see app/name_search.py. run_sync keeps the event loop free while it waits
+        rows = await session.run_sync(search_drivers, name, season, limit)
         return [
             DriverDBModel(
                 driverId=str(d.id),
@@ -53,11 +60,27 @@ async def get_drivers(ctx: RunContext, name: Optional[str] = None, season: Optio
         ]
 
 async def query_driver_data(query: DriverQuery) -> DriverResult:
+    if query.mode == "agent":
+        return await query_driver_agent(query)
+    key = f"{query.mode}:{normalize_name(query.name)}"  #a direct miss must not answer a later auto query
+    version = driver_query_cache.version(query.season)
+    cached = driver_query_cache.get(query.season, key)
+    if cached is not None:
+        return cached
+    #name and season are already structured, a single indexed query answers it without the LLM
+    result = DriverResult(drivers=await get_drivers(None, query.name, query.season))
+    if not result.drivers and query.mode == "auto":
+        result = await query_driver_agent(query)
+    driver_query_cache.set(query.season, key, result, version)
+    return result
+
+async def query_driver_agent(query: DriverQuery) -> DriverResult:
     try:
-        result = await driver_agent.run(
-            f"Find drivers with name='{query.name}' and season='{query.season}'.",
-            deps=query
-        )
+        with timed(agent_latency, "driver_agent", "ok"):
+            result = await get_driver_agent().run(
+                f"Find drivers with name='{query.name}' and season='{query.season}'.",
+                deps=query
+            )
     except Exception as e:
         drivers_list = await get_drivers(None, query.name, query.season)
         return DriverResult(drivers=drivers_list)
@@ -79,86 +102,100 @@ async def query_driver_data(query: DriverQuery) -> DriverResult:
         drivers_list = await get_drivers(None, query.name, query.season)
     return DriverResult(drivers=drivers_list)
 
+AGENT_TOP_ROWS = 20 #rows per list the api_agent tool hands to the LLM
+
+#agent fallback URLs, "current" is resolved by Ergast to the running season
+
 ERGAST_ENDPOINTS = {
-    "season": "https://api.jolpi.ca/ergast/f1/seasons/",
-    "circuit": "https://api.jolpi.ca/ergast/f1/circuits/",
-    "race": "https://api.jolpi.ca/ergast/f1/2025/races/",
-    "constructor": "https://api.jolpi.ca/ergast/f1/2025/constructors/",
-    "driver": "https://api.jolpi.ca/ergast/f1/2025/drivers/",
-    "result": "https://api.jolpi.ca/ergast/f1/2025/results/",
-    "sprint": "https://api.jolpi.ca/ergast/f1/2025/sprint/",
-    "qualifying": "https://api.jolpi.ca/ergast/f1/2025/qualifying/",
-    "pitstop": "https://api.jolpi.ca/ergast/f1/2025/1/pitstops/",
-    "lap": "https://api.jolpi.ca/ergast/f1/2025/1/laps/",
-    "driverstanding": "https://api.jolpi.ca/ergast/f1/2025/driverstandings/",
-    "constructorstanding": "https://api.jolpi.ca/ergast/f1/2025/constructorstandings/",
-    "status": "https://api.jolpi.ca/ergast/f1/status/"
+    "season": f"{BASE_URL}/seasons/",
+    "circuit": f"{BASE_URL}/circuits/",
+    "race": f"{BASE_URL}/current/races/",
+    "constructor": f"{BASE_URL}/current/constructors/",
+    "driver": f"{BASE_URL}/current/drivers/",
+    "result": f"{BASE_URL}/current/results/",
+    "sprint": f"{BASE_URL}/current/sprint/",
+    "qualifying": f"{BASE_URL}/current/qualifying/",
+    "pitstop": f"{BASE_URL}/current/last/pitstops/",
+    "lap": f"{BASE_URL}/current/last/laps/",
+    "driverstanding": f"{BASE_URL}/current/driverstandings/",
+    "constructorstanding": f"{BASE_URL}/current/constructorstandings/",
+    "status": f"{BASE_URL}/status/"
 }
 
 
-api_agent = Agent(
-    model="gemini-2.5-flash",
-    deps_type=str,
-    system_prompt=(
-        "You are an F1 data agent using Ergast API.\n"
-        "You will receive a user question.\n"
-        "Decide which API endpoint (season, circuit, race, constructor, driver, result, sprint, qualifying, pitstop, lap, driverstanding, constructorstanding, status) best answers the query.\n"
-        "Respond ONLY in JSON format: {\"endpoint\": <endpoint>, \"status\": \"success\" or \"fail\", \"answer\": <data>}.\n"
-        "If the query cannot be answered or is invalid, respond politely with status 'fail' and explain in 'answer'."
-    )
-)
-
-@api_agent.tool
-async def fetch_endpoint_data(ctx: RunContext, endpoint: Optional[str] = None) -> dict:
+def get_api_agent() -> Agent:
+    global _api_agent
+    if _api_agent is None:
+        _api_agent = Agent(
+            model="gemini-2.5-flash",
+            deps_type=str,
+            tools=[fetch_endpoint_data],
+            system_prompt=(
+                "You are an F1 data agent using Ergast API.\n"
+                "You will receive a user question.\n"
+                "Decide which API endpoint (season, circuit, race, constructor, driver, result, sprint, qualifying, pitstop, lap, driverstanding, constructorstanding, status) best answers the query.\n"
+                "Respond ONLY in JSON format: {\"endpoint\": <endpoint>, \"status\": \"success\" or \"fail\", \"answer\": <data>}.\n"
+                "If the query cannot be answered or is invalid, respond politely with status 'fail' and explain in 'answer'."
+            )
+        )
+    return _api_agent
+
+async def fetch_endpoint_data(ctx: RunContext, endpoint: Optional[str] = None, driver: Optional[str] = None,
+                              top: Optional[int] = AGENT_TOP_ROWS) -> dict:
     if not endpoint or endpoint not in ERGAST_ENDPOINTS:
         return {"endpoint": endpoint, "status": "fail", "answer": "Invalid endpoint."}
-    
-    url = ERGAST_ENDPOINTS[endpoint]
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.get(url, timeout=10, follow_redirects=True)
-            resp.raise_for_status()
-            data = resp.json()
-            return {"endpoint": endpoint, "status": "success", "answer": data}
-        except Exception as e:
-            return {"endpoint": endpoint, "status": "fail", "answer": f"Failed to fetch data: {str(e)}"}
-
-KEYWORD_ENDPOINT_MAP = {
-    "driver": "driver",
-    "drivers": "driver",
-    "race": "race",
-    "races": "race",
-    "circuit": "circuit",
-    "constructor": "constructor",
-    "result": "result",
-    "sprint": "sprint",
-    "qualifying": "qualifying",
-    "pitstop": "pitstop",
-    "lap": "lap",
-    "driverstanding": "driverstanding",
-    "constructorstanding": "constructorstanding",
-    "season": "season",
-    "status": "status"
-}
+    return await fetch_url_data(endpoint, ERGAST_ENDPOINTS[endpoint], driver=driver, top=top)
+
+async def fetch_url_data(endpoint: str, url: str, season: Optional[str] = None, fields: Optional[List[str]] = None,
+                         driver: Optional[str] = None, top: Optional[int] = None) -> dict:
+    try:
+        data = project(await fetch_json(url, season), fields, driver, top)
+        return {"endpoint": endpoint, "status": "success", "answer": data, "url": url}
+    except Exception as e:
+        return {"endpoint": endpoint, "status": "fail", "answer": f"Failed to fetch data: {str(e)}", "url": url}
+
+def get_endpoint_from_query(query: str) -> Optional[str]:
+    intent = route_query(query, BASE_URL)
+    return intent.endpoint if intent else None
+
+async def local_answer(intent, user_query: str):
+    """standings and career questions are answered from the stored tables when they cover them"""
+    season = int(intent.season) if intent and intent.season and intent.season.isdigit() else None
+    if intent and intent.season == "current" and SYNC_ENABLED:  #kept in step with every new round
+        season = current_season()
+    try:
+        return await local_payload(intent, season, user_query)
+    except (SQLAlchemyError, OSError):  #a database that is down must not take answers with it
+        return None
 
-def get_endpoint_from_query(query: str) -> str:
-    query_lower = query.lower()
-    for keyword, endpoint in KEYWORD_ENDPOINT_MAP.items():
-        if keyword in query_lower:
-            return endpoint
-    return None
-
-async def query_api_data(user_query: str) -> APIResult:
-    # Step 1: Try keyword mapping
-    endpoint = get_endpoint_from_query(user_query)
-    
-    if not endpoint:
+async def gp_races(user_query: str) -> Optional[List[Dict]]:
+    """the season's race list when the question names a Grand Prix, so the router can find its round"""
+    if not gp_name(user_query):
+        return None
+    try:
+        return await load_season("races", int(query_season(user_query) or date.today().year))
+    except (httpx.HTTPError, SQLAlchemyError, OSError):
+        return None  #the router then leaves the question to the agent
+
+async def query_api_data(user_query: str, fields: Optional[List[str]] = None, driver: Optional[str] = None,
+                         top: Optional[int] = None) -> APIResult:
+    # Step 1: compiled router picks the endpoint and fills season/round/driver/constructor into the URL
+    intent = route_query(user_query, BASE_URL, await gp_races(user_query))
+    local = await local_answer(intent, user_query)
+    if local:
+        endpoint, data = local
+        fetch_result = {"endpoint": endpoint, "status": "success", "answer": project(data, fields, driver, top),
+                        "url": intent.url if intent else None}
+    elif intent:
+        fetch_result = await fetch_url_data(intent.endpoint, intent.url, intent.season, fields, driver, top)
+    else:
         # Step 2: fallback to agent
         try:
-            result = await api_agent.run(
-                f"User question: '{user_query}'",
-                deps=user_query
-            )
+            with timed(agent_latency, "api_agent", "ok"):
+                result = await get_api_agent().run(
+                    f"User question: '{user_query}'",
+                    deps=user_query
+                )
             if isinstance(result.output, str):
                 result_json = json.loads(result.output)
             elif isinstance(result.output, dict):
@@ -167,21 +204,17 @@ async def query_api_data(user_query: str) -> APIResult:
                 result_json = {}
             endpoint = result_json.get("endpoint")
         except Exception:
+            endpoint = None
+        if not endpoint:
             return APIResult(
                 endpoint="unknown",
                 status="fail",
                 answer={"message": "Could not determine endpoint from query."}
             )
+        fetch_result = await fetch_url_data(endpoint, ERGAST_ENDPOINTS[endpoint], None, fields, driver, top) \
+            if endpoint in ERGAST_ENDPOINTS else await fetch_endpoint_data(None, endpoint)
 
-    # Step 3: fetch data
-    if endpoint:
-        fetch_result = await fetch_endpoint_data(None, endpoint)
-        if not isinstance(fetch_result.get("answer"), dict):
-            fetch_result["answer"] = {"message": str(fetch_result["answer"])}
-        return APIResult(**fetch_result)
-    else:
-        return APIResult(
-            endpoint="unknown",
-            status="fail",
-            answer={"message": "Could not determine endpoint from query."}
-        )
+    # Step 3: fetched data
+    if not isinstance(fetch_result.get("answer"), dict):
+        fetch_result["answer"] = {"message": str(fetch_result["answer"])}
+    return APIResult(**fetch_result)
@@ -0,0 +1,330 @@
+"""
+Materialized driver / constructor standings per season and career totals in the import database.
+
+Storing a season's standings upserts its rows and then recomputes the career rows of only the
+drivers and constructors in it, so a new round costs one season's rows plus one grouped SELECT.
+The sync scheduler (app/sync.py) stores the current season after every new round, the import
+route and `python -m app.standings --from 1950 --to 2024` fill in past seasons.
+"""
+import argparse
+import asyncio
+import re
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import and_, case, delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.backfill import utcnow
+from app.cache import driver_query_cache
+from app.conditional import cache_headers
+from app.database_pg_import import AsyncImportPGSessionLocal
+from app.db_models_link_pg import ConstructorCareer, ConstructorStanding, Constructors_All, DriverCareer, \
+    DriverStanding, Drivers_All
+from app.importer import _insert, _upsert, link_driver_constructors, standings_links, upsert_progress
+from app.intent import named_ids
+from app.local_source import stored_at
+from app.models import ConstructorCareerRow, ConstructorStandingRow, DriverCareerRow, DriverStandingRow
+from app.name_search import normalize_name
+from app.pydantic_models import APIIntent
+from app.upstream import BASE_URL, PAGE_LIMIT, fetch_page
+
+#kind -> (Ergast path, list key, id key, standing model, career model)
+KINDS = {
+    "driver": ("driverStandings.json", "DriverStandings", "driverId", DriverStanding, DriverCareer),
+    "constructor": ("constructorStandings.json", "ConstructorStandings", "constructorId", ConstructorStanding,
+                    ConstructorCareer),
+}
+CAREER_FIELDS = ("seasons", "points", "wins", "championships", "best_position", "first_season", "last_season")
+#a career question needs both an explicit cue and a stored total, "total pit stops 2021" is not one
+CAREER_RE = re.compile(r"\b(?:career|all[\s-]?time)\b", re.IGNORECASE)
+CAREER_STAT_RE = re.compile(r"\b(?:wins?|victories|points|championships?|titles?|seasons)\b", re.IGNORECASE)
+
+
+def is_career_query(query: str) -> bool:
+    return bool(CAREER_RE.search(query) and CAREER_STAT_RE.search(query))
+
+
+async def fetch_standings(season: int, kind: str = "driver", use_cache: bool = True) -> Dict:
+    """the season's standings payload with every page merged into one StandingsList"""
+    path, list_key = KINDS[kind][:2]
+    url = f"{BASE_URL}/{season}/{path}"
+    data = await fetch_page(url, 0, season, use_cache)
+    lists = data["MRData"]["StandingsTable"].get("StandingsLists", [])
+    total = int(data["MRData"].get("total", 0))
+    if not lists or total <= PAGE_LIMIT:
+        return data
+    rows = list(lists[0][list_key])  #a new list, the cached pages stay as they are
+    for offset in range(PAGE_LIMIT, total, PAGE_LIMIT):
+        page = await fetch_page(url, offset, season, use_cache)
+        for more in page["MRData"]["StandingsTable"].get("StandingsLists", []):
+            rows.extend(more[list_key])
+    return {"MRData": {**data["MRData"], "offset": "0", "limit": str(total),
+                       "StandingsTable": {**data["MRData"]["StandingsTable"], "StandingsLists": [{**lists[0], list_key: rows}]}}}
+
+
+def standing_rows(data: Dict, kind: str) -> List[Dict]:
+    """DriverStanding / ConstructorStanding column dicts from a standings payload"""
+    list_key, id_key = KINDS[kind][1], KINDS[kind][2]
+    rows = []
+    for standings in data.get("MRData", {}).get("StandingsTable", {}).get("StandingsLists", []):
+        for s in standings.get(list_key, []):
+            row = {"season": standings["season"], "round": int(standings["round"]),
+                   "position": int(s["position"]) if s.get("position", "").isdigit() else None,
+                   "positionText": s.get("positionText"), "points": float(s.get("points") or 0),
+                   "wins": int(s.get("wins") or 0)}
+            if kind == "driver":
+                constructors = s.get("Constructors") or [{}]
+                row.update(driverId=s["Driver"]["driverId"], constructorId=constructors[-1].get("constructorId"))
+            else:
+                row[id_key] = s["Constructor"]["constructorId"]
+            rows.append(row)
+    return rows
+
+
+def refresh_careers(session: Session, kind: str, ids) -> int:
+    """recomputes the career rows of `ids` from their stored seasons, one SELECT and one upsert"""
+    id_key, standing, career = KINDS[kind][2:]
+    if not ids:
+        return 0
+    id_col = getattr(standing, id_key)
+    completed = standing.season < str(date.today().year)
+    totals = session.execute(
+        select(id_col, func.count(), func.sum(standing.points), func.sum(standing.wins),
+               func.sum(case((and_(standing.position == 1, completed), 1), else_=0)),
+               func.min(standing.position), func.min(standing.season), func.max(standing.season))
+        .where(id_col.in_(list(ids))).group_by(id_col)).all()
+    gone = set(ids) - {t[0] for t in totals}  #no stored season left
+    if gone:
+        session.execute(delete(career).where(getattr(career, id_key).in_(gone)))
+    if not totals:
+        return 0
+    now = utcnow()
+    rows = [{id_key: t[0], "seasons": t[1], "points": t[2] or 0, "wins": t[3] or 0, "championships": t[4] or 0,
+             "best_position": t[5], "first_season": t[6], "last_season": t[7], "updated_at": now} for t in totals]
+    stmt = _insert(session, career)
+    session.execute(stmt.on_conflict_do_update(index_elements=[id_key],
+                                               set_={c: stmt.excluded[c] for c in rows[0] if c != id_key}), rows)
+    return len(rows)
+
+
+def store_standings(session: Session, season: str, drivers: Optional[List[Dict]] = None,
+                    constructors: Optional[List[Dict]] = None) -> Dict[str, int]:
+    """
+    Brings one season's stored standings in line with standing_rows() output, writing only rows
+    that changed, and refreshes the careers those rows belong to (plus last season's champions,
+    whose title only counts once that season is over). An unchanged season costs one SELECT per
+    kind and writes nothing. A write stamps the "standings" import_progress row, the routes'
+    Last-Modified. The caller commits.
+    """
+    counts = {}
+    written = False
+    for kind, rows in (("driver", drivers), ("constructor", constructors)):
+        if not rows:  #None = not fetched, [] = nothing published (eg constructors before 1958)
+            continue
+        id_key, standing = KINDS[kind][2], KINDS[kind][3]
+        id_col = getattr(standing, id_key)
+        columns = [c for c in rows[0] if c not in ("season", id_key)]
+        stored = {r[0]: tuple(r[1:]) for r in session.execute(
+            select(id_col, *(getattr(standing, c) for c in columns)).where(standing.season == season))}
+        changed = [r for r in rows if stored.get(r[id_key]) != tuple(r[c] for c in columns)]
+        stale = set(stored) - {r[id_key] for r in rows}
+        counts[kind] = len(changed)
+        if not changed and not stale:
+            continue
+        written = True
+        if stale:
+            session.execute(delete(standing).where(standing.season == season, id_col.in_(stale)))
+        _upsert(session, standing, ("season", id_key), changed)
+        champions = set(session.scalars(select(id_col).where(standing.season == str(int(season) - 1),
+                                                              standing.position == 1)))
+        counts[f"{kind}_careers"] = refresh_careers(session, kind, {r[id_key] for r in changed} | stale | champions)
+    if written:
+        upsert_progress(session, [dict(resource="standings", season=season, updated_at=utcnow())])
+    return counts
+
+
+async def import_standings(seasons, use_cache: bool = True) -> Dict[str, int]:
+    """fetches and stores both standings of every season, driver standings also link constructors"""
+    pages = await asyncio.gather(*(fetch_standings(s, kind, use_cache) for s in seasons for kind in KINDS))
+    summary = {"seasons": 0, "driver": 0, "constructor": 0, "linked": 0}
+    async with AsyncImportPGSessionLocal() as import_db:
+        for i, season in enumerate(seasons):
+            drivers, constructors = pages[2 * i], pages[2 * i + 1]
+            driver_rows = standing_rows(drivers, "driver")
+            counts = await import_db.run_sync(store_standings, str(season), driver_rows,
+                                              standing_rows(constructors, "constructor"))
+            summary["linked"] += await import_db.run_sync(link_driver_constructors, standings_links(drivers))
+            summary["seasons"] += bool(driver_rows)
+            summary["driver"] += counts.get("driver", 0)
+            summary["constructor"] += counts.get("constructor", 0)
+        await import_db.commit()
+    for season in seasons:
+        driver_query_cache.invalidate(season)
+    return summary
+
+
+def _points(value: float) -> str:
+    return f"{value:g}"  #Ergast style, "575" / "4.5"
+
+
+async def local_payload(intent: Optional[APIIntent], season: Optional[int], query: str) -> Optional[Tuple[str, Dict]]:
+    """
+    (endpoint, payload) answering an /agent-api question from the stored tables, None when they
+    can't (a standings question about a single round, a season or career that was not stored).
+    Standings come back in the Ergast shape so projection applies as it does upstream.
+    """
+    if is_career_query(query):
+        driver_id, constructor_id = (intent.driverId, intent.constructorId) if intent else named_ids(query)
+        async with AsyncImportPGSessionLocal() as import_db:
+            if not driver_id and not constructor_id:  #a driverId written out, eg "hamilton"
+                words = re.findall(r"[a-z_]+", normalize_name(query))
+                driver_id = await import_db.scalar(select(DriverCareer.driverId).where(DriverCareer.driverId.in_(words)))
+            kind = "driver" if driver_id else "constructor"
+            id_key, career = KINDS[kind][2], KINDS[kind][4]
+            row = await import_db.scalar(select(career).where(getattr(career, id_key) == (driver_id or constructor_id)))
+        if row is not None:
+            return f"{kind}_career", {"Career": {c: getattr(row, c) for c in (id_key, *CAREER_FIELDS)}}
+    if intent is None or intent.endpoint not in ("driverstanding", "constructorstanding") or intent.round or season is None:
+        return None
+    kind = "driver" if intent.endpoint == "driverstanding" else "constructor"
+    list_key, id_key, standing = KINDS[kind][1], KINDS[kind][2], KINDS[kind][3]
+    async with AsyncImportPGSessionLocal() as import_db:
+        if kind == "driver":
+            stmt = select(standing, Drivers_All, Constructors_All) \
+                .outerjoin(Drivers_All, and_(Drivers_All.season == standing.season, Drivers_All.driverId == standing.driverId)) \
+                .outerjoin(Constructors_All, and_(Constructors_All.season == standing.season,
+                                                  Constructors_All.constructorId == standing.constructorId))
+            if intent.driverId:
+                stmt = stmt.where(standing.driverId == intent.driverId)
+        else:
+            stmt = select(standing, Constructors_All).outerjoin(Constructors_All, and_(
+                Constructors_All.season == standing.season, Constructors_All.constructorId == standing.constructorId))
+        if intent.constructorId:
+            stmt = stmt.where(standing.constructorId == intent.constructorId)
+        rows = (await import_db.execute(stmt.where(standing.season == str(season))
+                                        .order_by(standing.position.is_(None), standing.position))).all()
+    if not rows:
+        return None
+    out = []
+    for row in rows:
+        s = row[0]
+        item = {"position": str(s.position) if s.position else None, "positionText": s.positionText,
+                "points": _points(s.points), "wins": str(s.wins)}
+        team = {"constructorId": s.constructorId}
+        if row[-1] is not None:
+            team.update(name=row[-1].name, nationality=row[-1].nationality)
+        if kind == "driver":
+            driver = {"driverId": s.driverId}
+            if row[1] is not None:
+                driver.update({f: getattr(row[1], f) for f in ("permanentNumber", "code", "givenName", "familyName",
+                                                                "dateOfBirth", "nationality") if getattr(row[1], f)})
+            item.update(Driver=driver, Constructors=[team] if s.constructorId else [])
+        else:
+            item["Constructor"] = team
+        out.append({k: v for k, v in item.items() if v is not None})
+    lists = [{"season": str(season), "round": str(rows[0][0].round), list_key: out}]
+    return intent.endpoint, {"MRData": {"total": str(len(out)), "source": "local",
+                                        "StandingsTable": {"season": str(season), "StandingsLists": lists}}}
+
+
+router = APIRouter()
+
+
+async def get_import_db():
+    async with AsyncImportPGSessionLocal() as import_db:
+        yield import_db
+
+
+@router.post("/standings/import/{year}")
+async def standings_import(year: int, to_year: Optional[int] = Query(None, alias="to", description="Store every season up to this one")):
+    if to_year is not None and to_year < year:
+        raise HTTPException(status_code=400, detail="'to' must not be before the year")
+    return {"status": "success", **await import_standings(list(range(year, (to_year or year) + 1)))}
+
+
+@router.get("/standings/drivers/{year}", response_model=List[DriverStandingRow])
+async def driver_standings(year: int, response: Response, limit: int = Query(100, ge=1, le=1000),
+                           import_db: AsyncSession = Depends(get_import_db)):
+    #the sync rewrites the current season, imports any season
+    cache_headers(response, year, mutable=True, last_modified=await stored_at("standings", year))
+    return (await import_db.scalars(select(DriverStanding).where(DriverStanding.season == str(year))
+                                    .order_by(DriverStanding.position.is_(None), DriverStanding.position).limit(limit))).all()
+
+
+@router.get("/standings/drivers/{year}/{driver_id}", response_model=DriverStandingRow)
+async def driver_standing(year: int, driver_id: str, import_db: AsyncSession = Depends(get_import_db)):
+    row = await import_db.scalar(select(DriverStanding).where(DriverStanding.season == str(year),
+                                                              DriverStanding.driverId == driver_id))
+    if row is None:
+        raise HTTPException(status_code=404, detail="No stored standing for this driver and season")
+    return row
+
+
+@router.get("/standings/constructors/{year}", response_model=List[ConstructorStandingRow])
+async def constructor_standings(year: int, response: Response, limit: int = Query(100, ge=1, le=1000),
+                                import_db: AsyncSession = Depends(get_import_db)):
+    cache_headers(response, year, mutable=True, last_modified=await stored_at("standings", year))
+    return (await import_db.scalars(select(ConstructorStanding).where(ConstructorStanding.season == str(year))
+                                    .order_by(ConstructorStanding.position.is_(None), ConstructorStanding.position)
+                                    .limit(limit))).all()
+
+
+@router.get("/standings/constructors/{year}/{constructor_id}", response_model=ConstructorStandingRow)
+async def constructor_standing(year: int, constructor_id: str, import_db: AsyncSession = Depends(get_import_db)):
+    row = await import_db.scalar(select(ConstructorStanding).where(ConstructorStanding.season == str(year),
+                                                                   ConstructorStanding.constructorId == constructor_id))
+    if row is None:
+        raise HTTPException(status_code=404, detail="No stored standing for this constructor and season")
+    return row
+
+
+@router.get("/careers/drivers", response_model=List[DriverCareerRow])
+async def driver_careers(order_by: str = Query("wins", pattern="^(points|wins|championships)$"),
+                         limit: int = Query(20, ge=1, le=1000), import_db: AsyncSession = Depends(get_import_db)):
+    return (await import_db.scalars(select(DriverCareer).order_by(getattr(DriverCareer, order_by).desc()).limit(limit))).all()
+
+
+@router.get("/careers/drivers/{driver_id}", response_model=DriverCareerRow)
+async def driver_career(driver_id: str, import_db: AsyncSession = Depends(get_import_db)):
+    row = await import_db.scalar(select(DriverCareer).where(DriverCareer.driverId == driver_id))
+    if row is None:
+        raise HTTPException(status_code=404, detail="No stored seasons for this driver")
+    return row
+
+
+@router.get("/careers/constructors", response_model=List[ConstructorCareerRow])
+async def constructor_careers(order_by: str = Query("wins", pattern="^(points|wins|championships)$"),
+                              limit: int = Query(20, ge=1, le=1000), import_db: AsyncSession = Depends(get_import_db)):
+    return (await import_db.scalars(select(ConstructorCareer).order_by(getattr(ConstructorCareer, order_by).desc())
+                                    .limit(limit))).all()
+
+
+@router.get("/careers/constructors/{constructor_id}", response_model=ConstructorCareerRow)
+async def constructor_career(constructor_id: str, import_db: AsyncSession = Depends(get_import_db)):
+    row = await import_db.scalar(select(ConstructorCareer).where(ConstructorCareer.constructorId == constructor_id))
+    if row is None:
+        raise HTTPException(status_code=404, detail="No stored seasons for this constructor")
+    return row
+
+
+async def _main(args) -> Dict:
+    from app.upstream import close_client
+    try:
+        return await import_standings(list(range(args.from_year, args.to_year + 1)), use_cache=False)
+    finally:
+        await close_client()
+
+
+if __name__ == "__main__":
+    from app.migrations import init_databases
+
+    parser = argparse.ArgumentParser(description="Store standings and career totals of a range of seasons")
+    parser.add_argument("--from", dest="from_year", type=int, required=True)
+    parser.add_argument("--to", dest="to_year", type=int, required=True)
+    args = parser.parse_args()
+
+    init_databases()
+    print(asyncio.run(_main(args)))
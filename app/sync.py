@@ -0,0 +1,227 @@
+"""
+Background incremental sync of the current season.
+
+Every SYNC_INTERVAL (+- SYNC_JITTER) one worker claims the cycle through a lease row in
+import_progress and asks upstream for the latest completed round, a single small request.
+Standings are re-linked and re-stored (app/standings.py) only after a new round. The races,
+drivers and constructors lists are re-fetched after a new round or once SYNC_LIST_MAX_AGE has
+passed, and written only when their content hash changed. When nothing moved, the stored rows
+are just re-stamped, so reads of the current season stay local (see app/local_source.py).
+Off unless SYNC_ENABLED=1.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Query
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.backfill import RESOURCES, progress_row, utcnow
+from app.cache import driver_query_cache, season_ttl, upstream_cache
+from app.database_pg_import import AsyncImportPGSessionLocal
+from app.db_models_link_pg import ImportProgress
+from app.importer import link_driver_constructors, standings_links
+from app.local_source import write_back
+from app.metrics import Counter, register
+from app.standings import fetch_standings, standing_rows, store_standings
+from app.upstream import BASE_URL, fetch_json, fetch_page
+
+#opt-in, set SYNC_ENABLED=1 on the deployment that should poll upstream (the lease keeps it to one
+#worker per cycle, but every enabled worker still wakes up), dev and test runs stay offline
+SYNC_ENABLED = os.getenv("SYNC_ENABLED", "0") == "1"
+#keep the interval below LOCAL_CURRENT_MAX_AGE, otherwise current season reads drift back upstream
+SYNC_INTERVAL = float(os.getenv("SYNC_INTERVAL", "240"))
+SYNC_JITTER = float(os.getenv("SYNC_JITTER", "0.1"))  #fraction of the interval
+SYNC_INITIAL_DELAY = float(os.getenv("SYNC_INITIAL_DELAY", "30"))
+SYNC_LIST_MAX_AGE = float(os.getenv("SYNC_LIST_MAX_AGE", str(6 * 3600)))
+SYNC_SEASON = os.getenv("SYNC_SEASON")  #defaults to the current year
+
+sync_runs = register(Counter("sync_resource_runs_total", "Background sync outcomes per resource", ("resource", "result")))
+
+
+def current_season() -> int:
+    return int(SYNC_SEASON) if SYNC_SEASON else date.today().year
+
+
+def _jittered(seconds: float) -> float:
+    return max(0.0, seconds * (1 + random.uniform(-SYNC_JITTER, SYNC_JITTER)))
+
+
+def content_hash(rows) -> str:
+    return hashlib.sha256(json.dumps(rows, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+async def _state(resource: str, season: int) -> ImportProgress:
+    async with AsyncImportPGSessionLocal() as import_db:
+        state = await import_db.run_sync(progress_row, resource, str(season))
+        try:
+            await import_db.commit()
+        except IntegrityError:  #another worker created the row first
+            await import_db.rollback()
+            state = await import_db.scalar(select(ImportProgress).where(
+                ImportProgress.resource == resource, ImportProgress.season == str(season)))
+        return state
+
+
+async def _save_state(resource: str, season: int, **values) -> None:
+    async with AsyncImportPGSessionLocal() as import_db:
+        await import_db.execute(update(ImportProgress).where(
+            ImportProgress.resource == resource, ImportProgress.season == str(season)).values(**values))
+        await import_db.commit()
+
+
+async def claim_cycle(season: int) -> bool:
+    """true for the one worker whose conditional UPDATE moved the lease forward"""
+    await _state("sync", season)
+    now = utcnow()
+    async with AsyncImportPGSessionLocal() as import_db:
+        result = await import_db.execute(update(ImportProgress).where(
+            ImportProgress.resource == "sync", ImportProgress.season == str(season),
+            or_(ImportProgress.fetched_at.is_(None),
+                ImportProgress.fetched_at < now - timedelta(seconds=SYNC_INTERVAL / 2))).values(fetched_at=now))
+        await import_db.commit()
+        return result.rowcount == 1
+
+
+async def latest_round(season: int) -> int:
+    """round of the latest race with results, 0 before the first one"""
+    data = await fetch_json(f"{BASE_URL}/{season}/last/results.json?limit=1", season, use_cache=False)
+    races = data.get("MRData", {}).get("RaceTable", {}).get("Races", [])
+    return int(races[0]["round"]) if races else 0
+
+
+async def _fetch_fresh(resource: str, season: int) -> List[Dict]:
+    path, table, list_key = RESOURCES[resource]
+    rows, offset = [], 0
+    while True:
+        data = await fetch_page(f"{BASE_URL}/{season}/{path}", offset, season, use_cache=False)
+        page = data["MRData"][table][list_key]
+        rows.extend(page)
+        offset += len(page)
+        if not page or offset >= int(data["MRData"].get("total", 0)):
+            return rows
+
+
+async def sync_list(resource: str, season: int, round_: int) -> str:
+    """re-fetches one season list and writes it when its content hash changed"""
+    rows = await _fetch_fresh(resource, season)
+    digest = content_hash(rows)
+    state = await _state(resource, season)
+    now = utcnow()
+    if rows and digest != state.content_hash:
+        await write_back(resource, season, rows)  #upserts, marks the season stored
+        upstream_cache.set(f"{BASE_URL}/{season}/{RESOURCES[resource][0]}#all", rows, season_ttl(season))
+        result = "updated"
+    else:
+        result = "unchanged"
+    await _save_state(resource, season, content_hash=digest, fetched_at=now, last_round=round_,
+                      updated_at=now if rows else state.updated_at)
+    return result
+
+
+async def sync_standings(season: int, round_: int) -> str:
+    """re-links drivers to constructors and refreshes the stored standings and careers"""
+    drivers, constructors = await asyncio.gather(fetch_standings(season, "driver", use_cache=False),
+                                                 fetch_standings(season, "constructor", use_cache=False))
+    links = standings_links(drivers)
+    driver_rows, constructor_rows = standing_rows(drivers, "driver"), standing_rows(constructors, "constructor")
+    state = await _state("standings", season)
+    digest = content_hash([links, driver_rows, constructor_rows])
+    if links and digest != state.content_hash:
+        async with AsyncImportPGSessionLocal() as import_db:
+            await import_db.run_sync(link_driver_constructors, links)
+            await import_db.run_sync(store_standings, str(season), driver_rows, constructor_rows)
+            await import_db.commit()
+        driver_query_cache.invalidate(season)
+        result = "updated"
+    else:
+        result = "unchanged"
+    await _save_state("standings", season, content_hash=digest, fetched_at=utcnow(), last_round=round_)
+    return result
+
+
+async def _touch(season: int, resources) -> None:
+    """nothing changed upstream, re-stamp stored lists so local reads keep trusting them"""
+    async with AsyncImportPGSessionLocal() as import_db:
+        await import_db.execute(update(ImportProgress).where(
+            ImportProgress.resource.in_(list(resources)), ImportProgress.season == str(season),
+            ImportProgress.complete.is_(True), ImportProgress.content_hash.is_not(None))
+            .values(updated_at=utcnow()))
+        await import_db.commit()
+
+
+async def sync_season(season: int, force: bool = False) -> Dict:
+    """one sync cycle, returns what was done per resource"""
+    round_ = await latest_round(season)
+    summary: Dict[str, object] = {"season": season, "round": round_}
+    now = utcnow()
+    standings = await _state("standings", season)
+    new_round = force or standings.last_round is None or round_ > standings.last_round
+    untouched = []
+    for resource in RESOURCES:
+        state = await _state(resource, season)
+        stale = state.fetched_at is None or now - state.fetched_at > timedelta(seconds=SYNC_LIST_MAX_AGE)
+        if new_round or stale:
+            summary[resource] = await sync_list(resource, season, round_)
+        else:
+            summary[resource] = "skipped"
+            untouched.append(resource)
+        sync_runs.inc(resource, summary[resource])
+    if new_round and round_:
+        summary["standings"] = await sync_standings(season, round_)
+    else:
+        summary["standings"] = "skipped"
+        if standings.last_round is None:  #no race yet, round 0 is recorded so the next cycle has nothing new
+            await _save_state("standings", season, last_round=round_)
+    sync_runs.inc("standings", summary["standings"])
+    if untouched:
+        await _touch(season, untouched)
+    return summary
+
+
+async def run_scheduler() -> None:
+    """runs until cancelled, started from the app lifespan when SYNC_ENABLED"""
+    log = logging.getLogger(__name__)
+    await asyncio.sleep(_jittered(SYNC_INITIAL_DELAY))
+    while True:
+        season = current_season()
+        try:
+            if await claim_cycle(season):
+                log.info("sync %s", await sync_season(season))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            sync_runs.inc("cycle", "error")
+            log.exception("sync of season %s failed", season)
+        await asyncio.sleep(_jittered(SYNC_INTERVAL))
+
+
+router = APIRouter()
+
+
+@router.get("/sync/status")
+async def sync_status(season: Optional[int] = Query(None, description="Defaults to the synced season")):
+    season = season or current_season()
+    async with AsyncImportPGSessionLocal() as import_db:
+        rows = (await import_db.scalars(select(ImportProgress).where(ImportProgress.season == str(season))
+                                        .order_by(ImportProgress.resource))).all()
+    return {
+        "season": season,
+        "enabled": SYNC_ENABLED,
+        "interval": SYNC_INTERVAL,
+        "resources": [{"resource": r.resource, "last_round": r.last_round, "fetched_at": r.fetched_at,
+                       "updated_at": r.updated_at, "complete": r.complete, "content_hash": r.content_hash}
+                      for r in rows],
+    }
+
+
+@router.post("/sync/run")
+async def sync_now(season: Optional[int] = Query(None, description="Defaults to the synced season"),
+                   force: bool = Query(False, description="Re-fetch every list and the standings")):
+    return await sync_season(season or current_season(), force)
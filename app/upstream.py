@@ -0,0 +1,196 @@
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.cache import CACHE_TTL_PAST, LRUCache, upstream_cache, season_ttl
+from app.metrics import endpoint_label, upstream_cache_lookups, upstream_latency
+from app.mirror import MIRROR_MODE, Mirror, get_mirror
+
+BASE_URL = os.getenv("ERGAST_BASE_URL", "https://api.jolpi.ca/ergast/f1").rstrip("/")
+
+#jolpica allows a burst of 4 requests/second (and 500/hour sustained)
+UPSTREAM_RATE = float(os.getenv("UPSTREAM_RATE", "4"))
+UPSTREAM_BURST = int(os.getenv("UPSTREAM_BURST", "4"))
+#the sustained budget, a second bucket so bulk loads (imports, backfill, columnar ingest) slow down
+#instead of running into 429s. Per process: with several workers give each its share, 0 = no cap
+UPSTREAM_HOURLY = int(os.getenv("UPSTREAM_HOURLY", "500"))
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "3"))
+UPSTREAM_BACKOFF = float(os.getenv("UPSTREAM_BACKOFF", "0.5"))
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "10"))
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "20"))
+PAGE_LIMIT = 100  #largest page jolpica will serve
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Async token bucket, callers wait until a token is available."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+_client: Optional[httpx.AsyncClient] = None
+_bucket: Optional[TokenBucket] = None
+_hourly: Optional[TokenBucket] = None
+_inflight: Dict[str, asyncio.Task] = {}
+#url -> (ETag, Last-Modified, body) of the last 200 that had validators, refetches after the cache
+#entry expired send them and a 304 reuses the body
+_validators = LRUCache()
+
+
+def get_client() -> httpx.AsyncClient:
+    """App-lifetime pooled client, created on first use."""
+    global _client, _bucket, _hourly
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=UPSTREAM_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=UPSTREAM_MAX_CONNECTIONS,
+                                max_keepalive_connections=UPSTREAM_MAX_CONNECTIONS),
+        )
+        _bucket = TokenBucket(UPSTREAM_RATE, UPSTREAM_BURST)
+        _hourly = TokenBucket(UPSTREAM_HOURLY / 3600, UPSTREAM_HOURLY) if UPSTREAM_HOURLY else None
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    _inflight.clear()
+
+
+def _retry_delay(attempt: int, response: Optional[httpx.Response]) -> float:
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+    return UPSTREAM_BACKOFF * (2 ** attempt) * (0.5 + random.random())
+
+
+def _replay(url: str) -> Any:
+    body = get_mirror().get(Mirror.key(url, BASE_URL))
+    if body is None:
+        request = httpx.Request("GET", url)
+        raise httpx.HTTPStatusError("Not recorded in mirror", request=request,
+                                    response=httpx.Response(404, request=request))
+    return json.loads(body)
+
+
+async def _get(url: str) -> Any:
+    if MIRROR_MODE == "replay":
+        return _replay(url)
+    client = get_client()
+    endpoint = endpoint_label(Mirror.key(url, BASE_URL))
+    validator = _validators.get(url)
+    headers = {}
+    if validator is not None:
+        if validator[0]:
+            headers["If-None-Match"] = validator[0]
+        if validator[1]:
+            headers["If-Modified-Since"] = validator[1]
+    for attempt in range(UPSTREAM_RETRIES + 1):
+        if _hourly is not None:
+            await _hourly.acquire()
+        await _bucket.acquire()
+        response = None
+        start = time.perf_counter()
+        try:
+            response = await client.get(url, headers=headers)
+            upstream_latency.observe(time.perf_counter() - start, endpoint, str(response.status_code))
+            if response.status_code == 304 and validator is not None:
+                return validator[2]
+            if response.status_code not in RETRY_STATUSES or attempt == UPSTREAM_RETRIES:
+                response.raise_for_status()
+                if MIRROR_MODE == "record":
+                    get_mirror().record(Mirror.key(url, BASE_URL), response.content)
+                data = response.json()
+                tag, modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+                if tag or modified:
+                    _validators.set(url, (tag, modified, data), CACHE_TTL_PAST)
+                return data
+        except httpx.TransportError:
+            upstream_latency.observe(time.perf_counter() - start, endpoint, "transport_error")
+            if attempt == UPSTREAM_RETRIES:
+                raise
+        await asyncio.sleep(_retry_delay(attempt, response))
+
+
+async def _load(url: str, season: Any, use_cache: bool) -> Any:
+    data = await _get(url)
+    if use_cache:
+        upstream_cache.set(url, data, season_ttl(season))
+    return data
+
+
+async def fetch_json(url: str, season: Any = None, use_cache: bool = True) -> Any:
+    """
+    GET an upstream URL through the cache; concurrent identical misses share one request.
+    use_cache=False is for bulk loads (backfill pages) that would only evict hot entries.
+    """
+    data = upstream_cache.get(url) if use_cache else None
+    if data is not None:
+        upstream_cache_lookups.inc("hit")
+        return data
+    if use_cache:
+        upstream_cache_lookups.inc("miss")
+    task = _inflight.get(url)
+    if task is None:
+        task = asyncio.create_task(_load(url, season, use_cache))
+        _inflight[url] = task
+        task.add_done_callback(lambda _: _inflight.pop(url, None))
+    return await asyncio.shield(task)
+
+
+async def fetch_many(urls: List[Tuple[str, Any]]) -> List[Any]:
+    """Concurrent fetch_json for (url, season) pairs, the token bucket still paces upstream calls."""
+    return await asyncio.gather(*(fetch_json(url, season) for url, season in urls))
+
+
+async def fetch_page(url: str, offset: int, season: Any = None, use_cache: bool = True) -> Any:
+    return await fetch_json(f"{url}?limit={PAGE_LIMIT}&offset={offset}", season, use_cache)
+
+
+async def fetch_all(url: str, table: str, list_key: str, season: Any = None) -> List[Dict]:
+    """Walks limit/offset pages of an Ergast list endpoint, the assembled list is cached as one entry."""
+    key = f"{url}#all"
+    rows = upstream_cache.get(key)
+    if rows is not None:
+        return rows
+    rows, offset = [], 0
+    while True:
+        data = await fetch_page(url, offset, season)
+        page = data["MRData"][table][list_key]
+        rows.extend(page)
+        offset += len(page)
+        if not page or offset >= int(data["MRData"].get("total", 0)):
+            break
+    upstream_cache.set(key, rows, season_ttl(season))
+    return rows
+
+
+async def fetch_seasons(path: str, table: str, list_key: str, seasons) -> List[List[Dict]]:
+    """fetch_all for `{BASE_URL}/{season}/{path}` over several seasons concurrently"""
+    return await asyncio.gather(*(fetch_all(f"{BASE_URL}/{s}/{path}", table, list_key, s) for s in seasons))
@@ -0,0 +1,37 @@
+"""
+Side by side view of two bench/run.py reports.
+
+    python -m bench.compare before.json after.json
+"""
+import json
+import sys
+
+METRICS = [("throughput_rps", True), ("p50_ms", False), ("p99_ms", False), ("queries_per_request", False)]
+
+
+def _change(old, new, higher_is_better: bool) -> str:
+    if not old:
+        return "n/a"
+    pct = (new - old) / old * 100
+    better = pct > 0 if higher_is_better else pct < 0
+    return f"{pct:+.1f}%{' better' if better and abs(pct) >= 5 else ' worse' if abs(pct) >= 5 else ''}"
+
+
+def compare(before: dict, after: dict) -> str:
+    lines = [f"{before.get('commit')} -> {after.get('commit')}"]
+    for name in sorted(set(before["scenarios"]) | set(after["scenarios"])):
+        old, new = before["scenarios"].get(name), after["scenarios"].get(name)
+        if old is None or new is None:
+            lines.append(f"{name}: only in {'after' if old is None else 'before'}")
+            continue
+        lines.append(name)
+        for metric, higher_is_better in METRICS:
+            lines.append(f"  {metric:<22}{old[metric]:>12}{new[metric]:>12}  {_change(old[metric], new[metric], higher_is_better)}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("usage: python -m bench.compare before.json after.json")
+    with open(sys.argv[1]) as f, open(sys.argv[2]) as g:
+        print(compare(json.load(f), json.load(g)))
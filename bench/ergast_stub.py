@@ -0,0 +1,224 @@
+"""
+Local stand-in for the jolpica/Ergast API: deterministic synthetic seasons served with the same
+MRData envelope and limit/offset paging, so benchmarks never touch the real (rate limited) service.
+"""
+import hashlib
+import random
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, List
+
+import uvicorn
+from fastapi import FastAPI, Query, Request, Response
+
+SYLLABLES = ["ver", "sta", "ham", "il", "ton", "lec", "lerc", "nor", "ris", "pi", "as", "tri", "sai", "nz",
+             "al", "on", "so", "rus", "sell", "gas", "ly", "oc", "on", "bot", "tas", "zhou", "mag", "nus"]
+NATIONALITIES = ["British", "Dutch", "Spanish", "Monegasque", "German", "French", "Finnish", "Australian"]
+CONSTRUCTORS = ["red_bull", "ferrari", "mercedes", "mclaren", "aston_martin", "alpine", "williams", "haas",
+                "sauber", "rb"]
+ROUNDS = 24
+
+
+def _name(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+
+
+@lru_cache(maxsize=64)
+def drivers(season: int, count: int) -> List[Dict]:
+    rng = random.Random(season * 7919 + count)
+    rows = []
+    for i in range(count):
+        given, family = _name(rng), _name(rng)
+        rows.append({"driverId": f"{family.lower()}_{i}", "permanentNumber": str(i + 1), "code": family[:3].upper(),
+                     "url": f"http://example.invalid/{family}", "givenName": given, "familyName": family,
+                     "dateOfBirth": f"{1960 + i % 40}-0{1 + i % 9}-1{i % 10}", "nationality": rng.choice(NATIONALITIES)})
+    return rows
+
+
+def constructors() -> List[Dict]:
+    return [{"constructorId": c, "url": f"http://example.invalid/{c}", "name": c.replace("_", " ").title(),
+             "nationality": NATIONALITIES[i % len(NATIONALITIES)]} for i, c in enumerate(CONSTRUCTORS)]
+
+
+def races(season: int) -> List[Dict]:
+    return [{"season": str(season), "round": str(r), "url": f"http://example.invalid/{season}/{r}",
+             "raceName": f"Grand Prix {r}", "date": f"{season}-{3 + r // 3:02d}-{1 + r % 28:02d}", "time": "14:00:00Z",
+             "Circuit": {"circuitId": f"circuit_{r}", "circuitName": f"Circuit {r}",
+                         "Location": {"lat": "0", "long": "0", "locality": f"Town {r}", "country": "Nowhere"}}}
+            for r in range(1, ROUNDS + 1)]
+
+
+GRID = 20
+LAPS = 50
+POINTS = [25, 18, 15, 12, 10, 8, 6, 4, 2, 1]
+SPRINT_POINTS = [8, 7, 6, 5, 4, 3, 2, 1]
+
+
+def _lap_ms(rng: random.Random, round_: int, position: int) -> int:
+    return 80000 + round_ * 500 + position * 60 + int(rng.gauss(0, 400))
+
+
+@lru_cache(maxsize=64)
+def results(season: int, driver_count: int, sprint: bool = False) -> List[tuple]:
+    """(race, result) pairs of the first GRID drivers, every round finishes in a shuffled order"""
+    grid = drivers(season, driver_count)[:GRID]
+    table = SPRINT_POINTS if sprint else POINTS
+    rows = []
+    for race in races(season):
+        if sprint and int(race["round"]) % 4:
+            continue
+        rng = random.Random(season * 1000 + int(race["round"]) + sprint)
+        order = rng.sample(range(len(grid)), len(grid))
+        for position, i in enumerate(order, 1):
+            rows.append((race, {"number": str(i + 1), "position": str(position), "positionText": str(position),
+                                "points": str(table[position - 1] if position <= len(table) else 0),
+                                "Driver": grid[i], "Constructor": constructors()[i // 2 % len(CONSTRUCTORS)],
+                                "grid": str(i + 1), "laps": str(LAPS), "status": "Finished",
+                                "Time": {"millis": str(LAPS * 90000 + position * 1500)},
+                                "FastestLap": {"rank": str(position), "lap": "40", "Time": {"time": f"1:2{position % 10}.123"}}}))
+    return rows
+
+
+@lru_cache(maxsize=256)
+def laps(season: int, round_: int, driver_count: int) -> List[tuple]:
+    race = races(season)[round_ - 1]
+    rng = random.Random(season * 100 + round_)
+    return [(race, {"lap": str(lap), "driverId": d["driverId"], "position": str(p), "time": f"1:{(ms // 1000) - 60:02d}.{ms % 1000:03d}"})
+            for lap in range(1, LAPS + 1) for p, d in enumerate(drivers(season, driver_count)[:GRID], 1)
+            for ms in [_lap_ms(rng, round_, p) + (8000 if lap == 1 else 0)]]
+
+
+@lru_cache(maxsize=256)
+def pitstops(season: int, round_: int, driver_count: int) -> List[tuple]:
+    race = races(season)[round_ - 1]
+    rng = random.Random(season * 100 + round_ + 7)
+    rows = []
+    for d in drivers(season, driver_count)[:GRID]:
+        for stop in range(1, rng.randint(1, 2) + 1):
+            rows.append((race, {"driverId": d["driverId"], "lap": str(stop * 18 + rng.randint(-3, 3)), "stop": str(stop),
+                                "time": "14:30:00", "duration": f"{rng.gauss(22.5, 1.2):.3f}"}))
+    return rows
+
+
+def make_app(driver_count: int, latency: float = 0.0) -> FastAPI:
+    """`latency` seconds are added to every response to mimic the network round trip"""
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def etags(request: Request, call_next):
+        #jolpica style validators, so conditional refetches (app/upstream.py) can be exercised
+        response = await call_next(request)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        tag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if response.status_code == 200 and request.headers.get("if-none-match") == tag:
+            return Response(status_code=304, headers={"ETag": tag})
+        return Response(body, response.status_code, {**response.headers, "ETag": tag})
+
+    def page(table: str, key: str, rows: List[Dict], limit: int, offset: int, **extra) -> Dict:
+        if latency:
+            time.sleep(latency)
+        return {"MRData": {"limit": str(limit), "offset": str(offset), "total": str(len(rows)),
+                           table: {**extra, key: rows[offset:offset + limit]}}}
+
+    @app.get("/ergast/f1/{season}/drivers.json")
+    def season_drivers(season: int, limit: int = Query(30), offset: int = Query(0)):
+        return page("DriverTable", "Drivers", drivers(season, driver_count), limit, offset, season=str(season))
+
+    @app.get("/ergast/f1/drivers.json")
+    def all_drivers(limit: int = Query(30), offset: int = Query(0)):
+        return page("DriverTable", "Drivers", drivers(0, driver_count), limit, offset)
+
+    @app.get("/ergast/f1/{season}/constructors.json")
+    def season_constructors(season: int, limit: int = Query(30), offset: int = Query(0)):
+        return page("ConstructorTable", "Constructors", constructors(), limit, offset, season=str(season))
+
+    @app.get("/ergast/f1/{season}/races.json")
+    def season_races(season: int, limit: int = Query(30), offset: int = Query(0)):
+        return page("RaceTable", "Races", races(season), limit, offset, season=str(season))
+
+    @app.get("/ergast/f1/{season}/driverStandings.json")
+    @app.get("/ergast/f1/{season}/driverstandings.json")
+    def standings(season: int, limit: int = Query(30), offset: int = Query(0)):
+        rows = [{"position": str(i + 1), "points": str(max(0, 400 - i * 10)), "wins": str(max(0, 5 - i)),
+                 "Driver": d, "Constructors": [constructors()[i % len(CONSTRUCTORS)]]}
+                for i, d in enumerate(drivers(season, driver_count))]
+        lists = [{"season": str(season), "round": str(ROUNDS), "DriverStandings": rows[offset:offset + limit]}]
+        return {"MRData": {"limit": str(limit), "offset": str(offset), "total": str(len(rows)),
+                           "StandingsTable": {"season": str(season), "StandingsLists": lists}}}
+
+    @app.get("/ergast/f1/{season}/constructorStandings.json")
+    @app.get("/ergast/f1/{season}/constructorstandings.json")
+    def constructor_standings(season: int, limit: int = Query(30), offset: int = Query(0)):
+        rows = [{"position": str(i + 1), "points": str(max(0, 600 - i * 60)), "wins": str(max(0, 8 - 2 * i)),
+                 "Constructor": c} for i, c in enumerate(constructors())]
+        lists = [{"season": str(season), "round": str(ROUNDS), "ConstructorStandings": rows[offset:offset + limit]}]
+        return {"MRData": {"limit": str(limit), "offset": str(offset), "total": str(len(rows)),
+                           "StandingsTable": {"season": str(season), "StandingsLists": lists}}}
+
+    @app.get("/ergast/f1/{season}/last/results.json")
+    def last_results(season: int, limit: int = Query(30), offset: int = Query(0)):
+        return page("RaceTable", "Races", races(season)[-1:], limit, offset, season=str(season))
+
+    def nested(key: str, rows: List[Dict], limit: int, offset: int) -> Dict:
+        """pages over rows nested in races, like the results, laps and pit stop lists"""
+        if latency:
+            time.sleep(latency)
+        by_round: Dict[str, Dict] = {}
+        for race, row in rows[offset:offset + limit]:
+            by_round.setdefault(race["round"], {**race, key: []})[key].append(row)
+        return {"MRData": {"limit": str(limit), "offset": str(offset), "total": str(len(rows)),
+                           "RaceTable": {"Races": list(by_round.values())}}}
+
+    @app.get("/ergast/f1/{season}/results.json")
+    def season_results(season: int, limit: int = Query(30), offset: int = Query(0)):
+        return nested("Results", results(season, driver_count), limit, offset)
+
+    @app.get("/ergast/f1/{season}/sprint.json")
+    def season_sprints(season: int, limit: int = Query(30), offset: int = Query(0)):
+        return nested("SprintResults", results(season, driver_count, sprint=True), limit, offset)
+
+    @app.get("/ergast/f1/{season}/{round_}/laps.json")
+    def round_laps(season: int, round_: int, limit: int = Query(30), offset: int = Query(0)):
+        data = nested("Timings", laps(season, round_, driver_count), limit, offset)
+        for race in data["MRData"]["RaceTable"]["Races"]:  #Ergast nests timings in laps
+            by_lap: Dict[str, List] = {}
+            for t in race.pop("Timings"):
+                by_lap.setdefault(t.pop("lap"), []).append(t)
+            race["Laps"] = [{"number": n, "Timings": ts} for n, ts in by_lap.items()]
+        return data
+
+    @app.get("/ergast/f1/{season}/{round_}/pitstops.json")
+    def round_pitstops(season: int, round_: int, limit: int = Query(30), offset: int = Query(0)):
+        return nested("PitStops", pitstops(season, round_, driver_count), limit, offset)
+
+    @app.get("/ergast/f1/{path:path}")
+    def anything(path: str, limit: int = Query(30), offset: int = Query(0)):
+        #every other endpoint the agent router can pick, a small generic table
+        return page("StubTable", "Rows", [{"path": path, "n": i} for i in range(50)], limit, offset)
+
+    return app
+
+
+class StubServer:
+    """uvicorn serving the stub on 127.0.0.1 from a daemon thread"""
+
+    def __init__(self, driver_count: int, port: int = 8765, latency: float = 0.0):
+        self.port = port
+        config = uvicorn.Config(make_app(driver_count, latency), host="127.0.0.1", port=port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/ergast/f1"
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(5)
@@ -0,0 +1,277 @@
+"""
+Repeatable benchmark scenarios against the FastAPI app, in process, with the upstream replaced by
+bench/ergast_stub.py and the Gemini agents by a canned stand-in.
+
+    python -m bench.run --out bench_output.json
+    python -m bench.run --scenarios filter_drivers,import_drivers --drivers 2000 --requests 500
+
+Databases default to SQLite files in a temp dir. Export LOCAL_DB_URL / PG_DB_URL / IMPORT_DB_URL
+(see app/engines.py) to run against a local Postgres instead. Results are JSON, compare two runs
+with `python -m bench.compare old.json new.json`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Awaitable, Callable, Dict, List
+
+SEASON = 2024
+ANALYTICS_SEASONS = (2000, 2002)
+
+FILTER_TERMS = ["ver", "hamilton", "lecl", "norris", "sainz", "alonso", "piastri", "russel", "gasly", "ocon"]
+AGENT_QUERIES = [
+    "driver standings 2021", "who won round 5 in 2019", "pit stops round 3 2023", "constructors in 2010",
+    "qualifying results 2022 round 7", "ferrari results 2018", "circuits", "lap times round 2 2021",
+    "tell me something interesting", "what happened in formula one history",  #no endpoint word, agent fallback
+]
+
+
+class StubAgent:
+    """stands in for a pydantic_ai Agent, answers after `latency` seconds with a fixed endpoint"""
+
+    def __init__(self, output: str, latency: float):
+        self.output = output
+        self.latency = latency
+        self.calls = 0
+
+    async def run(self, prompt: str, deps=None):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(output=self.output)
+
+
+def _configure_env(args, tmp: str, base_url: str) -> None:
+    """must run before anything under app/ is imported, settings are read at import time"""
+    os.environ.setdefault("LOCAL_DB_URL", f"sqlite:///{tmp}/races.db")
+    os.environ.setdefault("PG_DB_URL", f"sqlite:///{tmp}/drivers.db")
+    os.environ.setdefault("IMPORT_DB_URL", f"sqlite:///{tmp}/import.db")
+    os.environ["ERGAST_BASE_URL"] = base_url
+    os.environ["UPSTREAM_RATE"] = "1000000"  #the stub has no rate limit, don't measure the token bucket
+    os.environ["UPSTREAM_BURST"] = "1000000"
+    os.environ["UPSTREAM_HOURLY"] = "0"
+    os.environ["DB_INIT_ON_STARTUP"] = "0"
+    os.environ["AGENT_WARMUP"] = "0"
+    os.environ["SYNC_ENABLED"] = "0"
+    os.environ["COLUMNAR_DIR"] = f"{tmp}/columnar"
+    os.environ.pop("UPSTREAM_CACHE_DISK_PATH", None)
+    os.environ.pop("MIRROR_MODE", None)
+
+
+class QueryCounter:
+    """counts statements sent to any of the app's engines"""
+
+    def __init__(self):
+        from sqlalchemy import event
+        from app.engines import _engines
+
+        self.count = 0
+        for engine in _engines.values():
+            event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args) -> None:
+        self.count += 1
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def run_scenario(step: Callable[[int], Awaitable[bool]], requests: int, concurrency: int,
+                       counter: QueryCounter) -> Dict:
+    """runs step(0..requests-1) on `concurrency` workers, step returns False on a failed request"""
+    latencies: List[float] = []
+    errors = 0
+    indexes = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in indexes:
+            start = time.perf_counter()
+            try:
+                ok = await step(i)
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += 0 if ok else 1
+
+    queries_before = counter.count
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    queries = counter.count - queries_before
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "throughput_rps": round(requests / elapsed, 2) if elapsed else None,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        "queries": queries,
+        "queries_per_request": round(queries / requests, 2) if requests else 0,
+    }
+
+
+def scenarios(client, service) -> Dict[str, Callable[[int], Awaitable[bool]]]:
+    async def ok(request) -> bool:
+        response = await request
+        return response.status_code < 400
+
+    async def filter_drivers(i):
+        term = FILTER_TERMS[i % len(FILTER_TERMS)]
+        return await ok(client.get(f"/drivers/{SEASON}/filter", params={"search": term, "threshold": 0.6}))
+
+    async def search_drivers(i):
+        term = FILTER_TERMS[i % len(FILTER_TERMS)]
+        return await ok(client.get("/search/drivers", params={"q": term, "season": SEASON}))
+
+    async def import_drivers(i):
+        return await ok(client.post(f"/drivers/import/{2000 + i % 20}"))
+
+    async def import_constructors(i):
+        return await ok(client.post(f"/constructors/import/{2000 + i % 20}"))
+
+    async def store_races(i):
+        return await ok(client.post(f"/races/{2000 + i % 20}/store"))
+
+    async def link_constructors(i):
+        return await ok(client.post(f"/drivers/link_constructors/{2000 + i % 20}"))
+
+    async def crud_mix(i):
+        #one create, read, update and delete of a manual race per iteration
+        race = {"season": "1900", "round": str(100000 + i), "raceName": "Bench GP", "date": "1900-01-01"}
+        created = await client.post("/races/manual", json=race)
+        if created.status_code >= 400:
+            return False
+        race_id = created.json()["id"]
+        listed = await client.get("/races/local/1900/page", params={"limit": 10})
+        got = await client.get(f"/races/manual/{race_id}")
+        updated = await client.put(f"/races/manual/{race_id}", json={**race, "raceName": "Bench GP 2"})
+        deleted = await client.delete(f"/races/manual/{race_id}")
+        return all(r.status_code < 400 for r in (listed, got, updated, deleted))
+
+    async def crud_batch(i):
+        items = [{"data": {"season": "1901", "round": str(i * 100 + n), "raceName": "Batch GP", "date": "1901-01-01"}}
+                 for n in range(100)]
+        created = await client.post("/races/manual/batch", json=items)
+        if created.status_code >= 400:
+            return False
+        ids = [item["id"] for item in created.json()["items"] if item["status"] == "created"]
+        deleted = await client.post("/races/manual/batch", json=[{"op": "delete", "id": rid} for rid in ids])
+        return deleted.status_code < 400
+
+    async def analytics(i):
+        #ANALYTICS_SEASONS are ingested before the scenario runs, see _run
+        params = {"from": ANALYTICS_SEASONS[0], "to": ANALYTICS_SEASONS[-1]}
+        path = ["/analytics/lap-pace", "/analytics/pitstops", "/analytics/points"][i % 3]
+        return await ok(client.get(path, params=params))
+
+    async def agent_routing(i):
+        result = await service.query_api_data(AGENT_QUERIES[i % len(AGENT_QUERIES)], top=5)
+        return result.status == "success"
+
+    return {
+        "filter_drivers": filter_drivers,
+        "search_drivers": search_drivers,
+        "import_drivers": import_drivers,
+        "import_constructors": import_constructors,
+        "store_races": store_races,
+        "link_constructors": link_constructors,
+        "crud_mix": crud_mix,
+        "crud_batch": crud_batch,
+        "analytics": analytics,
+        "agent_routing": agent_routing,
+    }
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def _run(args) -> Dict:
+    import httpx
+    import app.service as service
+    from app.main import app
+    from app.migrations import init_databases
+
+    init_databases()
+    counter = QueryCounter()
+    service._api_agent = StubAgent(json.dumps({"endpoint": "season"}), args.agent_latency)
+    service._driver_agent = StubAgent(json.dumps({"get_drivers_response": []}), args.agent_latency)
+
+    selected = args.scenarios.split(",") if args.scenarios else None
+    if selected is None or "analytics" in selected:
+        from app.columnar import ingest, np
+        if np is None:
+            print("numpy is not installed, skipping analytics", file=sys.stderr)
+            selected = [name for name in (selected or scenarios(None, service)) if name != "analytics"]
+        else:
+            print(f"analytics ingest: {await ingest(*ANALYTICS_SEASONS)}", file=sys.stderr)
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            steps = scenarios(client, service)
+            for name, step in steps.items():
+                if selected and name not in selected:
+                    continue
+                for i in range(args.warmup):  #fills the upstream cache and search indexes
+                    await step(i)
+                results[name] = await run_scenario(step, args.requests, args.concurrency, counter)
+                print(f"{name}: {results[name]['throughput_rps']} req/s p50 {results[name]['p50_ms']}ms "
+                      f"p99 {results[name]['p99_ms']}ms {results[name]['queries_per_request']} queries/req",
+                      file=sys.stderr)
+    return results
+
+
+def main(argv=None) -> Dict:
+    parser = argparse.ArgumentParser(description="Benchmark the F1 API against a local upstream stub")
+    parser.add_argument("--scenarios", default="", help="comma separated, default all")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=5, help="untimed requests before each scenario")
+    parser.add_argument("--drivers", type=int, default=1000, help="drivers per season served by the stub")
+    parser.add_argument("--upstream-latency", type=float, default=0.0, help="seconds added to every stub response")
+    parser.add_argument("--agent-latency", type=float, default=0.05, help="seconds each stubbed LLM call takes")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    from bench.ergast_stub import StubServer
+
+    with tempfile.TemporaryDirectory() as tmp, StubServer(args.drivers, args.port, args.upstream_latency) as stub:
+        _configure_env(args, tmp, stub.base_url)
+        results = asyncio.run(_run(args))
+        report = {
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "config": {k: v for k, v in vars(args).items() if k != "out"},
+            "databases": {k: os.environ[k].split("://")[0] for k in ("LOCAL_DB_URL", "PG_DB_URL", "IMPORT_DB_URL")},
+            "scenarios": results,
+        }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+from fastapi import FastAPI, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.testclient import TestClient
+
+from app.conditional import COMPRESS_MIN_SIZE, ConditionalMiddleware, cache_headers
+
+STORED = 1600000000.0
+
+app = FastAPI()
+app.add_middleware(ConditionalMiddleware)
+app.add_middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_SIZE)
+
+
+@app.get("/big")
+def big(response: Response):
+    cache_headers(response, 2000, last_modified=STORED)
+    return {"rows": "x" * (2 * COMPRESS_MIN_SIZE)}
+
+
+@app.get("/small")
+def small(response: Response):
+    cache_headers(response, 2000)
+    return {"rows": "x"}
+
+
+client = TestClient(app)
+
+
+def test_etag_is_weak_when_compressed():
+    gzip = client.get("/big", headers={"accept-encoding": "gzip"})
+    identity = client.get("/big", headers={"accept-encoding": "identity"})
+    assert gzip.headers["content-encoding"] == "gzip"
+    assert gzip.headers["etag"] == "W/" + identity.headers["etag"]
+    assert not identity.headers["etag"].startswith("W/")
+    assert client.get("/small", headers={"accept-encoding": "gzip"}).headers["etag"].startswith('"')
+
+
+def test_weak_etag_revalidates():
+    tag = client.get("/big", headers={"accept-encoding": "gzip"}).headers["etag"]
+    for encoding in ("gzip", "identity"):
+        assert client.get("/big", headers={"accept-encoding": encoding, "if-none-match": tag}).status_code == 304
+
+
+def test_stored_last_modified():
+    response = client.get("/big")
+    assert response.headers["last-modified"] == "Sun, 13 Sep 2020 12:26:40 GMT"
+    assert client.get("/big", headers={"if-modified-since": response.headers["last-modified"]}).status_code == 304
+    assert client.get("/big", headers={"if-modified-since": "Sat, 12 Sep 2020 00:00:00 GMT"}).status_code == 200
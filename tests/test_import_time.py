@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+
+#cold start budget of `import app.main` in seconds, new workers only take traffic after it
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "3"))
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import app.main
+print(time.perf_counter() - start)
+print(",".join(m for m in ("google.adk", "pydantic_ai") if m in sys.modules))
+"""
+
+
+def test_import_app_main_is_cheap(tmp_path):
+    env = {**os.environ, "PYTHONPATH": ROOT,
+           "LOCAL_DB_URL": f"sqlite:///{tmp_path}/races.db", "PG_DB_URL": f"sqlite:///{tmp_path}/drivers.db",
+           "IMPORT_DB_URL": f"sqlite:///{tmp_path}/import.db"}
+    out = subprocess.run([sys.executable, "-c", SCRIPT], cwd=tmp_path, env=env, capture_output=True, text=True,
+                         check=True).stdout.splitlines()
+    elapsed, heavy = float(out[-2]), out[-1]
+    assert elapsed < IMPORT_TIME_BUDGET, f"import app.main took {elapsed:.2f}s"
+    assert heavy == "", f"agent stacks imported with app.main: {heavy}"
+    assert not os.listdir(tmp_path), "import app.main created database files"
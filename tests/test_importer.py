@@ -0,0 +1,58 @@
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import Session
+
+from app.database_pg_import import ImportBase
+from app.db_models_link_pg import Drivers_All, ImportProgress
+from app.importer import upsert_drivers, upsert_progress
+from app.migrations import IMPORT_DB_MIGRATIONS, run_migrations
+
+#the drivers table as the first importer created it, keyed on permanentNumber only
+OLD_SCHEMA = [
+    'CREATE TABLE drivers (id INTEGER PRIMARY KEY, season VARCHAR, "permanentNumber" VARCHAR, "givenName" VARCHAR, '
+    '"familyName" VARCHAR, code VARCHAR, nationality VARCHAR, "constructorId" VARCHAR)',
+    'CREATE TABLE constructors (id INTEGER PRIMARY KEY, season VARCHAR, "constructorId" VARCHAR, name VARCHAR, '
+    'nationality VARCHAR)',
+]
+
+
+def _driver(driver_id, number, code, family):
+    return {"driverId": driver_id, "permanentNumber": number, "code": code, "givenName": "G",
+            "familyName": family, "nationality": "X"}
+
+
+def test_reimport_on_upgraded_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/import.db")
+    with engine.begin() as conn:
+        for statement in OLD_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text('INSERT INTO drivers (season, "permanentNumber", "givenName", "familyName", code, '
+                          'nationality, "constructorId") VALUES (\'2020\', \'44\', \'G\', \'Hamilton\', \'HAM\', '
+                          '\'X\', \'mercedes\'), (\'2020\', \'33\', \'G\', \'Verstappen\', \'VER\', \'X\', NULL)'))
+    ImportBase.metadata.create_all(bind=engine)
+    run_migrations(engine, IMPORT_DB_MIGRATIONS)
+
+    season = [_driver("hamilton", "44", "HAM", "Hamilton"), _driver("max_verstappen", "33", "VER", "Verstappen"),
+              _driver("russell", "63", "RUS", "Russell")]
+    with Session(engine) as session:
+        assert upsert_drivers(session, "2020", season) == (1, 2)
+        session.commit()
+        assert upsert_drivers(session, "2020", season) == (0, 3)
+        session.commit()
+        rows = session.execute(select(Drivers_All.driverId, Drivers_All.permanentNumber, Drivers_All.constructorId)
+                               .order_by(Drivers_All.permanentNumber)).all()
+    assert rows == [("max_verstappen", "33", None), ("hamilton", "44", "mercedes"), ("russell", "63", None)]
+
+
+def test_upsert_progress_keeps_sync_state(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/import.db")
+    ImportBase.metadata.create_all(bind=engine)
+    with Session(engine) as session:
+        session.add(ImportProgress(resource="drivers", season="2020", next_offset=0, complete=False, last_round=3))
+        session.commit()
+        row = dict(resource="drivers", season="2020", next_offset=20, total=20, complete=True)
+        assert upsert_progress(session, [row]) == (0, 1)
+        assert upsert_progress(session, [{**row, "season": "2021"}]) == (1, 0)
+        session.commit()
+        rows = session.execute(select(ImportProgress.season, ImportProgress.total, ImportProgress.complete,
+                                      ImportProgress.last_round).order_by(ImportProgress.season)).all()
+    assert rows == [("2020", 20, True, 3), ("2021", 20, True, None)]
@@ -0,0 +1,68 @@
+from datetime import date
+
+import pytest
+
+from app.intent import route_query
+from app.search import _indexes, find_driver_id, get_index
+
+BASE = "http://ergast"
+
+
+@pytest.mark.parametrize("query", [
+    "who won the 2020 constructor championship",
+    "who won the 2020 constructors championship",
+    "2020 constructors' championship",
+])
+def test_constructor_championship(query):
+    assert route_query(query, BASE).endpoint == "constructorstanding"
+
+
+@pytest.mark.parametrize("query", ["driver championship 2020", "drivers championship 2020"])
+def test_driver_championship(query):
+    assert route_query(query, BASE).endpoint == "driverstanding"
+
+
+@pytest.mark.parametrize("query", [
+    "results of round 5 in 2019", "results of race 5 in 2019", "results of the 5th race in 2019",
+    "results of the 5th round in 2019", "rd 5 results 2019",
+])
+def test_round(query):
+    intent = route_query(query, BASE)
+    assert (intent.season, intent.round) == ("2019", "5")
+
+
+def test_current_season_driver_lookup():
+    year = date.today().year
+    get_index(str(year), [{"driverId": "zzpilot", "familyName": "Zzpilot", "givenName": "Test"}])
+    try:
+        assert find_driver_id("zzpilot results", "current") == "zzpilot"
+        assert route_query("zzpilot results this season", BASE).driverId == "zzpilot"
+    finally:
+        _indexes.delete(str(year))
+
+
+RACES = [{"round": "6", "raceName": "Monaco Grand Prix", "Circuit": {"circuitId": "monaco", "circuitName": "Circuit de Monaco"}},
+         {"round": "10", "raceName": "British Grand Prix", "Circuit": {"circuitId": "silverstone"}},
+         {"round": "21", "raceName": "Abu Dhabi Grand Prix", "Circuit": {"circuitId": "yas_marina"}}]
+
+
+@pytest.mark.parametrize("query, round_", [
+    ("who won the Monaco GP 2019", "6"), ("abu dhabi grand prix 2019 results", "21"),
+    ("results of the silverstone gp 2019", "10"),
+])
+def test_grand_prix_round(query, round_):
+    intent = route_query(query, BASE, RACES)
+    assert (intent.endpoint, intent.season, intent.round) == ("result", "2019", round_)
+
+
+def test_unknown_grand_prix_goes_to_the_agent():
+    assert route_query("who won the Narnia GP 2019", BASE, RACES) is None
+    assert route_query("who won the Monaco GP 2019", BASE) is None  #race list not available
+
+
+@pytest.mark.parametrize("query, endpoint", [
+    ("who was the 2009 champion", "driverstanding"), ("who won the 2009 title", "driverstanding"),
+    ("2009 world champion", "driverstanding"), ("who won the 2020 constructors title", "constructorstanding"),
+])
+def test_champion_questions(query, endpoint):
+    assert route_query(query, BASE).endpoint == endpoint
@@ -0,0 +1,34 @@
+from app.projection import project
+
+
+def _standings(n):
+    rows = [{"position": str(i + 1), "points": str(100 - i), "Driver": {"driverId": f"d{i}", "familyName": f"F{i}"},
+             "Constructors": [{"constructorId": f"c{i}", "name": f"C{i}"}]} for i in range(n)]
+    return {"MRData": {"StandingsTable": {"season": "2020", "StandingsLists": [{"season": "2020", "DriverStandings": rows}]}}}
+
+
+def _rows(payload):
+    return payload["MRData"]["StandingsTable"]["StandingsLists"][0]["DriverStandings"]
+
+
+def test_driver_standings_top_and_fields():
+    out = project(_standings(5), fields=["position", "Driver.familyName", "Constructors"], top=2)
+    assert _rows(out) == [
+        {"position": "1", "Driver": {"familyName": "F0"}, "Constructors": [{"constructorId": "c0", "name": "C0"}]},
+        {"position": "2", "Driver": {"familyName": "F1"}, "Constructors": [{"constructorId": "c1", "name": "C1"}]},
+    ]
+
+
+def test_driver_standings_driver_filter():
+    assert [r["Driver"]["driverId"] for r in _rows(project(_standings(5), driver="d3"))] == ["d3"]
+
+
+def test_results_nested_in_races():
+    races = [{"round": str(r), "Results": [{"position": str(p)} for p in range(1, 21)]} for r in range(1, 4)]
+    out = project({"MRData": {"RaceTable": {"Races": races}}}, top=3)
+    assert [len(r["Results"]) for r in out["MRData"]["RaceTable"]["Races"]] == [3, 3, 3]
+
+
+def test_race_list_is_trimmed():
+    races = [{"round": str(r), "raceName": f"GP {r}"} for r in range(1, 10)]
+    assert len(project({"MRData": {"RaceTable": {"Races": races}}}, top=4)["MRData"]["RaceTable"]["Races"]) == 4
@@ -0,0 +1,22 @@
+import asyncio
+
+from app import service
+from app.cache import driver_query_cache
+from app.pydantic_models import DriverQuery, DriverDBModel, DriverResult
+
+
+def test_direct_miss_does_not_answer_auto(monkeypatch):
+    async def no_rows(ctx, name=None, season=None, limit=50):
+        return []
+
+    async def agent(query):
+        return DriverResult(drivers=[DriverDBModel(driverId="1", givenName="Lewis", familyName="Hamilton",
+                                                   nationality="British")])
+
+    monkeypatch.setattr(service, "get_drivers", no_rows)
+    monkeypatch.setattr(service, "query_driver_agent", agent)
+    driver_query_cache.invalidate("1999")
+    direct = asyncio.run(service.query_driver_data(DriverQuery(name="hamiltn", season="1999", mode="direct")))
+    auto = asyncio.run(service.query_driver_data(DriverQuery(name="hamiltn", season="1999", mode="auto")))
+    assert direct.drivers == []
+    assert [d.familyName for d in auto.drivers] == ["Hamilton"]
@@ -0,0 +1,18 @@
+import pytest
+
+from app.standings import is_career_query
+
+
+@pytest.mark.parametrize("query", [
+    "hamilton career wins", "all-time points of ferrari", "all time championships schumacher",
+    "how many career titles does alonso have",
+])
+def test_career_query(query):
+    assert is_career_query(query)
+
+
+@pytest.mark.parametrize("query", [
+    "total pit stops 2021", "points in total 2020", "hamilton career", "driver standings 2021",
+])
+def test_not_career_query(query):
+    assert not is_career_query(query)
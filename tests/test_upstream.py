@@ -0,0 +1,28 @@
+import asyncio
+import time
+
+from app import upstream
+
+
+def test_token_bucket_waits_when_empty():
+    async def run():
+        bucket = upstream.TokenBucket(rate=20, capacity=2)
+        start = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.04
+
+
+def test_hourly_budget_bucket():
+    async def run():
+        upstream.get_client()
+        try:
+            return upstream._hourly
+        finally:
+            await upstream.close_client()
+
+    hourly = asyncio.run(run())
+    assert hourly.capacity == upstream.UPSTREAM_HOURLY
+    assert abs(hourly.rate * 3600 - upstream.UPSTREAM_HOURLY) < 1e-6